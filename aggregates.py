@@ -0,0 +1,249 @@
+import math
+import os
+import stat
+from array import array
+from itertools import islice
+from typing import Any, Iterator, Optional, Sequence
+from toolregistry import Number, Numbers, tool
+
+try:
+    import numpy as np
+except ImportError:  # Without NumPy, chunks are plain lists and float arrays
+    np = None
+
+# Values per chunk: large enough to amortize per-chunk overhead, small enough to stay in cache-sized memory
+DEFAULT_CHUNK_SIZE = 1 << 16
+# Bytes of CSV text parsed at a time
+CSV_BLOCK_SIZE = 1 << 20
+# Directory that file names given as strings (e.g. in an LLM's plan) are looked up in.
+# None, the default, means strings are never opened; Python callers can pass an os.PathLike.
+DATA_DIR: Optional[str] = None
+
+
+def data_file(name: str) -> str:
+    """
+    Resolves a file name from an untrusted source inside DATA_DIR. Raises
+    ValueError when no DATA_DIR is configured or the name (after following
+    symlinks) leaves it or isn't a regular file.
+    """
+    if DATA_DIR is None:
+        raise ValueError(f"Not a list of numbers: {name!r} (no data directory to read files from)")
+    root = os.path.realpath(DATA_DIR)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError(f"{name!r} is outside the data directory")
+    return _regular_file(path)
+
+
+def _regular_file(path: str) -> str:
+    # Devices and pipes (e.g. /dev/zero) never end
+    try:
+        regular = stat.S_ISREG(os.stat(path).st_mode)
+    except OSError:
+        raise ValueError(f"No such file: {path}")
+    if not regular:
+        raise ValueError(f"Not a regular file: {path}")
+    return path
+
+
+def iter_chunks(source: Any, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Sequence]:
+    """
+    Yields the numbers of `source` in chunks of at most chunk_size values.
+    `source` may be a list or tuple, a NumPy array (including np.memmap; only
+    the current chunk is paged in), any iterable, or a file path:
+      - *.npy: memory-mapped with np.load(mmap_mode="r"),
+      - *.csv / *.txt: numbers separated by commas, whitespace or newlines,
+      - anything else: raw native-endian float64 values.
+    """
+    if isinstance(source, str):
+        yield from _file_chunks(data_file(source), chunk_size)
+    elif isinstance(source, os.PathLike):
+        yield from _file_chunks(_regular_file(os.fspath(source)), chunk_size)
+    elif np is not None and isinstance(source, np.ndarray):
+        flat = source.reshape(-1)  # A view for contiguous arrays and memmaps
+        for start in range(0, len(flat), chunk_size):
+            yield flat[start:start + chunk_size]
+    elif isinstance(source, (list, tuple, range)):
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start + chunk_size]
+    else:
+        values = iter(source)
+        while True:
+            chunk = list(islice(values, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+
+def _file_chunks(path: str, chunk_size: int) -> Iterator[Sequence]:
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        if np is None:
+            raise ValueError("Reading .npy files needs NumPy")
+        yield from iter_chunks(np.load(path, mmap_mode="r"), chunk_size)
+    elif extension in (".csv", ".txt"):
+        yield from _text_chunks(path)
+    else:
+        with open(path, "rb") as f:
+            while True:
+                if np is not None:
+                    chunk = np.fromfile(f, dtype=np.float64, count=chunk_size)
+                else:
+                    chunk = array("d")
+                    data = f.read(chunk_size * chunk.itemsize)
+                    chunk.frombytes(data[:len(data) - len(data) % chunk.itemsize])
+                if not len(chunk):
+                    return
+                yield chunk
+
+
+def _text_chunks(path: str) -> Iterator[Sequence]:
+    with open(path, "r") as f:
+        rest = ""
+        while True:
+            block = f.read(CSV_BLOCK_SIZE)
+            text = rest + block
+            if block:
+                # A number may continue in the next block; keep the last partial line
+                cut = text.rfind("\n") + 1
+                text, rest = text[:cut], text[cut:]
+            tokens = text.replace(",", " ").split()
+            if tokens:
+                try:
+                    yield np.array(tokens, dtype=np.float64) if np is not None else [float(t) for t in tokens]
+                except ValueError:
+                    raise ValueError(f"Non-numeric value in {path}")
+            if not block:
+                return
+
+
+class RunningStats:
+    """
+    Count, sum, mean, variance, min and max of a stream of numbers, updated one
+    chunk at a time so memory doesn't grow with the input:
+      - integer sums are exact; float chunks are summed pairwise (NumPy) or with
+        math.fsum, and chunk sums are added with Neumaier compensation,
+      - variance merges per-chunk means and squared deviations (Chan et al.),
+        which avoids the cancellation of the sum-of-squares formula.
+    """
+    def __init__(self):
+        self.count = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self._int_total = 0  # Exact sum of integer chunks
+        self._float_total = 0.0
+        self._compensation = 0.0  # Low-order bits lost from _float_total
+        self._mean = 0.0
+        self._m2 = 0.0  # Sum of squared deviations from the mean
+
+    def add(self, chunk: Sequence):
+        n = len(chunk)
+        if not n:
+            return
+        if np is not None and isinstance(chunk, np.ndarray):
+            int_total, float_total, values = self._array_sums(chunk)
+            mean = (int_total + float_total) / n
+            m2 = float(np.square(values - mean).sum())
+            lo, hi = chunk.min().item(), chunk.max().item()
+        else:
+            if all(type(x) is int for x in chunk):
+                int_total, float_total = sum(chunk), 0.0
+            else:
+                int_total, float_total = 0, math.fsum(chunk)
+            mean = (int_total + float_total) / n
+            m2 = math.fsum((x - mean) ** 2 for x in chunk)
+            lo, hi = min(chunk), max(chunk)
+
+        self._int_total += int_total
+        self._add_float(float_total)
+        total = self.count + n
+        delta = mean - self._mean
+        self._mean += delta * n / total
+        self._m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.min = lo if self.min is None else min(self.min, lo)
+        self.max = hi if self.max is None else max(self.max, hi)
+
+    @staticmethod
+    def _array_sums(chunk):
+        """(exact integer sum, float sum, values as float64) of an array chunk."""
+        if chunk.dtype.kind in "biu":
+            values = chunk.astype(np.float64)
+            # int64 sums are exact while they can't overflow; otherwise sum as Python ints
+            bound = max(abs(int(chunk.min())), abs(int(chunk.max())))
+            exact = int(chunk.sum(dtype=np.int64)) if bound * len(chunk) < 2 ** 63 else sum(chunk.tolist())
+            return exact, 0.0, values
+        values = chunk.astype(np.float64, copy=False)
+        return 0, float(values.sum()), values  # NumPy sums float arrays pairwise
+
+    def _add_float(self, value: float):
+        # Neumaier's variant of Kahan summation, also exact when value > total
+        total = self._float_total + value
+        if abs(self._float_total) >= abs(value):
+            self._compensation += (self._float_total - total) + value
+        else:
+            self._compensation += (value - total) + self._float_total
+        self._float_total = total
+
+    @property
+    def total(self):
+        if not self._float_total and not self._compensation:
+            return self._int_total
+        return self._int_total + (self._float_total + self._compensation)
+
+    @property
+    def mean(self) -> float:
+        if not self.count:
+            raise ValueError("Empty list")
+        return self.total / self.count
+
+    @property
+    def variance(self) -> float:
+        """Population variance."""
+        if not self.count:
+            raise ValueError("Empty list")
+        return self._m2 / self.count
+
+
+def summarize(source: Any, chunk_size: int = DEFAULT_CHUNK_SIZE) -> RunningStats:
+    """Single pass over `source` (see iter_chunks) collecting RunningStats."""
+    stats = RunningStats()
+    for chunk in iter_chunks(source, chunk_size):
+        stats.add(chunk)
+    return stats
+
+
+def _exact_sum(values: Sequence):
+    return sum(values) if all(type(x) is int for x in values) else math.fsum(values)
+
+
+def total(source: Any, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Sum of `source`; lists and tuples already in memory are summed directly."""
+    if isinstance(source, (list, tuple)):
+        return _exact_sum(source)
+    return summarize(source, chunk_size).total
+
+
+def mean(source: Any, chunk_size: int = DEFAULT_CHUNK_SIZE) -> float:
+    if isinstance(source, (list, tuple)):
+        if not source:
+            raise ValueError("Empty list")
+        return _exact_sum(source) / len(source)
+    return summarize(source, chunk_size).mean
+
+
+def _nonempty(stats: RunningStats) -> RunningStats:
+    if not stats.count:
+        raise ValueError("Empty list")
+    return stats
+
+
+# The aggregate tools; toolbox.py registers this module lazily by their names
+@tool(cost="linear")
+def AVG(numbers: Numbers) -> Number: return mean(numbers)
+@tool(cost="linear")
+def MIN(numbers: Numbers) -> Number: return _nonempty(summarize(numbers)).min
+@tool(cost="linear")
+def MAX(numbers: Numbers) -> Number: return _nonempty(summarize(numbers)).max
+@tool(cost="linear")
+def VARIANCE(numbers: Numbers) -> Number: return summarize(numbers).variance
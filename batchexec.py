@@ -0,0 +1,275 @@
+from collections import defaultdict
+from typing import List, Dict, Any, Optional, Tuple
+from metrics import NULL_METRICS, NullMetrics
+from plandag import validate_plan, step_dependencies, resolve_args
+
+try:
+    import numpy as np
+except ImportError:  # Without NumPy every step takes the scalar path
+    np = None
+
+# Integers are vectorized as int64 only while results stay well inside its range
+INT_LIMIT = 2 ** 62
+_KINDS = {int: "i", float: "f"}
+
+
+def _kind(value: Any) -> Optional[str]:
+    kind = _KINDS.get(type(value))  # Exact type check also rules out bool
+    if kind == "i" and not -INT_LIMIT < value < INT_LIMIT:
+        return None
+    return kind
+
+
+def _too_big(estimate):
+    with np.errstate(all="ignore"):
+        return ~np.isfinite(estimate) | (np.abs(estimate) >= INT_LIMIT)
+
+
+# Each op takes the argument columns and the group's kinds and returns
+# (results, mask of elements to redo on the scalar path, [(error mask, message)]).
+def _sum(cols, kinds):
+    a, b = cols
+    with np.errstate(all="ignore"):
+        fallback = _too_big(a.astype(float) + b) if kinds == ("i", "i") else ~np.isfinite(a + b)
+        return a + b, fallback, []
+
+
+def _product(cols, kinds):
+    a, b = cols
+    with np.errstate(all="ignore"):
+        fallback = _too_big(a.astype(float) * b) if kinds == ("i", "i") else ~np.isfinite(a * b)
+        return a * b, fallback, []
+
+
+def _quotient(cols, kinds):
+    a, b = cols
+    zero = b == 0
+    # Python divides ints exactly before rounding; beyond 2**53 the float conversion could differ
+    inexact = np.zeros(len(a), dtype=bool)
+    for col, kind in zip(cols, kinds):
+        if kind == "i":
+            inexact |= np.abs(col) > 2 ** 53
+    with np.errstate(all="ignore"):
+        return a / np.where(zero, 1, b), inexact, [(zero, "Division by zero")]
+
+
+def _power(cols, kinds):
+    a, b = cols
+    if kinds != ("i", "i"):
+        # NumPy's float pow may differ from Python's in the last ulp, which would flip validation
+        return a, np.ones(len(a), dtype=bool), []
+    with np.errstate(all="ignore"):
+        estimate = np.power(a.astype(float), b.astype(float))
+        # Negative exponents give floats in Python; large results need exact big ints
+        fallback = (b < 0) | _too_big(estimate)
+        return np.power(a, np.where(fallback, 0, b)), fallback, []
+
+
+def _sqrt(cols, kinds):
+    (a,) = cols
+    negative = a < 0
+    return np.sqrt(np.where(negative, 0, a).astype(float)), np.zeros(len(a), dtype=bool), [(negative, "Negative sqrt")]
+
+
+def _round(cols, kinds):
+    (a,) = cols
+    if kinds == ("i",):
+        return a, np.zeros(len(a), dtype=bool), []
+    # np.rint rounds half to even like round(); infinities and NaN raise in Python
+    return np.rint(a), _too_big(a), []
+
+
+def _modulo(cols, kinds):
+    a, b = cols
+    zero = b == 0
+    with np.errstate(all="ignore"):
+        return np.mod(a, np.where(zero, 1, b)), np.zeros(len(a), dtype=bool), [(zero, "Division by zero")]
+
+
+def _abs(cols, kinds):
+    (a,) = cols
+    return np.abs(a), np.zeros(len(a), dtype=bool), []
+
+
+VECTOR_OPS = {
+    "SUM": _sum,
+    "PRODUCT": _product,
+    "QUOTIENT": _quotient,
+    "POWER": _power,
+    "SQRT": _sqrt,
+    "ROUND": _round,
+    "MODULO": _modulo,
+    "ABS": _abs,
+}
+
+
+class BatchExecutor:
+    """
+    Executes many plans at once. Steps are grouped by tool and argument types
+    across the batch and each group is evaluated as one NumPy operation. Lists,
+    big ints beyond int64, unreliable tools and results where NumPy and Python
+    semantics differ go through the scalar tools instead. A failing element
+    only fails its own plan: its slot in the result list holds the exception.
+    """
+    def __init__(self, toolbox, min_vector_size: int = 64, metrics: Optional[NullMetrics] = None):
+        self.toolbox = toolbox
+        self.metrics = metrics if metrics is not None else NULL_METRICS  # Scalar calls are counted by the toolbox
+        self.min_vector_size = min_vector_size  # Smaller groups don't amortize building the arrays
+        self.vectorized = 0
+        self.scalar = 0
+
+    def execute_many(self, plans: List[List[Dict[str, Any]]]) -> List[Any]:
+        outcomes: List[Any] = [None] * len(plans)
+        results: List[Dict[int, Any]] = [{} for _ in plans]
+        multi_step: Dict[int, Dict[int, List[int]]] = {}  # plan index -> level -> step indices
+        groups = defaultdict(list)
+
+        def plan_general(p: int):
+            plan = plans[p]
+            try:
+                order = validate_plan(plan)
+            except ValueError as e:
+                outcomes[p] = e
+                return
+            deps = step_dependencies(plan)
+            depth: Dict[int, int] = {}
+            by_level: Dict[int, List[int]] = defaultdict(list)
+            for i in order:
+                depth[i] = 1 + max((depth[d] for d in deps[i]), default=-1)
+                by_level[depth[i]].append(i)
+            # Steps on level 0 depend on nothing, so there are no references to resolve
+            for i in by_level.pop(0):
+                self._group(groups, p, i, plan[i]["tool"], plan[i]["args"])
+            if by_level:
+                multi_step[p] = by_level
+
+        # Single-step plans (the common cache hit) are grouped by tool alone; their
+        # argument types are then checked per column by NumPy instead of per value.
+        by_tool: Dict[str, List[Tuple[int, int, List[Any]]]] = defaultdict(list)
+        vector_ops = VECTOR_OPS if np is not None else {}
+        for p, plan in enumerate(plans):
+            if len(plan) == 1 and type(plan[0]) is dict and plan[0].get("tool") in vector_ops \
+                    and type(plan[0].get("args")) is list:
+                by_tool[plan[0]["tool"]].append((p, 0, plan[0]["args"]))
+            else:
+                plan_general(p)
+        for tool_name, members in by_tool.items():
+            columns = self._columns(members) if len(members) >= self.min_vector_size else None
+            if columns is not None:
+                self._run_vector((tool_name,) + columns, members, results, outcomes)
+                continue
+            for p, i, args in members:
+                if any(isinstance(a, (str, list)) for a in args):
+                    plan_general(p)  # May hold step references that need validating
+                else:
+                    self._group(groups, p, i, tool_name, args)
+
+        level = 0
+        while groups:
+            for key, members in groups.items():
+                if key is None:
+                    for p, i, args in members:
+                        self._run_scalar(plans[p][i]["tool"], p, i, args, results, outcomes)
+                else:
+                    self._run_vector(key, members, results, outcomes)
+            level += 1
+            groups = defaultdict(list)
+            for p, by_level in multi_step.items():
+                if outcomes[p] is None:
+                    for i in by_level.get(level, ()):
+                        self._group(groups, p, i, plans[p][i]["tool"], resolve_args(plans[p][i]["args"], results[p]))
+
+        for p, plan in enumerate(plans):
+            if outcomes[p] is None:
+                outcomes[p] = results[p][len(plan) - 1]
+        return outcomes
+
+    @staticmethod
+    def _columns(members):
+        """
+        Builds typed argument columns for a whole group at once, or returns None
+        when the group mixes arities or value types and has to be split per value.
+        Returns (kinds, columns, mask of ints too large for int64 arithmetic).
+        """
+        arity = len(members[0][2])
+        if any(len(args) != arity for _, _, args in members):
+            return None
+        kinds, cols = [], []
+        out_of_range = np.zeros(len(members), dtype=bool)
+        for k in range(arity):
+            values = [args[k] for _, _, args in members]
+            try:
+                col = np.array(values)
+            except (ValueError, TypeError, OverflowError):
+                return None
+            if col.ndim != 1:  # List arguments (e.g. SUM of a list) make a 2-D array
+                return None
+            if col.dtype == np.int64:  # Only ints (and bools, which behave as ints here)
+                out_of_range |= np.abs(col) >= INT_LIMIT  # np.abs(-2**63) wraps negative, caught below
+                out_of_range |= col < -INT_LIMIT
+                kinds.append("i")
+            elif col.dtype == np.float64 and all(type(v) is float for v in values):
+                kinds.append("f")
+            else:  # Mixed ints and floats, strings, huge ints, ...
+                return None
+            cols.append(col)
+        return tuple(kinds), cols, out_of_range
+
+    @staticmethod
+    def _group(groups, p: int, i: int, tool_name: str, args: List[Any]):
+        kinds = tuple(map(_kind, args))
+        vectorizable = np is not None and tool_name in VECTOR_OPS and None not in kinds
+        groups[(tool_name, kinds) if vectorizable else None].append((p, i, args))
+
+    def _run_scalar(self, tool_name, p, i, args, results, outcomes):
+        self.scalar += 1
+        try:
+            results[p][i] = self.toolbox.get_tool(tool_name)(*args)
+        except Exception as e:
+            outcomes[p] = e
+
+    def _run_vector(self, key, members, results, outcomes):
+        tool_name, kinds = key[0], key[1]
+        if len(members) < self.min_vector_size:
+            for p, i, args in members:
+                self._run_scalar(tool_name, p, i, args, results, outcomes)
+            return
+        try:
+            values, fallback, errors, out_of_range = self._evaluate(key, members)
+        except Exception:
+            # Arguments the vector op can't handle; the scalar tools fail (or answer) each member on its own
+            for p, i, args in members:
+                self._run_scalar(tool_name, p, i, args, results, outcomes)
+            return
+        for (p, i, _), value in zip(members, values.tolist()):
+            results[p][i] = value
+        failed = np.zeros(len(members), dtype=bool)
+        for mask, message in errors:
+            mask = mask & ~out_of_range
+            for j in np.flatnonzero(mask & ~failed).tolist():
+                outcomes[members[j][0]] = ValueError(message)
+            failed |= mask
+        redo = np.flatnonzero(fallback & ~failed).tolist()
+        for j in redo:
+            p, i, args = members[j]
+            self._run_scalar(tool_name, p, i, args, results, outcomes)
+        self.vectorized += len(members) - len(redo) - int(failed.sum())
+        self.metrics.count("tool_calls", len(members) - len(redo), tool=tool_name)
+
+    @staticmethod
+    def _evaluate(key, members):
+        tool_name, kinds = key[0], key[1]
+        if len(key) == 4:  # Columns already built by _columns
+            cols, out_of_range = key[2], key[3]
+        else:
+            cols = [np.array([args[k] for _, _, args in members], dtype=np.int64 if kind == "i" else np.float64)
+                    for k, kind in enumerate(kinds)]
+            out_of_range = np.zeros(len(members), dtype=bool)
+        if out_of_range.any():
+            # Keep wrapped values out of the vector op; those elements are redone as scalars
+            cols = [np.where(out_of_range, 1, col) if kind == "i" else col for col, kind in zip(cols, kinds)]
+        values, fallback, errors = VECTOR_OPS[tool_name](cols, kinds)
+        if tool_name == "ROUND":
+            with np.errstate(all="ignore"):
+                values = values.astype(np.int64)  # round() returns ints; _round already sent huge values to fallback
+        return values, fallback | out_of_range, errors, out_of_range
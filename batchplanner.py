@@ -0,0 +1,86 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from metrics import NULL_METRICS, NullMetrics
+
+
+class MicroBatchPlanner:
+    """
+    Packs concurrent planner requests into one prompt. The first caller to
+    arrive opens a batch and waits up to max_wait seconds for others (or until
+    max_batch problems are waiting), then sends them all with
+    PlannerAgent.plan_batch and hands each caller its own plan. Problems the
+    batched response has no well-formed plan for, and whole batches whose
+    request fails, are planned individually by their callers.
+
+    Has the same plan / plan_stream interface as PlannerAgent.
+    """
+    def __init__(self, planner, max_batch: int = 16, max_wait: float = 0.02, metrics: Optional[NullMetrics] = None):
+        self.planner = planner
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.batches = 0
+        self.batched = 0  # Problems sent in a batched request
+        self.retried = 0  # Of those, problems that fell back to an individual request
+        self._cond = threading.Condition()
+        self._open: Optional[List[Tuple[str, Future]]] = None  # Batch still accepting problems
+
+    def plan(self, problem: str) -> List[Dict[str, Any]]:
+        return list(self.plan_stream(problem))
+
+    def plan_stream(self, problem: str) -> Iterator[Dict[str, Any]]:
+        plan = self._batched_plan(problem)
+        if plan is None:
+            yield from self.planner.plan_stream(problem)
+        else:
+            yield from plan
+
+    def _batched_plan(self, problem: str) -> Optional[List[Dict[str, Any]]]:
+        future: Future = Future()
+        with self._cond:
+            leader = self._open is None
+            if leader:
+                self._open = batch = []
+            self._open.append((problem, future))
+            if len(self._open) >= self.max_batch:
+                self._open = None  # Full: later callers start a new batch
+                self._cond.notify_all()
+        if leader:
+            self._dispatch(batch)
+        return future.result()
+
+    def _dispatch(self, batch: List[Tuple[str, Future]]):
+        deadline = time.monotonic() + self.max_wait
+        with self._cond:
+            while self._open is batch and (remaining := deadline - time.monotonic()) > 0:
+                self._cond.wait(remaining)
+            if self._open is batch:
+                self._open = None
+        if len(batch) == 1:
+            batch[0][1].set_result(None)  # Nobody joined; the plain prompt is shorter
+            return
+        try:
+            with self.metrics.span("plan_batch"):
+                plans = self.planner.plan_batch([problem for problem, _ in batch])
+        except Exception:
+            plans = [None] * len(batch)
+        retried = sum(plan is None for plan in plans)
+        with self._cond:
+            self.batches += 1
+            self.batched += len(batch)
+            self.retried += retried
+        self.metrics.observe("planner_batch_size", len(batch))
+        self.metrics.count("planner_retries", retried)
+        for (_, future), plan in zip(batch, plans):
+            future.set_result(plan)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "batches": self.batches,
+                "batched": self.batched,
+                "retried": self.retried,
+                "mean_batch_size": self.batched / self.batches if self.batches else 0.0,
+            }
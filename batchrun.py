@@ -0,0 +1,140 @@
+"""
+Streams problems from a JSONL file through MultiAgentSystem and writes one
+result line per input line.
+
+    python batchrun.py problems.jsonl results.jsonl --parallelism 16
+
+Input lines look like {"problem": "What is the sum of 5 and 3?", "expected": 8}
+("expected_output" is accepted too). Output lines are
+{"line": 0, "problem": ..., "result": 8} or {"line": 0, "problem": ..., "error": ...}
+in input order.
+
+Lines are read and solved in chunks, so memory stays constant however long the
+file is. After every chunk the output is flushed and a checkpoint
+(results.jsonl.checkpoint) records how far the input has been consumed; running
+the same command again after an interruption truncates any partially written
+chunk and resumes from there. Pass --restart to start over.
+"""
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from metrics import LatencyHistogram, Metrics
+
+
+def _parse(line: str) -> Tuple[Optional[str], Any, Optional[str]]:
+    """Returns (problem, expected output, error)."""
+    try:
+        record = json.loads(line)
+        problem = record["problem"]
+        expected = record["expected"] if "expected" in record else record["expected_output"]
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        return None, None, f"Invalid input line: {e}"
+    if not isinstance(problem, str):
+        return None, None, "Invalid input line: problem must be a string"
+    return problem, expected, None
+
+
+def _read_checkpoint(checkpoint_file: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(checkpoint_file, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_checkpoint(checkpoint_file: str, state: Dict[str, Any]):
+    tmp_file = f"{checkpoint_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_file, checkpoint_file)
+
+
+def run_batch(system, input_file: str, output_file: str, chunk_size: int = 1000, max_concurrency: int = 8,
+              checkpoint_file: Optional[str] = None, restart: bool = False) -> Dict[str, Any]:
+    """Processes input_file into output_file, resuming from the checkpoint unless restart is set."""
+    checkpoint_file = checkpoint_file or output_file + ".checkpoint"
+    state = None if restart else _read_checkpoint(checkpoint_file)
+    if state is None:
+        state = {"input_offset": 0, "output_offset": 0, "lines": 0, "solved": 0, "failed": 0}
+    latency = LatencyHistogram()
+    processed = 0
+    start = time.perf_counter()
+
+    with open(input_file, "rb") as source, open(output_file, "ab") as sink:
+        # Drop output written after the last checkpoint; that chunk is redone
+        sink.truncate(state["output_offset"])
+        source.seek(state["input_offset"])
+        while True:
+            lines: List[bytes] = []
+            while len(lines) < chunk_size:
+                line = source.readline()
+                if not line:
+                    break
+                if line.strip():
+                    lines.append(line)
+            if not lines:
+                break
+
+            parsed = [_parse(line.decode("utf-8", errors="replace")) for line in lines]
+            cases = [(problem, expected) for problem, expected, error in parsed if error is None]
+            chunk_latencies: List[float] = []
+            solved = iter(system.solve_many(cases, max_concurrency, chunk_latencies) if cases else [])
+            for seconds in chunk_latencies:
+                latency.record(seconds)
+
+            out = []
+            for problem, _, error in parsed:
+                result = {"error": error} if error is not None else next(solved)
+                out.append(json.dumps({"line": state["lines"], "problem": problem, **result}, default=str))
+                state["lines"] += 1
+                state["solved" if "result" in result else "failed"] += 1
+            sink.write(("\n".join(out) + "\n").encode())
+            sink.flush()
+            processed += len(lines)
+
+            state["input_offset"] = source.tell()
+            state["output_offset"] = sink.tell()
+            _write_checkpoint(checkpoint_file, state)
+
+    elapsed = time.perf_counter() - start
+    return {**state, "processed": processed, "seconds": elapsed,
+            "throughput": processed / elapsed if elapsed else 0.0, "latency": latency.summary()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve a JSONL file of problems with MultiAgentSystem.")
+    parser.add_argument("input", help="JSONL with one {\"problem\": ..., \"expected\": ...} per line")
+    parser.add_argument("output", help="JSONL results, appended to when resuming")
+    parser.add_argument("--parallelism", type=int, default=8, help="Problems solved concurrently")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Lines read, solved and checkpointed together")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: OUTPUT.checkpoint)")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--cache-backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--metrics-out", help="Write metrics here at the end; Prometheus text for *.prom, else JSON")
+    args = parser.parse_args()
+
+    from main2 import MultiAgentSystem, setup_api_key  # Deferred so --help works without the API dependencies
+    setup_api_key()
+    metrics = Metrics() if args.metrics_out else None
+    system = MultiAgentSystem(cache_backend=args.cache_backend, metrics=metrics)
+    summary = run_batch(system, args.input, args.output, args.chunk_size, args.parallelism,
+                        args.checkpoint, args.restart)
+    if metrics is not None:
+        with open(args.metrics_out, "w") as f:
+            if args.metrics_out.endswith(".prom"):
+                f.write(metrics.to_prometheus())
+            else:
+                json.dump(metrics.to_json(), f, indent=2)
+
+    latency = summary["latency"]
+    print(f"Processed {summary['processed']:,} lines in {summary['seconds']:.1f}s "
+          f"({summary['throughput']:,.1f} lines/s); {summary['lines']:,} total, "
+          f"{summary['solved']:,} solved, {summary['failed']:,} failed")
+    print("Latency: " + ", ".join(f"{name} {latency[name] * 1000:.2f} ms"
+                                  for name in ("mean", "p50", "p90", "p99", "p99.9", "max")))
+
+
+if __name__ == "__main__":
+    main()
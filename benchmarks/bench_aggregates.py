@@ -0,0 +1,72 @@
+"""
+Time and peak memory of the streaming aggregates (aggregates.py) over a large
+binary file, against loading the whole file first:
+
+    python benchmarks/bench_aggregates.py --elements 100000000   # An 800 MB file
+    python benchmarks/bench_aggregates.py --elements 10000000 --naive
+
+Peak memory is what tracemalloc sees allocated (Python objects and NumPy
+buffers), so page cache and memory-mapped file pages don't count. The
+streaming pass should stay at a few chunk-sized buffers whatever the size;
+--naive (np.fromfile + np.mean/np.var) needs the whole file in memory.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from aggregates import DEFAULT_CHUNK_SIZE, summarize
+
+
+def write_values(path: str, elements: int, seed: int):
+    """Normal values around 1e6, written chunk by chunk as raw float64."""
+    rng = np.random.default_rng(seed)
+    with open(path, "wb") as f:
+        for start in range(0, elements, DEFAULT_CHUNK_SIZE * 16):
+            rng.normal(1e6, 1.0, min(DEFAULT_CHUNK_SIZE * 16, elements - start)).tofile(f)
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--elements", type=int, default=100_000_000)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--naive", action="store_true", help="Also load the whole file and reduce it in memory")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "values.f64")
+        write_values(path, args.elements, args.seed)
+        print(f"{args.elements:,} float64 values, {os.path.getsize(path) / 2 ** 20:,.0f} MB file, "
+              f"chunks of {args.chunk_size:,}")
+        print(f"{'method':<10} {'seconds':>8} {'values/s':>14} {'peak MB':>9} {'mean':>20} {'variance':>12}")
+
+        stats, elapsed, peak = measure(lambda: summarize(path, args.chunk_size))
+        print(f"{'streaming':<10} {elapsed:>8.2f} {args.elements / elapsed:>14,.0f} {peak / 2 ** 20:>9.1f} "
+              f"{stats.mean:>20.10f} {stats.variance:>12.8f}")
+
+        if args.naive:
+            def naive():
+                values = np.fromfile(path, dtype=np.float64)
+                return float(np.mean(values)), float(np.var(values))
+            (mean, variance), elapsed, peak = measure(naive)
+            print(f"{'naive':<10} {elapsed:>8.2f} {args.elements / elapsed:>14,.0f} {peak / 2 ** 20:>9.1f} "
+                  f"{mean:>20.10f} {variance:>12.8f}")
+
+
+if __name__ == "__main__":
+    main()
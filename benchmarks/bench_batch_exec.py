@@ -0,0 +1,76 @@
+"""
+Cache-hit execution throughput for a batch of single-step plans:
+  - execute: one get_tool lookup and call per problem, as ExecutorAgent.execute does,
+  - compiled: one compiled plan call per problem (the cached-plan path in solve),
+  - batch:    BatchExecutor grouping the steps into NumPy operations.
+
+    python benchmarks/bench_batch_exec.py --problems 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from batchexec import BatchExecutor
+from plandag import compile_plan
+from toolbox import MathToolbox
+
+SHAPES = [("SUM", 2), ("PRODUCT", 2), ("QUOTIENT", 2), ("POWER", 2), ("SQRT", 1), ("MODULO", 2), ("ABS", 1)]
+
+
+def make_plans(n: int):
+    rng = random.Random(0)
+    plans = []
+    for _ in range(n):
+        tool, arity = rng.choice(SHAPES)
+        args = [rng.randint(1, 1000)] + [rng.randint(1, 5 if tool == "POWER" else 1000) for _ in range(arity - 1)]
+        plans.append([{"tool": tool, "args": args}])
+    return plans
+
+
+def run_execute(plans, toolbox):
+    results = []
+    for plan in plans:
+        try:
+            results.append(toolbox.get_tool(plan[0]["tool"])(*plan[0]["args"]))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def run_compiled(plans, toolbox):
+    compiled = {}
+    results = []
+    for plan in plans:
+        tool, args = plan[0]["tool"], plan[0]["args"]
+        if tool not in compiled:
+            compiled[tool] = compile_plan([{"tool": tool, "args": [f"${i}" for i in range(len(args))]}], toolbox)
+        results.append(compiled[tool](args))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--problems", type=int, default=100_000)
+    args = parser.parse_args()
+
+    toolbox = MathToolbox()
+    plans = make_plans(args.problems)
+    executor = BatchExecutor(toolbox)
+    expected = None
+    for name, run in (("execute", lambda: run_execute(plans, toolbox)),
+                      ("compiled", lambda: run_compiled(plans, toolbox)),
+                      ("batch", lambda: executor.execute_many(plans))):
+        start = time.perf_counter()
+        results = run()
+        elapsed = time.perf_counter() - start
+        expected = expected or results
+        assert results == expected, name
+        print(f"{name:>9}: {elapsed:.3f}s ({args.problems / elapsed:,.0f} plans/s)")
+    print(f"batch steps: {executor.vectorized} vectorized / {executor.scalar} scalar")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Insert throughput of VirtualToolCache: append-only log vs. the previous
+full-file rewrite on every insert.
+
+    python benchmarks/bench_cache_insert.py --sizes 10000 1000000
+
+The rewrite strategy is O(N) per insert, so it is only run up to --legacy-max
+entries by default; larger sizes would take hours.
+"""
+import argparse
+import os
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from virtualtoolcache import VirtualToolCache
+
+
+class RewriteCache(VirtualToolCache):
+    """The pre-log behaviour: re-serialize the whole cache on every insert."""
+    def add_virtual_tool(self, problem, tool_sequence):
+        if not self.exists(problem):
+            self._insert(problem, tool_sequence)
+            self.save_cache()
+
+
+def problem_text(i: int) -> str:
+    # Digit-free keys so every insert is a distinct exact entry rather than one template
+    letters = []
+    while True:
+        i, r = divmod(i, 26)
+        letters.append(string.ascii_lowercase[r])
+        if i == 0:
+            break
+    return f"What is problem {''.join(letters)}?"
+
+
+def run(cache_cls, n: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = cache_cls(os.path.join(tmp, "virtual_tools.json"), max_entries=None)
+        plan = [{"tool": "SUM", "args": [1, 2]}]
+        start = time.perf_counter()
+        for i in range(n):
+            cache.add_virtual_tool(problem_text(i), plan)
+        cache.close()
+        elapsed = time.perf_counter() - start
+        reloaded = cache_cls(os.path.join(tmp, "virtual_tools.json"), max_entries=None)
+        assert len(reloaded.tools) == n, f"expected {n} entries after reload, got {len(reloaded.tools)}"
+        reloaded.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000])
+    parser.add_argument("--legacy-max", type=int, default=20_000)
+    args = parser.parse_args()
+
+    print(f"{'entries':>10} {'backend':>10} {'seconds':>10} {'inserts/s':>12}")
+    for n in args.sizes:
+        for name, cache_cls in (("log", VirtualToolCache), ("rewrite", RewriteCache)):
+            if cache_cls is RewriteCache and n > args.legacy_max:
+                print(f"{n:>10} {name:>10} {'skipped':>10} {'(O(N^2))':>12}")
+                continue
+            elapsed = run(cache_cls, n)
+            print(f"{n:>10} {name:>10} {elapsed:>10.2f} {n / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
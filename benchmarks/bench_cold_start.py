@@ -0,0 +1,172 @@
+"""
+Cold start of a short-lived process answering from a warm cache, like a CLI
+or serverless invocation:
+
+    python benchmarks/bench_cold_start.py                  # Compare with the stored baseline
+    python benchmarks/bench_cold_start.py --check          # Exit 1 on a regression (for CI)
+    python benchmarks/bench_cold_start.py --save-baseline  # Record a new baseline
+    python benchmarks/bench_cold_start.py --entries 100000
+
+Seeds a virtual tool cache with --entries learned problem shapes and compacts
+it, so the snapshot has its index. Then, best of --repeat fresh interpreters:
+  - `python -X importtime -c "import main2"`: the total and main2's slowest
+    direct imports,
+  - time to first answer: importing main2, constructing MultiAgentSystem on the
+    cache and solving one cached problem, timed inside the process, plus the
+    process's wall time.
+"no index" runs delete the index first, so the snapshot is parsed in full as
+it was before the index existed. Every run fails if answering imported openai.
+The baseline lives in benchmarks/baselines/cold_start.json.
+"""
+import argparse
+import json
+import os
+import random
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from virtualtoolcache import VirtualToolCache
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TOLERANCE = 0.25
+
+# Runs in the fresh interpreter; argv: cache directory, problem, expected answer
+CHILD = """
+import json, os, sys, time
+start = time.perf_counter()
+from main2 import MultiAgentSystem
+imported = time.perf_counter()
+directory = sys.argv[1]
+system = MultiAgentSystem(os.path.join(directory, "virtual_tools.json"), os.path.join(directory, "llm_responses.sqlite"),
+                          os.path.join(directory, "correction_rules.json"))
+constructed = time.perf_counter()
+result = system.solve(sys.argv[2], json.loads(sys.argv[3]))
+answered = time.perf_counter()
+print(json.dumps({"import": imported - start, "init": constructed - imported, "solve": answered - constructed,
+                  "result": result, "openai": "openai" in sys.modules, "numpy": "numpy" in sys.modules}))
+"""
+
+
+def seed_cache(directory: str, entries: int, seed: int) -> Tuple[str, int]:
+    """Learns `entries` distinct problem shapes; returns one cached problem (with new numbers) and its answer."""
+    rng = random.Random(seed)
+    cache = VirtualToolCache(os.path.join(directory, "virtual_tools.json"), max_entries=None)
+    for _ in range(entries):
+        thing, box = ("".join(rng.choices(string.ascii_lowercase, k=7)) for _ in range(2))
+        a, b = rng.randint(2, 49), rng.randint(2, 49)
+        # Two instances with different numbers, so the shape is learned as a template
+        for a, b in ((a, b), (a + 50, b + 50)):
+            cache.add_virtual_tool(f"How many {thing} fit in {a} {box} of {b}?", [{"tool": "PRODUCT", "args": [a, b]}])
+    cache.compact()
+    cache.close()
+    return f"How many {thing} fit in 123 {box} of 45?", 123 * 45
+
+
+def import_time() -> Tuple[float, List[Tuple[str, float]]]:
+    """Seconds `import main2` takes, and its slowest direct imports."""
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main2"], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stderr
+    total, children = 0.0, []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if name.strip() == "main2":
+            total = int(cumulative) / 1e6
+        elif name.startswith("   ") and not name.startswith("    "):  # One level below main2
+            children.append((name.strip(), int(cumulative) / 1e6))
+    return total, sorted(children, key=lambda child: -child[1])[:5]
+
+
+def first_answer(directory: str, problem: str, expected: Any) -> Dict[str, float]:
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", CHILD, directory, problem, json.dumps(expected)], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    wall = time.perf_counter() - start
+    run = json.loads(output)
+    if run["result"] != {"result": expected}:
+        raise SystemExit(f"Not answered from the cache: {run['result']}")
+    if run["openai"]:
+        raise SystemExit("Answering from the cache imported openai")
+    return {"import_ms": run["import"] * 1000, "init_ms": run["init"] * 1000, "solve_ms": run["solve"] * 1000,
+            "first_answer_ms": (run["import"] + run["init"] + run["solve"]) * 1000, "wall_ms": wall * 1000}
+
+
+def best(runs: List[Dict[str, float]]) -> Dict[str, float]:
+    # Best of several runs, like timeit: slower runs mostly measure interference from the rest of the machine
+    return {key: round(min(run[key] for run in runs), 2) for key in runs[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--entries", type=int, default=20_000, help="Problem shapes in the warm cache")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per measurement; the fastest counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=os.path.join(HERE, "baselines", "cold_start.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="Overwrite the baseline with this run")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    try:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)["results"]
+    except FileNotFoundError:
+        baseline = {}
+
+    imports = [import_time() for _ in range(args.repeat)]
+    total, slowest = min(imports)
+    results = {"import": {"import_ms": round(total * 1000, 2)}}
+    print(f"python -X importtime: import main2 {total * 1000:.1f} ms; slowest direct imports: "
+          + ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in slowest))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        problem, expected = seed_cache(tmp, args.entries, args.seed)
+        print(f"{args.entries:,} cached shapes, snapshot {os.path.getsize(os.path.join(tmp, 'virtual_tools.json')) / 2 ** 20:.1f} MB")
+        print(f"{'cache':<10} {'import ms':>10} {'init ms':>9} {'solve ms':>9} {'answer ms':>10} {'change':>7} {'wall ms':>9}")
+        for name in ("index", "no index"):
+            if name == "no index":
+                os.remove(os.path.join(tmp, "virtual_tools.json.idx"))
+            runs = []
+            for _ in range(args.repeat):
+                runs.append(first_answer(tmp, problem, expected))
+                if name == "no index":  # Opening without an index writes one in the background
+                    index_file = os.path.join(tmp, "virtual_tools.json.idx")
+                    if os.path.exists(index_file):
+                        os.remove(index_file)
+            result = results[name] = best(runs)
+            before = baseline.get(name, {}).get("first_answer_ms")
+            change = f"{(result['first_answer_ms'] - before) / before:+7.1%}" if before else " " * 7
+            print(f"{name:<10} {result['import_ms']:>10.1f} {result['init_ms']:>9.1f} {result['solve_ms']:>9.1f} "
+                  f"{result['first_answer_ms']:>10.1f} {change} {result['wall_ms']:>9.1f}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({"entries": args.entries, "repeat": args.repeat, "seed": args.seed, "results": results},
+                      f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    regressions = []
+    for name, key in (("import", "import_ms"), ("index", "first_answer_ms")):
+        before = baseline.get(name, {}).get(key)
+        value = results[name][key]
+        # Small absolute changes are noise at these durations
+        if before is not None and value > before * (1 + args.tolerance) and value - before > 5:
+            regressions.append(f"{name}: {key} {value:.1f}, baseline {before:.1f}")
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    if args.check and regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
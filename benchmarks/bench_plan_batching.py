@@ -0,0 +1,70 @@
+"""
+Planning throughput with micro-batched planner prompts, against the local fake
+chat-completions server limited to a few concurrent requests (like a
+provider's concurrency limit).
+
+    python benchmarks/bench_plan_batching.py --problems 256 --batch-sizes 1 4 8 16
+
+Every problem is a cache miss. "prompt tokens" counts the words sent to the
+server, so it shows how much of the repeated instruction block batching saves.
+"""
+import argparse
+import os
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import openai
+from fake_llm_server import FakeChatCompletionsServer, canned_plan_responder
+from main2 import MultiAgentSystem
+from metrics import Metrics
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--problems", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, default=32, help="Problems solved concurrently")
+    parser.add_argument("--server-concurrency", type=int, default=4, help="Requests the fake server serves at once")
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds per request before the first chunk")
+    parser.add_argument("--chunk-latency", type=float, default=0.002, help="Seconds per 8 generated characters")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--batch-wait", type=float, default=0.02)
+    args = parser.parse_args()
+
+    # Digit-free problems so every one is a distinct cache miss that needs the planner
+    problems = [f"What is problem {string.ascii_lowercase[i % 26]}{string.ascii_lowercase[i // 26 % 26]}" \
+                f"{string.ascii_lowercase[i // 676 % 26]}?" for i in range(args.problems)]
+    plans = {p: [{"tool": "SUM", "args": [i, 1]}] for i, p in enumerate(problems)}
+    cases = [(p, i + 1) for i, p in enumerate(problems)]
+
+    with FakeChatCompletionsServer(canned_plan_responder(plans), latency=args.latency, chunk_latency=args.chunk_latency,
+                                   max_concurrency=args.server_concurrency) as server, \
+            tempfile.TemporaryDirectory() as tmp:
+        openai.base_url = server.base_url
+        openai.api_key = "fake"
+        print(f"{args.problems} problems, concurrency {args.concurrency}, server concurrency {args.server_concurrency}")
+        print(f"{'batch size':>10} {'plans/s':>9} {'speedup':>8} {'requests':>9} {'prompt tokens':>14} {'retried':>8}")
+        baseline = None
+        for size in args.batch_sizes:
+            metrics = Metrics()
+            system = MultiAgentSystem(os.path.join(tmp, f"virtual_tools_{size}.json"), llm_cache_file=None,
+                                      rules_file=None, metrics=metrics, plan_batch_size=size,
+                                      plan_batch_wait=args.batch_wait)
+            requests_before = server.request_count
+            start = time.perf_counter()
+            results = system.solve_many(cases, max_concurrency=args.concurrency)
+            elapsed = time.perf_counter() - start
+            assert all("result" in r for r in results), results
+            rate = len(cases) / elapsed
+            baseline = baseline or rate
+            tokens = sum(h.total for (name, _), h in metrics.histograms.items() if name == "llm_prompt_tokens")
+            retried = system.batch_planner.stats()["retried"] if system.batch_planner else 0
+            print(f"{size:>10} {rate:>9.1f} {rate / baseline:>7.1f}x {server.request_count - requests_before:>9} "
+                  f"{tokens:>14,.0f} {retried:>8}")
+            system.virtual_tool_cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Wall-clock time of a wide plan (independent big-integer POWER steps folded
+together with SUM) run serially vs. through DAGScheduler's process pool.
+
+    python benchmarks/bench_scheduler.py --width 8 --exponent 1000000
+
+Speedup is bounded by the number of CPU cores.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from plandag import compile_plan
+from scheduler import DAGScheduler
+from toolbox import MathToolbox
+
+
+class _NoCorrection:
+    def __init__(self):
+        self.toolbox = MathToolbox()
+
+    def execute(self, tool_name, args):
+        return self.toolbox.get_tool(tool_name)(*args)
+
+    def recover(self, tool_name, args, error):
+        raise error
+
+
+def wide_plan(width: int, exponent: int):
+    plan = [{"tool": "POWER", "args": [3 + i, exponent]} for i in range(width)]
+    acc = "$step0"
+    for i in range(1, width):
+        plan.append({"tool": "SUM", "args": [acc, f"$step{i}"]})
+        acc = f"$step{len(plan) - 1}"
+    plan.append({"tool": "MODULO", "args": [acc, 1_000_000_007]})
+    return plan
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=8)
+    parser.add_argument("--exponent", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    plan = wide_plan(args.width, args.exponent)
+    serial = compile_plan(plan, MathToolbox())
+    scheduler = DAGScheduler(_NoCorrection())
+    scheduler.run(plan)  # Warm up the process pool
+
+    timings = {}
+    for name, run in (("serial", serial), ("scheduler", lambda: scheduler.run(plan))):
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = run()
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best
+        print(f"{name:>10}: {best:.3f}s (result {result})")
+    scheduler.shutdown()
+    print(f"speedup: {timings['serial'] / timings['scheduler']:.2f}x on {os.cpu_count()} CPU(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Multi-process throughput of the virtual tool cache backends.
+
+    python benchmarks/bench_shared_cache.py --workers 4 --preload 100000
+
+Every worker opens the cache (already holding --preload entries), inserts
+--inserts new problems of its own, waits for the others, then looks up random
+problems inserted by all workers. "visible" is the share of those lookups that
+hit: the JSON backend only sees entries that were on disk when it was opened,
+the SQLite backend sees every insert as soon as it commits.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sharedcache import SharedToolCache
+from virtualtoolcache import VirtualToolCache
+
+PLAN = [{"tool": "SUM", "args": [1, 2]}]
+
+
+def problem_text(worker: int, i: int) -> str:
+    # Digit-free keys so every insert is a distinct exact entry rather than one template
+    letters = []
+    for n in (worker, i):
+        while True:
+            n, r = divmod(n, 26)
+            letters.append(string.ascii_lowercase[r])
+            if n == 0:
+                break
+        letters.append(" ")
+    return f"What is problem {''.join(letters).strip()}?"
+
+
+def open_cache(backend: str, path: str):
+    if backend == "sqlite":
+        return SharedToolCache(path, max_entries=None, similarity_threshold=None)
+    return VirtualToolCache(path, max_entries=None, similarity_threshold=None)
+
+
+def worker(backend, path, index, workers, inserts, lookups, barrier, results):
+    start = time.perf_counter()
+    cache = open_cache(backend, path)
+    opened = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(inserts):
+        cache.add_virtual_tool(problem_text(index + 1, i), PLAN)
+    insert_time = time.perf_counter() - start
+
+    barrier.wait()
+    rng = random.Random(index)
+    queries = [problem_text(rng.randrange(workers) + 1, rng.randrange(inserts)) for _ in range(lookups)]
+    start = time.perf_counter()
+    hits = sum(cache.lookup(q) is not None for q in queries)
+    lookup_time = time.perf_counter() - start
+    cache.close()
+    results.put((opened, insert_time, lookup_time, hits))
+
+
+def run(backend: str, workers: int, preload: int, inserts: int, lookups: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "virtual_tools.sqlite" if backend == "sqlite" else "virtual_tools.json")
+        cache = open_cache(backend, path)
+        for i in range(preload):
+            cache.add_virtual_tool(problem_text(0, i), PLAN)
+        if backend == "json":
+            cache.compact()
+        cache.close()
+
+        barrier = multiprocessing.Barrier(workers)
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=worker, args=(backend, path, i, workers, inserts, lookups, barrier, results))
+                     for i in range(workers)]
+        for p in processes:
+            p.start()
+        stats = [results.get() for _ in processes]
+        for p in processes:
+            p.join()
+
+    opened = max(s[0] for s in stats)
+    insert_rate = workers * inserts / max(s[1] for s in stats)
+    lookup_rate = workers * lookups / max(s[2] for s in stats)
+    visible = sum(s[3] for s in stats) / (workers * lookups)
+    print(f"{backend:<7} open {opened * 1000:8.1f} ms   inserts {insert_rate:10,.0f}/s   "
+          f"lookups {lookup_rate:10,.0f}/s   visible {visible:6.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--preload", type=int, default=100_000)
+    parser.add_argument("--inserts", type=int, default=2000)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    parser.add_argument("--backends", nargs="+", default=["json", "sqlite"])
+    args = parser.parse_args()
+    print(f"{args.workers} workers, {args.preload:,} preloaded entries")
+    for backend in args.backends:
+        run(backend, args.workers, args.preload, args.inserts, args.lookups)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Lookup latency of VirtualToolCache for paraphrased problems as the number of
+cached templates grows.
+
+    python benchmarks/bench_similarity.py --sizes 10000 1000000
+
+Each cached template is a distinct made-up operation ("What is the blorf
+grunt of {0} and {1}?"). Queries are exact template hits, filler-word
+paraphrases ("Calculate the ..."), one-letter typos and misses.
+
+It also reloads each cache from its snapshot, with and without similarity
+lookups, and times the load and the first typo lookup (which builds the
+MinHash index).
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from virtualtoolcache import VirtualToolCache
+
+
+def make_word(rng: random.Random) -> str:
+    return "".join(rng.choice("bcdfghjklmnprstvwz") + rng.choice("aeiou") for _ in range(rng.randint(2, 4)))
+
+
+def build(cache: VirtualToolCache, n: int, rng: random.Random):
+    vocabulary = list({make_word(rng) for _ in range(5000)})
+    phrases = []
+    while len(phrases) < n:
+        phrase = " ".join(rng.sample(vocabulary, 3))
+        if phrase not in cache.templates:
+            # _insert skips the log: this measures lookups, not persistence
+            cache._insert(f"What is the {phrase} of {{0}} and {{1}}?", [{"tool": "SUM", "args": ["$0", "$1"]}])
+            phrases.append(phrase)
+    return phrases
+
+
+def typo(phrase: str, rng: random.Random) -> str:
+    i = rng.randrange(len(phrase) - 1)
+    while not (phrase[i].isalpha() and phrase[i + 1].isalpha()):
+        i = rng.randrange(len(phrase) - 1)
+    return phrase[:i] + phrase[i + 1] + phrase[i] + phrase[i + 2:]
+
+
+def measure(cache: VirtualToolCache, queries):
+    latencies, hits = [], 0
+    for query in queries:
+        start = time.perf_counter()
+        hits += cache.lookup(query) is not None
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return hits / len(queries), statistics.median(latencies), latencies[int(len(latencies) * 0.99)]
+
+
+def load_times(path: str, query: str) -> str:
+    """Full load of the snapshot with and without similarity, and the first fuzzy lookup after it."""
+    times = []
+    for threshold in (None, 0.6):
+        start = time.perf_counter()
+        cache = VirtualToolCache(path, max_entries=None, similarity_threshold=threshold)
+        loaded = time.perf_counter()
+        cache.lookup(query)
+        times.append((loaded - start, time.perf_counter() - loaded))
+        cache.close()
+    (plain, _), (similar, first) = times
+    return f"load {plain:.2f}s, {similar:.2f}s with similarity (first typo lookup {first:.2f}s)"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        rng = random.Random(n)
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = VirtualToolCache(os.path.join(tmp, "virtual_tools.json"), max_entries=None)
+            start = time.perf_counter()
+            phrases = build(cache, n, rng)
+            build_time = time.perf_counter() - start
+            sample = rng.sample(phrases, min(args.queries, n))
+            workloads = {
+                "exact": [f"What is the {p} of 3 and 4?" for p in sample],
+                "paraphrase": [f"Calculate the {p} of 3 and 4." for p in sample],
+                "typo": [f"What is the {typo(p, rng)} of 3 and 4?" for p in sample],
+                "miss": [f"What is the {make_word(rng)} {make_word(rng)} of 3 and 4?" for _ in sample],
+            }
+            print(f"{n:>9,} templates (built in {build_time:.1f}s)")
+            for name, queries in workloads.items():
+                hit_ratio, p50, p99 = measure(cache, queries)
+                print(f"    {name:<11} hit ratio {hit_ratio:6.1%}   p50 {p50 * 1e6:7.1f} us   p99 {p99 * 1e6:7.1f} us")
+            cache.compact()
+            cache.close()
+            print(f"    {load_times(cache.cache_file, workloads['typo'][0])}")
+
+
+if __name__ == "__main__":
+    main()
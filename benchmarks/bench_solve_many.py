@@ -0,0 +1,50 @@
+"""
+Throughput of MultiAgentSystem.solve_many against the local fake
+chat-completions server, for increasing concurrency limits.
+
+    python benchmarks/bench_solve_many.py --problems 64 --latency 0.1
+"""
+import argparse
+import os
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import openai
+from fake_llm_server import FakeChatCompletionsServer, canned_plan_responder
+from main2 import MultiAgentSystem
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--problems", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    # Digit-free problems so every one is a cache miss that needs the planner
+    problems = [f"What is problem {string.ascii_lowercase[i % 26]}{string.ascii_lowercase[i // 26 % 26]}?"
+                for i in range(args.problems)]
+    plans = {p: [{"tool": "SUM", "args": [i, 1]}] for i, p in enumerate(problems)}
+    cases = [(p, i + 1) for i, p in enumerate(problems)]
+
+    with FakeChatCompletionsServer(canned_plan_responder(plans), latency=args.latency) as server, \
+            tempfile.TemporaryDirectory() as tmp:
+        openai.base_url = server.base_url
+        openai.api_key = "fake"
+        print(f"{'concurrency':>12} {'seconds':>10} {'problems/s':>12} {'speedup':>10}")
+        baseline = None
+        for limit in args.concurrency:
+            system = MultiAgentSystem(os.path.join(tmp, f"virtual_tools_{limit}.json"), llm_cache_file=None, rules_file=None)
+            start = time.perf_counter()
+            results = system.solve_many(cases, max_concurrency=limit)
+            elapsed = time.perf_counter() - start
+            assert all("result" in r for r in results), results
+            baseline = baseline or elapsed
+            print(f"{limit:>12} {elapsed:>10.2f} {len(cases) / elapsed:>12.1f} {baseline / elapsed:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Offline benchmark suite: drives MultiAgentSystem with synthetic workloads
+against the local fake chat-completions server, so results reflect our own
+overhead plus a controlled LLM latency instead of network noise.
+
+    python benchmarks/bench_suite.py                       # Compare with the stored baseline
+    python benchmarks/bench_suite.py --check               # Exit 1 on a regression (for CI)
+    python benchmarks/bench_suite.py --save-baseline       # Record a new baseline
+    python benchmarks/bench_suite.py --profile gpt-3.5-turbo --problems 200
+
+The fake server's latency and failure distribution come from a profile in
+benchmarks/profiles/. Every scenario first warms the cache by solving each
+problem shape twice (a template is only learned once a second instance with
+other numbers confirms it), then solves --problems problems of which a `hit_ratio`
+share reuse a learned shape (with new numbers) and the rest need the planner.
+A `paraphrase_rate` share of the hits is reworded so it has to be matched by
+similarity. Baselines live in benchmarks/baselines/<profile>.json, one per
+profile, so regressions show up in their diffs.
+"""
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import openai
+from fake_llm_server import FakeChatCompletionsServer, canned_plan_responder, load_profile
+from llmclient import LLMClient
+from main2 import MultiAgentSystem
+from metrics import LatencyHistogram
+from plandag import resolve_args
+from toolbox import MathToolbox
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Problem shapes the rule planner doesn't recognize, with their plans over the slots
+SHAPES = [
+    ("If a box holds {0} items, how many items are in {1} boxes?", [{"tool": "PRODUCT", "args": ["$0", "$1"]}]),
+    ("Split {0} dollars evenly among {1} people.", [{"tool": "QUOTIENT", "args": ["$0", "$1"]}]),
+    ("What is the mean speed over legs of {0} and {1} km per hour?", [{"tool": "AVG", "args": [["$0", "$1"]]}]),
+    ("A tank holds {0} litres and gets {1} more; how much is in it?", [{"tool": "SUM", "args": ["$0", "$1"]}]),
+    ("How many cards are left over when {0} cards are dealt to {1} players?", [{"tool": "MODULO", "args": ["$0", "$1"]}]),
+    ("What is the geometric mean of {0} and {1}?",
+     [{"tool": "PRODUCT", "args": ["$0", "$1"]}, {"tool": "SQRT", "args": ["$step0"]}]),
+    ("Scale {0} by {1} and then add {2}.",
+     [{"tool": "PRODUCT", "args": ["$0", "$1"]}, {"tool": "SUM", "args": ["$step0", "$2"]}]),
+]
+# Rewordings that only add filler words, so similarity matching should still hit
+PARAPHRASES = ["Please work out: {}", "Tell me: {}", "Please calculate: {}"]
+
+# (name, hit ratio, paraphrase rate)
+SCENARIOS = [
+    ("cached", 1.0, 0.0),
+    ("mostly_cached", 0.9, 0.0),
+    ("paraphrased", 0.9, 0.5),
+    ("half_cached", 0.5, 0.0),
+    ("cold", 0.0, 0.0),
+]
+# Relative change beyond which --check reports a regression
+DEFAULT_TOLERANCE = 0.25
+
+TOOLBOX = MathToolbox()
+
+
+def _fill(plan: List[Dict[str, Any]], values: List[int]) -> List[Dict[str, Any]]:
+    def arg(a):
+        if isinstance(a, list):
+            return [arg(x) for x in a]
+        if isinstance(a, str) and a.startswith("$") and not a.startswith("$step"):
+            return values[int(a[1:])]
+        return a
+    return [{"tool": step["tool"], "args": arg(step["args"])} for step in plan]
+
+
+def _evaluate(plan: List[Dict[str, Any]]):
+    results = {}
+    for i, step in enumerate(plan):
+        results[i] = TOOLBOX.get_tool(step["tool"])(*resolve_args(step["args"], results))
+    return results[len(plan) - 1]
+
+
+def _instance(rng: random.Random, shape: str, plan: List[Dict[str, Any]], plans: Dict[str, Any]) -> Tuple[str, Any]:
+    # Distinct values so a learned plan maps every number to the right slot
+    values = rng.sample(range(2, 1000), shape.count("{"))
+    problem = shape.format(*values)
+    plans[problem] = _fill(plan, values)
+    return problem, _evaluate(plans[problem])
+
+
+def _unique_word(rng: random.Random) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(10))
+
+
+def workload(rng: random.Random, problems: int, hit_ratio: float, paraphrase_rate: float,
+             plans: Dict[str, Any]) -> List[Tuple[str, Any]]:
+    """(problem, expected) pairs; misses use a made-up operation word so the planner is always needed."""
+    cases = []
+    for _ in range(problems):
+        if rng.random() < hit_ratio:
+            problem, expected = _instance(rng, *rng.choice(SHAPES), plans)
+            if rng.random() < paraphrase_rate:
+                reworded = rng.choice(PARAPHRASES).format(problem[0].lower() + problem[1:])
+                plans[reworded] = plans[problem]
+                problem = reworded
+        else:
+            shape = f"What is the {_unique_word(rng)} of {{0}} and {{1}}?"
+            problem, expected = _instance(rng, shape, [{"tool": "SUM", "args": ["$0", "$1"]}], plans)
+        cases.append((problem, expected))
+    return cases
+
+
+def run_scenario(profile_file: str, hit_ratio: float, paraphrase_rate: float, problems: int,
+                 concurrency: int, seed: int, retries: int = 0) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    plans: Dict[str, Any] = {}
+    warmup = [_instance(rng, shape, plan, plans) for shape, plan in SHAPES for _ in range(2)]
+    cases = workload(rng, problems, hit_ratio, paraphrase_rate, plans)
+
+    with FakeChatCompletionsServer(canned_plan_responder(plans), **load_profile(profile_file, seed)) as server, \
+            tempfile.TemporaryDirectory() as tmp:
+        openai.base_url = server.base_url
+        openai.api_key = "fake"
+        system = MultiAgentSystem(os.path.join(tmp, "virtual_tools.json"), llm_cache_file=None, rules_file=None,
+                                  llm_client=LLMClient(max_retries=retries, seed=seed))
+        system.solve_many(warmup, max_concurrency=concurrency)
+        requests_before = server.request_count
+        hits_before = system.virtual_tool_cache.hits
+
+        latencies: List[float] = []
+        start = time.perf_counter()
+        results = system.solve_many(cases, max_concurrency=concurrency, latencies=latencies)
+        elapsed = time.perf_counter() - start
+        # Hits per problem: each problem is looked up once, on the batch or the per-problem path
+        hits = system.virtual_tool_cache.hits - hits_before
+        llm_requests = server.request_count - requests_before
+        system.virtual_tool_cache.close()
+
+    latency = LatencyHistogram()
+    for seconds in latencies:
+        latency.record(seconds)
+    return {
+        "problems": len(cases),
+        "throughput": round(len(cases) / elapsed, 1),
+        "p50_ms": round(latency.percentile(50) * 1000, 2),
+        "p95_ms": round(latency.percentile(95) * 1000, 2),
+        "p99_ms": round(latency.percentile(99) * 1000, 2),
+        "errors": sum("error" in r for r in results),
+        "cache_hit_ratio": round(hits / len(cases), 3),
+        "llm_requests": llm_requests,
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    """Regressions against the baseline: lower throughput or a higher p99 beyond the tolerance."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {result['throughput']:,.1f}/s, baseline {before['throughput']:,.1f}/s")
+        if result["p99_ms"] > before["p99_ms"] * (1 + tolerance) and result["p99_ms"] - before["p99_ms"] > 1:
+            regressions.append(f"{name}: p99 {result['p99_ms']:.2f} ms, baseline {before['p99_ms']:.2f} ms")
+        if result["errors"] > before["errors"]:
+            regressions.append(f"{name}: {result['errors']} errors, baseline {before['errors']}")
+    return regressions
+
+
+def _change(value: float, before: float) -> str:
+    return f"{(value - before) / before:+7.1%}" if before else " " * 7
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--profile", default="fast", help="Name of a profile in benchmarks/profiles, or a path")
+    parser.add_argument("--problems", type=int, default=1000, help="Problems per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario; the fastest is reported")
+    parser.add_argument("--scenarios", nargs="+", help="Subset of: " + ", ".join(name for name, _, _ in SCENARIOS))
+    parser.add_argument("--baseline", help="Baseline file (default: benchmarks/baselines/PROFILE.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="Overwrite the baseline with this run")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--retries", type=int, default=0,
+                        help="LLM retries per request; by default failed requests are reported as errors")
+    args = parser.parse_args()
+
+    profile_file = args.profile if os.path.exists(args.profile) else os.path.join(HERE, "profiles", args.profile + ".json")
+    profile_name = os.path.splitext(os.path.basename(profile_file))[0]
+    baseline_file = args.baseline or os.path.join(HERE, "baselines", profile_name + ".json")
+    try:
+        with open(baseline_file, "r") as f:
+            baseline = json.load(f)["scenarios"]
+    except FileNotFoundError:
+        baseline = {}
+    print(f"profile {profile_name}, {args.problems:,} problems per scenario, concurrency {args.concurrency}")
+    print(f"{'scenario':<14} {'problems/s':>11} {'change':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'change':>7} "
+          f"{'hits':>6} {'llm':>6} {'errors':>6}")
+    results = {}
+    for name, hit_ratio, paraphrase_rate in SCENARIOS:
+        if args.scenarios and name not in args.scenarios:
+            continue
+        # Best of several runs, like timeit: slower runs mostly measure interference from the rest of the machine
+        runs = [run_scenario(profile_file, hit_ratio, paraphrase_rate, args.problems, args.concurrency, args.seed,
+                             args.retries) for _ in range(args.repeat)]
+        result = results[name] = max(runs, key=lambda run: run["throughput"])
+        before = baseline.get(name, {})
+        print(f"{name:<14} {result['throughput']:>11,.1f} {_change(result['throughput'], before.get('throughput', 0))} "
+              f"{result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+              f"{_change(result['p99_ms'], before.get('p99_ms', 0))} {result['cache_hit_ratio']:>6.1%} "
+              f"{result['llm_requests']:>6} {result['errors']:>6}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_file), exist_ok=True)
+        with open(baseline_file, "w") as f:
+            json.dump({"profile": profile_name, "problems": args.problems, "concurrency": args.concurrency,
+                       "seed": args.seed, "repeat": args.repeat, "scenarios": {**baseline, **results}}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Saved baseline to {baseline_file}")
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    if args.check and regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
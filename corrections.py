@@ -0,0 +1,192 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Tuple, Optional
+from metrics import NULL_METRICS, NullMetrics
+from virtualtoolcache import SLOT_PATTERN
+
+_DIGITS = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def _arg_class(arg: Any) -> str:
+    if isinstance(arg, list):
+        return "list" if arg else "empty_list"
+    if isinstance(arg, bool) or not isinstance(arg, (int, float)):
+        return type(arg).__name__
+    if arg == 0:
+        return "zero"
+    return "neg" if arg < 0 else "pos"
+
+
+def rule_key(tool_name: str, args: List[Any], error: Exception) -> str:
+    """Tool, error class and argument pattern, e.g. "QUOTIENT|ValueError: Division by zero|pos,zero"."""
+    message = _DIGITS.sub("#", str(error))
+    return f"{tool_name}|{type(error).__name__}: {message}|{','.join(map(_arg_class, args))}"
+
+
+def _generalize(corrected_args: List[Any], args: List[Any]) -> Optional[Tuple[List[Any], bool]]:
+    """
+    Rewrites corrected arguments equal to an original argument as "$i". Returns
+    (args, uses constants), or None when an argument matches several originals.
+    """
+    out, constants = [], False
+    for value in corrected_args:
+        matches = [i for i, a in enumerate(args) if type(a) is type(value) and a == value]
+        if len(matches) > 1:
+            return None
+        if matches:
+            out.append(f"${matches[0]}")
+        else:
+            out.append(value)
+            constants = True
+    return out, constants
+
+
+class CorrectionRules:
+    """
+    Remembers ErrorCorrectionAgent outcomes so the same kind of failure is fixed
+    without asking the LLM again. A rule whose corrected arguments only reuse the
+    failed call's arguments (QUOTIENT(a, b) -> QUOTIENT(b, a)) is trusted right
+    away. One with other constants may only be right for this one input, like
+    SQRT(-4) -> SQRT(4), and so may QUOTIENT(a, 0) -> QUOTIENT(a, 1): it keeps
+    "a" but adds the constant 1. Such a rule must be learned again from
+    different arguments before it is used.
+    Rules that fail more often than they succeed are dropped.
+    """
+    def __init__(self, rules_file: Optional[str] = "correction_rules.json", metrics: Optional[NullMetrics] = None):
+        self.rules_file = rules_file
+        self.rules: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if rules_file and os.path.exists(rules_file):
+            try:
+                with open(rules_file, "r") as f:
+                    self.rules = json.load(f)
+            except (json.JSONDecodeError, OSError) as e:
+                (metrics or NULL_METRICS).event("correction_rules_unreadable", file=rules_file, error=str(e))
+
+    def lookup(self, tool_name: str, args: List[Any], error: Exception) -> Optional[Tuple[str, str, List[Any]]]:
+        """Returns (key, corrected tool, corrected args) for a trusted rule, or None."""
+        key = rule_key(tool_name, args, error)
+        with self._lock:
+            rule = self.rules.get(key)
+            if rule is None or not rule["trusted"]:
+                return None
+            rule["hits"] += 1
+        corrected = []
+        for value in rule["args"]:
+            match = isinstance(value, str) and SLOT_PATTERN.match(value)
+            corrected.append(args[int(match.group(1))] if match else value)
+        return key, rule["tool"], corrected
+
+    def record(self, key: str, succeeded: bool):
+        """Outcome of applying a looked-up rule: whether the answer it led to validated (False if the call raised)."""
+        with self._lock:
+            rule = self.rules.get(key)
+            if rule is None:
+                return
+            rule["successes" if succeeded else "failures"] += 1
+            if rule["failures"] > rule["successes"]:
+                del self.rules[key]
+                self._save()
+
+    def learn(self, tool_name: str, args: List[Any], error: Exception, corrected_tool: str, corrected_args: List[Any]):
+        """Stores an LLM correction whose corrected call led to a validated answer."""
+        generalized = _generalize(corrected_args, args)
+        if generalized is None:
+            return
+        rule_args, constants = generalized
+        key = rule_key(tool_name, args, error)
+        with self._lock:
+            rule = self.rules.get(key)
+            if rule is not None and rule["tool"] == corrected_tool and rule["args"] == rule_args:
+                if rule["trusted"] or rule["learned_from"] == repr(args):
+                    return
+                rule["trusted"] = True  # Same correction for different inputs
+            else:
+                self.rules[key] = {"tool": corrected_tool, "args": rule_args, "trusted": not constants,
+                                   "learned_from": repr(args), "hits": 0, "successes": 0, "failures": 0}
+            self._save()
+
+    def _save(self):
+        if not self.rules_file:
+            return
+        tmp_file = f"{self.rules_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.rules, f, indent=4)
+        os.replace(tmp_file, self.rules_file)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rules": len(self.rules),
+                "trusted": sum(rule["trusted"] for rule in self.rules.values()),
+                "hits": sum(rule["hits"] for rule in self.rules.values()),
+                "successes": sum(rule["successes"] for rule in self.rules.values()),
+                "failures": sum(rule["failures"] for rule in self.rules.values()),
+            }
+
+
+class FailureCache:
+    """
+    Negative cache of problems that ended in an error. A failing problem is not
+    retried until its backoff has passed; the backoff doubles with every
+    consecutive failure (base_backoff, 2 * base_backoff, ... up to max_backoff).
+    A problem not failing again within max_backoff of its retry time is
+    forgotten, and past max_entries the least recently used problems go.
+    """
+    def __init__(self, base_backoff: float = 30.0, max_backoff: float = 3600.0,
+                 max_entries: Optional[int] = 10_000):
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_entries = max_entries
+        # key -> (failures, retry at, result), least recently used first
+        self.entries: "OrderedDict[str, Tuple[int, float, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self._next_prune = time.monotonic() + max_backoff
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(problem: str, expected_output) -> str:
+        # Validation failures depend on the expected output as well
+        return f"{problem}\x00{expected_output!r}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """The remembered error result while the problem is backing off, else None."""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or time.monotonic() >= entry[1]:
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[2])
+
+    def record(self, key: str, result: Dict[str, Any]):
+        with self._lock:
+            if "error" not in result:
+                self.entries.pop(key, None)
+                return
+            now = time.monotonic()
+            entry = self.entries.pop(key, None)
+            # Consecutive failures only count while the last one is remembered
+            failures = entry[0] + 1 if entry is not None and now < entry[1] + self.max_backoff else 1
+            backoff = min(self.base_backoff * 2 ** min(failures - 1, 32), self.max_backoff)
+            self.entries[key] = (failures, now + backoff, dict(result))
+            if now >= self._next_prune:
+                self._prune(now)
+            while self.max_entries is not None and len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _prune(self, now: float):
+        # At most once per max_backoff, so the scan is amortized over the records in between
+        for key in [key for key, (_, retry_at, _) in self.entries.items() if now >= retry_at + self.max_backoff]:
+            del self.entries[key]
+        self._next_prune = now + self.max_backoff
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            return {"hits": self.hits, "failing": len(self.entries),
+                    "backing_off": sum(retry_at > now for _, retry_at, _ in self.entries.values())}
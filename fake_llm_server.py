@@ -0,0 +1,249 @@
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Any, Optional, Union
+
+# The problem being planned follows the "**Your Turn:**" marker in PlannerAgent's prompt
+PROBLEM_PATTERN = re.compile(r"Your Turn:\**\s*Problem:\s*(.+?)\s*\n")
+# Batched prompts list "Problem 0: ...", "Problem 1: ..." instead
+BATCH_PROBLEM_PATTERN = re.compile(r"^\s*Problem (\d+): (.+?)\s*$", re.MULTILINE)
+
+
+def canned_plan_responder(plans: Dict[str, List[Dict[str, Any]]]) -> Callable[[str], str]:
+    """Answers planner prompts with the plan stored for the problem, or an empty plan."""
+    def respond(prompt: str) -> str:
+        batch = BATCH_PROBLEM_PATTERN.findall(prompt)
+        if batch:
+            return json.dumps({key: plans.get(problem, []) for key, problem in batch})
+        match = PROBLEM_PATTERN.search(prompt)
+        problem = match.group(1) if match else ""
+        return json.dumps(plans.get(problem, []))
+    return respond
+
+
+def latency_distribution(spec: Dict[str, Any], seed: Optional[int] = None) -> Callable[[], float]:
+    """
+    Builds a sampler of response latencies in seconds from a profile's "latency" entry:
+
+        {"distribution": "constant", "seconds": 0.05}
+        {"distribution": "lognormal", "median": 0.6, "sigma": 0.5}
+        {"distribution": "samples", "samples": [0.41, 0.52, ...]}  # Replays recorded latencies
+    """
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    kind = spec.get("distribution", "constant")
+    if kind == "constant":
+        seconds = spec.get("seconds", 0.0)
+        return lambda: seconds
+    if kind == "lognormal":
+        mu, sigma = math.log(spec["median"]), spec["sigma"]
+        sample = lambda: rng.lognormvariate(mu, sigma)
+    elif kind == "samples":
+        samples = list(spec["samples"])
+        sample = lambda: rng.choice(samples)
+    else:
+        raise ValueError(f"Unknown latency distribution '{kind}'")
+
+    def draw() -> float:
+        with lock:  # Handler threads share the generator
+            return sample()
+    return draw
+
+
+def load_profile(path: str, seed: Optional[int] = None) -> Dict[str, Any]:
+    """Reads a latency profile (JSON) into FakeChatCompletionsServer keyword arguments."""
+    with open(path, "r") as f:
+        profile = json.load(f)
+    options = {key: profile[key] for key in ("failure_rate", "rate_limit_rate", "retry_after", "slow_rate", "slow_latency")
+               if key in profile}
+    return {"latency": latency_distribution(profile.get("latency", {}), seed), "seed": seed, **options}
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    request_queue_size = 1024  # The default backlog of 5 resets bursts of concurrent connections
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):  # Clients that timed out and hung up are expected
+            super().handle_error(request, client_address)
+
+
+class FakeChatCompletionsServer:
+    """
+    Local stand-in for the OpenAI chat-completions endpoint, for tests and
+    benchmarks that must not touch the network. Every request sleeps for
+    `latency` seconds (a number, or a callable drawing one per request) and
+    answers with responder(prompt); a `failure_rate` share of requests fail
+    with HTTP 500 instead, and a `rate_limit_rate` share with HTTP 429 and a
+    Retry-After of `retry_after` seconds. A `slow_rate` share of requests takes
+    `slow_latency` extra seconds, like a stalled upstream. Streamed requests ("stream": true) get the answer as
+    server-sent events of `chunk_size` characters, `chunk_latency` seconds apart.
+    That models generation time, so unstreamed answers wait for all chunks too.
+    With max_concurrency, at most that many requests are served at once and the
+    rest queue, like a provider's concurrency limit.
+
+        with FakeChatCompletionsServer(canned_plan_responder(plans), latency=0.05) as server:
+            openai.base_url = server.base_url
+    """
+    def __init__(self, responder: Callable[[str], str], latency: Union[float, Callable[[], float]] = 0.0,
+                 host: str = "127.0.0.1", port: int = 0, failure_rate: float = 0.0, seed: Optional[int] = None,
+                 chunk_size: int = 8, chunk_latency: float = 0.0, max_concurrency: Optional[int] = None,
+                 rate_limit_rate: float = 0.0, retry_after: float = 0.0, slow_rate: float = 0.0,
+                 slow_latency: float = 0.0):
+        self.responder = responder
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.chunk_size = chunk_size
+        self.chunk_latency = chunk_latency
+        self.request_count = 0
+        self.failure_count = 0
+        self.rate_limited_count = 0
+        self.model_counts: Counter = Counter()  # Requests per requested model
+        self._rng = random.Random(seed)
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self._count_lock = threading.Lock()
+        self._httpd = _HTTPServer((host, port), self._make_handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1/"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, so clients' connection pooling is exercised
+            disable_nagle_algorithm = True  # Headers and body are separate writes; don't wait for delayed ACKs
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if server._slots is None:
+                    self._respond(body)
+                    return
+                with server._slots:
+                    self._respond(body)
+
+            def _respond(self, body: Dict[str, Any]):
+                with server._count_lock:
+                    server.request_count += 1
+                    server.model_counts[body.get("model")] += 1
+                    rate_limited = server.rate_limit_rate and server._rng.random() < server.rate_limit_rate
+                    failed = not rate_limited and server.failure_rate and server._rng.random() < server.failure_rate
+                    slow = server.slow_rate and server._rng.random() < server.slow_rate
+                    if rate_limited:
+                        server.rate_limited_count += 1
+                    if failed:
+                        server.failure_count += 1
+                if rate_limited:  # Rejected before any work, like a provider's limiter
+                    self._send_json({"error": {"message": "Injected rate limit", "type": "rate_limit_error"}}, 429,
+                                    {"Retry-After": f"{server.retry_after:g}"})
+                    return
+                latency = server.latency() if callable(server.latency) else server.latency
+                if slow:
+                    latency += server.slow_latency
+                if latency:
+                    time.sleep(latency)
+                if failed:
+                    self._send_json({"error": {"message": "Injected failure", "type": "server_error"}}, 500)
+                    return
+                prompt = body.get("messages", [{}])[-1].get("content", "")
+                model, content = body.get("model", "fake"), server.responder(prompt)
+                if body.get("stream"):
+                    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+                    self._send_stream(server.completion_chunks(model, content, prompt, include_usage))
+                else:
+                    if server.chunk_latency:
+                        time.sleep(server.chunk_latency * max(0, math.ceil(len(content) / server.chunk_size) - 1))
+                    self._send_json(server.completion(model, content, prompt))
+
+            def _send_stream(self, events):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i, event in enumerate(events):
+                    if i and server.chunk_latency:
+                        time.sleep(server.chunk_latency)
+                    self._write_chunk(f"data: {json.dumps(event)}\n\n".encode())
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def _send_json(self, payload: Dict[str, Any], status: int = 200, headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass  # Keep test output quiet
+
+        return Handler
+
+    @staticmethod
+    def completion(model: str, content: str, prompt: str = "") -> Dict[str, Any]:
+        # Whitespace-separated words stand in for tokens
+        prompt_tokens, completion_tokens = len(prompt.split()), len(content.split())
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def completion_chunks(self, model: str, content: str, prompt: str = "", include_usage: bool = False):
+        full = self.completion(model, content, prompt)
+        chunk = {"id": full["id"], "object": "chat.completion.chunk", "created": full["created"], "model": model}
+        pieces = [content[i:i + self.chunk_size] for i in range(0, len(content), self.chunk_size)]
+        for i, piece in enumerate(pieces):
+            delta = {"role": "assistant", "content": piece} if i == 0 else {"content": piece}
+            yield {**chunk, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+        yield {**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        if include_usage:
+            yield {**chunk, "choices": [], "usage": full["usage"]}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
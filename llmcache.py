@@ -0,0 +1,164 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+
+class LLMResponseCache:
+    """
+    Caches raw LLM responses keyed by (model, prompt), independent of whether the
+    resulting plan ever validated. Completed responses live in an SQLite file with
+    LRU eviction under entry/byte budgets and a TTL; concurrent identical requests
+    are coalesced so only one of them reaches the API.
+    """
+    def __init__(self, cache_file: str = "llm_responses.sqlite", max_entries: int = 10000,
+                 max_bytes: int = 50 * 1024 * 1024, ttl: Optional[float] = 24 * 60 * 60):
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._db = sqlite3.connect(cache_file, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+        self._db.commit()
+
+    @staticmethod
+    def make_key(model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model}\0{prompt}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl is not None and now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            return row[0]
+
+    def put(self, key: str, response: str):
+        now = time.time()
+        size = len(response.encode())
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (key, response, size, now, now))
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        while count > self.max_entries or (total > self.max_bytes and count > 0):
+            key, size = self._db.execute("SELECT key, size FROM responses ORDER BY last_used LIMIT 1").fetchone()
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            count, total = count - 1, total - size
+
+    def get_or_compute(self, model: str, prompt: str, compute: Callable[[], str]) -> str:
+        """Returns the cached response, joins an identical in-flight call, or runs compute()."""
+        key = self.make_key(model, prompt)
+        cached = self.get(key)
+        if cached is not None:
+            with self._lock:
+                self.hits += 1
+            return cached
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            # A previous leader may have stored the response since our first lookup
+            response = self.get(key)
+            if response is None:
+                response = compute()
+                self.put(key, response)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def stream_or_compute(self, model: str, prompt: str, stream: Callable[[], Iterable[str]]) -> Iterator[str]:
+        """
+        Streaming get_or_compute: yields the response in chunks as stream()
+        produces them and caches the joined text once it is complete. Cached and
+        coalesced responses arrive as a single chunk.
+        """
+        key = self.make_key(model, prompt)
+        cached = self.get(key)
+        if cached is not None:
+            with self._lock:
+                self.hits += 1
+            yield cached
+            return
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            yield future.result()
+            return
+
+        try:
+            response = self.get(key)
+            if response is None:
+                chunks = []
+                for chunk in stream():
+                    chunks.append(chunk)
+                    yield chunk
+                response = "".join(chunks)
+                self.put(key, response)
+            else:
+                yield response
+            future.set_result(response)
+        except GeneratorExit:
+            # The consumer stopped reading; waiting callers must not get a partial response
+            future.set_exception(RuntimeError("Streamed response was abandoned"))
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+                    "entries": entries, "bytes": size}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,194 @@
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+from metrics import NULL_METRICS, NullMetrics
+
+# openai is only imported by the first request: importing it takes longer than
+# the rest of the system together, and answers from the caches never need it.
+
+# Retried with backoff; other API errors (bad request, auth, ...) are raised at once
+RETRYABLE_ERRORS = ("RateLimitError", "InternalServerError", "APIConnectionError")
+
+
+class TokenBucket:
+    """
+    Rate limiter refilling `per_minute` units per minute, up to `burst` units
+    (default: one second's worth). acquire() reserves its units right away and
+    returns how long the caller has to wait for them, so callers are served in
+    arrival order. A request larger than the burst is let through once the
+    bucket is full, leaving it in debt.
+    """
+    def __init__(self, per_minute: float, burst: Optional[float] = None):
+        self.rate = per_minute / 60
+        self.capacity = burst if burst is not None else max(1.0, self.rate)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1, deadline: Optional[float] = None) -> float:
+        """
+        Reserves `amount` units and returns the seconds to wait before using them.
+        Raises TimeoutError, reserving nothing, if the wait would pass `deadline`
+        (a time.monotonic() value).
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+            if deadline is not None and now + wait > deadline:
+                raise TimeoutError("Rate limit wait exceeds the deadline")
+            self.level -= amount
+            return wait
+
+    def adjust(self, amount: float):
+        """Takes `amount` more units (or gives them back when negative), e.g. once actual usage is known."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.level = min(self.capacity, self.level - amount)
+
+
+class LLMClient:
+    """
+    Chat-completions client shared by the LLM agents. It keeps one pooled
+    keep-alive HTTP connection pool and rate-limits with token buckets for
+    requests and (estimated) tokens per minute. Rate-limited (429), server (5xx)
+    and connection errors are retried with jittered exponential backoff,
+    honouring Retry-After. Every call has a deadline covering rate-limit waits,
+    retries and, for streams, the whole response; each attempt also times out
+    after `timeout` seconds.
+
+    base_url and api_key default to openai.base_url / openai.api_key (then the
+    OPENAI_* environment variables) at call time. The SDK and its clients are
+    only loaded by the first call.
+    """
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None, max_connections: int = 64,
+                 requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 max_retries: int = 4, backoff_base: float = 0.5, backoff_max: float = 8.0, timeout: float = 30.0,
+                 deadline: float = 120.0, metrics: Optional[NullMetrics] = None, seed: Optional[int] = None):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.deadline = deadline  # Default seconds per call
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.retries = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._http = None
+        self._clients: Dict[Tuple[Any, Any], Any] = {}
+
+    def _client(self):
+        # One OpenAI client per endpoint, all sharing the connection pool
+        import openai
+        settings = (self.base_url or openai.base_url, self.api_key or openai.api_key)
+        with self._lock:
+            client = self._clients.get(settings)
+            if client is None:
+                if self._http is None:
+                    # The SDK's own Limits type, whichever HTTP library this openai version uses
+                    limits = type(openai.DEFAULT_CONNECTION_LIMITS)(max_connections=self.max_connections,
+                                                                    max_keepalive_connections=self.max_connections)
+                    self._http = openai.DefaultHttpxClient(limits=limits)
+                client = self._clients[settings] = openai.OpenAI(base_url=settings[0], api_key=settings[1],
+                                                                 http_client=self._http, max_retries=0)
+            return client
+
+    def create(self, model: str, prompt: str, max_tokens: int = 150, stream: bool = False,
+               deadline: Optional[float] = None, **kwargs):
+        """
+        Sends one user message. Returns the ChatCompletion or, with stream=True,
+        an iterator of chunks. `deadline` is in seconds from now (default
+        self.deadline); TimeoutError is raised once it passes.
+        """
+        import openai
+        retryable = tuple(getattr(openai, name) for name in RETRYABLE_ERRORS)
+        expires = time.monotonic() + (deadline if deadline is not None else self.deadline)
+        # About 4 characters per token, plus the completion budget
+        estimate = len(prompt) // 4 + max_tokens
+        self._throttle(estimate, expires)
+        for attempt in range(self.max_retries + 1):
+            remaining = expires - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("LLM call deadline exceeded")
+            try:
+                response = self._client().chat.completions.create(
+                    model=model, messages=[{"role": "user", "content": prompt}], max_tokens=max_tokens,
+                    stream=stream, timeout=min(self.timeout, remaining), **kwargs)
+                break
+            except openai.APITimeoutError as e:
+                if time.monotonic() >= expires:
+                    raise TimeoutError("LLM call deadline exceeded") from e
+                error = e
+            except retryable as e:
+                error = e
+            if attempt == self.max_retries:
+                raise error
+            delay = self._backoff(attempt, error)
+            if time.monotonic() + delay >= expires:
+                raise TimeoutError("LLM call deadline exceeded") from error
+            with self._lock:
+                self.retries += 1
+            self.metrics.count("llm_retries", reason=type(error).__name__)
+            time.sleep(delay)
+        if stream:
+            return self._until(response, expires, estimate)
+        if self.tokens is not None and response.usage is not None:
+            self.tokens.adjust(response.usage.total_tokens - estimate)
+        return response
+
+    def _throttle(self, tokens: int, expires: float):
+        wait = self.requests.acquire(1, expires) if self.requests is not None else 0.0
+        if self.tokens is not None:
+            try:
+                wait = max(wait, self.tokens.acquire(tokens, expires))
+            except TimeoutError:
+                if self.requests is not None:
+                    self.requests.adjust(-1)
+                raise
+        if wait:
+            self.metrics.observe("llm_throttle_seconds", wait)
+            time.sleep(wait)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        # Full jitter: uniform up to the exponential bound, but never sooner than Retry-After
+        delay = self._rng.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            return max(delay, float(retry_after)) if retry_after else delay
+        except ValueError:  # An HTTP date instead of seconds
+            return delay
+
+    def _until(self, stream, expires: float, estimate: int) -> Iterator[Any]:
+        try:
+            for chunk in stream:
+                if time.monotonic() > expires:
+                    raise TimeoutError("LLM call deadline exceeded")
+                if self.tokens is not None and getattr(chunk, "usage", None) is not None:
+                    self.tokens.adjust(chunk.usage.total_tokens - estimate)
+                yield chunk
+        finally:
+            stream.close()
+
+
+_default: Optional[LLMClient] = None
+_default_lock = threading.Lock()
+
+
+def default_client() -> LLMClient:
+    """Process-wide client for agents that weren't given one."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = LLMClient()
+        return _default
@@ -1,14 +1,26 @@
 import os
 import json
-from openai import OpenAI
-import openai
-from typing import List, Dict, Any
-from toolbox import MathToolbox
-from virtualtoolcache import VirtualToolCache
-from dotenv import load_dotenv
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from typing import List, Dict, Any, Tuple, Optional, Iterator, Callable
+from toolbox import MathToolbox, CostLimitError
+from virtualtoolcache import VirtualToolCache, instantiate
+from sharedcache import SharedToolCache
+from llmcache import LLMResponseCache
+from llmclient import LLMClient, default_client
+from ruleplanner import RuleBasedPlanner
+from plandag import validate_plan, resolve_args, compile_plan, step_dependencies, PlanStreamParser, parse_keyed_plans, \
+    fuse_modular_powers
+from scheduler import DAGScheduler
+from batchplanner import MicroBatchPlanner
+from reliability import ReliableToolbox
+from corrections import CorrectionRules, FailureCache
+from metrics import NULL_METRICS, NullMetrics
 
 
 def setup_api_key():
+    from dotenv import load_dotenv  # Only needed by the script, not by importers
     load_dotenv()  # Load environment variables from .env file
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
@@ -16,50 +28,127 @@ def setup_api_key():
     os.environ["OPENAI_API_KEY"] = api_key
 
 class LLMAgent:
-    def __init__(self, model: str = "gpt-4"):
+    def __init__(self, model: str = "gpt-3.5-turbo", response_cache: Optional[LLMResponseCache] = None,
+                 metrics: Optional[NullMetrics] = None, stream: bool = False, client: Optional[LLMClient] = None,
+                 deadline: Optional[float] = None):
         self.model = model
+        self.response_cache = response_cache
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.stream = stream  # Whether stream_response streams the completion or fetches it whole
+        # Shared, pooled and rate-limited; also owns retries and timeouts
+        self.client = client if client is not None else default_client()
+        self.deadline = deadline  # Seconds per call, retries included; None uses the client's default
 
-    def generate_response(self, prompt: str) -> str:
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=150,
-        )
+    def generate_response(self, prompt: str, max_tokens: int = 150) -> str:
+        if self.response_cache is None:
+            return self._complete(prompt, max_tokens)
+        return self.response_cache.get_or_compute(self.model, prompt, lambda: self._complete(prompt, max_tokens))
+
+    def stream_response(self, prompt: str) -> Iterator[str]:
+        """Yields the response text in chunks as they arrive."""
+        if not self.stream:
+            return iter([self.generate_response(prompt)])
+        if self.response_cache is None:
+            return self._stream(prompt)
+        return self.response_cache.stream_or_compute(self.model, prompt, lambda: self._stream(prompt))
+
+    def _complete(self, prompt: str, max_tokens: int = 150) -> str:
+        start = time.perf_counter()
+        response = self.client.create(self.model, prompt, max_tokens=max_tokens, deadline=self.deadline)
+        if self.metrics.enabled:
+            self.metrics.observe("llm_request_seconds", time.perf_counter() - start, model=response.model)
+            if response.usage is not None:
+                self.metrics.observe("llm_prompt_tokens", response.usage.prompt_tokens, model=response.model)
+                self.metrics.observe("llm_completion_tokens", response.usage.completion_tokens, model=response.model)
         return response.choices[0].message.content
 
+    def _stream(self, prompt: str) -> Iterator[str]:
+        start = time.perf_counter()
+        stream = self.client.create(self.model, prompt, stream=True, deadline=self.deadline,
+                                    stream_options={"include_usage": True})
+        model = None
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                if model is None and self.metrics.enabled:
+                    self.metrics.observe("llm_first_token_seconds", time.perf_counter() - start, model=chunk.model)
+                model = chunk.model
+                yield chunk.choices[0].delta.content
+            if chunk.usage is not None and self.metrics.enabled:
+                self.metrics.observe("llm_prompt_tokens", chunk.usage.prompt_tokens, model=chunk.model)
+                self.metrics.observe("llm_completion_tokens", chunk.usage.completion_tokens, model=chunk.model)
+        if self.metrics.enabled:
+            self.metrics.observe("llm_request_seconds", time.perf_counter() - start, model=model)
+
 class PlannerAgent(LLMAgent):
-    def plan(self, problem: str) -> List[Dict[str, Any]]:
-        prompt = f"""
+    # Shared by the single-problem and batched prompts
+    INSTRUCTIONS = """
         You are a tool selection assistant. Your job is to break down the given math problem into calls to predefined mathematical tools.
 
         **Rules:**
-        1. Only use the following tools: SUM, PRODUCT, QUOTIENT, POWER, SQRT, AVG, ROUND, MODULO, ABS.
+        1. Only use the following tools: SUM, PRODUCT, QUOTIENT, POWER, SQRT, AVG, MIN, MAX, VARIANCE, ROUND, MODULO, ABS.
+           AVG, MIN, MAX, VARIANCE, and SUM with a single argument, take a list of numbers.
         2. Always map the problem correctly to the most appropriate tool(s).
         3. Ensure the JSON format follows: 
-           [{{"tool": "TOOL_NAME", "args": [arg1, arg2, ...]}}]
+           [{"tool": "TOOL_NAME", "args": [arg1, arg2, ...]}]
+        4. To use the result of an earlier step as an argument, write "$stepN" where N is that step's 0-based index.
+           The answer is the result of the last step.
 
         **Examples:**
         - Problem: "What is the square root of 9?"  
-          Output: [{{"tool": "SQRT", "args": [9]}}]
+          Output: [{"tool": "SQRT", "args": [9]}]
 
         - Problem: "What is the product of 5 and 3?"  
-          Output: [{{"tool": "PRODUCT", "args": [5, 3]}}]
+          Output: [{"tool": "PRODUCT", "args": [5, 3]}]
 
         - Problem: "Find the sum of 10 and 20."  
-          Output: [{{"tool": "SUM", "args": [10, 20]}}]
+          Output: [{"tool": "SUM", "args": [10, 20]}]
 
         - Problem: "What is the remainder when 15 is divided by 4?"  
-          Output: [{{"tool": "MODULO", "args": [15, 4]}}]
+          Output: [{"tool": "MODULO", "args": [15, 4]}]
+
+        - Problem: "What is the average of the squares of 3 and 4?"  
+          Output: [{"tool": "POWER", "args": [3, 2]}, {"tool": "POWER", "args": [4, 2]}, {"tool": "AVG", "args": [["$step0", "$step1"]]}]
+
+"""
+
+    def plan(self, problem: str, feedback: Optional[str] = None) -> List[Dict[str, Any]]:
+        return list(self.plan_stream(problem, feedback))
+
+    def plan_stream(self, problem: str, feedback: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the plan's steps as soon as each one is complete in the (streamed)
+        response. A response cut off by max_tokens yields the steps before the cut.
+        `feedback` says what was wrong with a rejected earlier plan.
+        """
+        parser = PlanStreamParser()
+        for chunk in self.stream_response(self.prompt(problem, feedback)):
+            yield from parser.feed(chunk)
+        parser.close()
 
+    def prompt(self, problem: str, feedback: Optional[str] = None) -> str:
+        rejected = f"        Your previous plan was rejected: {feedback}\n" if feedback else ""
+        return self.INSTRUCTIONS + f"""\
         **Your Turn:**  
         Problem: {problem}  
-        Provide only the JSON output without any explanations.
+{rejected}        Provide only the JSON output without any explanations.
+        """
+
+    def plan_batch(self, problems: List[str]) -> List[Optional[List[Dict[str, Any]]]]:
+        """
+        Plans several problems with one request. Returns a plan per problem, or
+        None where the response holds no well-formed plan for it.
+        """
+        # Room for a single plan's worth of tokens per problem
+        response = self.generate_response(self.batch_prompt(problems), max_tokens=min(150 * len(problems), 4096))
+        return parse_keyed_plans(response, len(problems))
+
+    def batch_prompt(self, problems: List[str]) -> str:
+        listing = "\n".join(f"        Problem {i}: {problem}" for i, problem in enumerate(problems))
+        return self.INSTRUCTIONS + f"""\
+        **Your Turn:**  
+{listing}
+        Provide only a JSON object mapping each problem's number to its plan, like {{"0": [...], "1": [...]}}, without any explanations.
         """
-        response = self.generate_response(prompt)
-        try:
-            return json.loads(response)  # Safe JSON parsing
-        except:
-            raise ValueError("Failed to parse plan")
 
 class ValidatorAgent:
     def validate(self, computed_result: Any, expected_result: Any) -> bool:
@@ -83,59 +172,407 @@ class ErrorCorrectionAgent(LLMAgent):
             raise ValueError("Failed to parse error correction response")
 
 class ExecutorAgent:
-    def __init__(self, toolbox: MathToolbox, error_corrector: ErrorCorrectionAgent):
+    def __init__(self, toolbox: MathToolbox, error_corrector: ErrorCorrectionAgent,
+                 correction_rules: Optional[CorrectionRules] = None, metrics: Optional[NullMetrics] = None):
         self.toolbox = toolbox
         self.error_corrector = error_corrector
+        self.correction_rules = correction_rules if correction_rules is not None else CorrectionRules(None)
+        self.metrics = metrics if metrics is not None else NULL_METRICS
 
-    def execute(self, tool_name: str, args: List[Any]):
+    def execute(self, tool_name: str, args: List[Any], recover: bool = True,
+                corrections: Optional[List[Callable[[bool], None]]] = None):
+        """The tool's result; on an error, the recovered result (see recover), or None if recover=False."""
         try:
             tool = self.toolbox.get_tool(tool_name)
             return tool(*args)
         except Exception as e:
-            print(f"Execution failed for {tool_name}({args}): {e}")
-            # Attempt error correction using AI
+            return self.recover(tool_name, args, e, corrections) if recover else None
+
+    def recover(self, tool_name: str, args: List[Any], error: Exception,
+                corrections: Optional[List[Callable[[bool], None]]] = None):
+        """
+        Handles a failed tool call; returns the corrected result or None. A
+        correction that ran is only learned from (or, for a learned rule, counted
+        as a success) once the answer it led to is known to be right: given a
+        `corrections` list, a callback taking whether the answer validated is
+        appended to it instead. Without one, running without an error counts.
+        """
+        self.metrics.count("tool_errors", tool=tool_name)
+        if isinstance(error, CostLimitError):
+            # Over budget: the same call would fail again, and an LLM round trip only adds latency
+            self.metrics.event("cost_limit", tool=tool_name, error=str(error))
+            return None
+        self.metrics.event("tool_failed", tool=tool_name, args=args, error=str(error))
+        # Reuse a correction learned from an earlier failure of the same kind
+        rule = self.correction_rules.lookup(tool_name, args, error)
+        if rule is not None:
+            key, corrected_tool, corrected_args = rule
+            self.metrics.event("learned_correction", tool=corrected_tool, args=corrected_args)
             try:
-                correction = self.error_corrector.correct_execution(tool_name, args, str(e))
-                corrected_tool = correction["tool"]
-                corrected_args = correction["args"]
-                print(f"Trying corrected tool: {corrected_tool}({corrected_args})")
-                return self.toolbox.get_tool(corrected_tool)(*corrected_args)
-            except Exception as correction_error:
-                print(f"Error correction also failed: {correction_error}")
-                return None
+                result = self.toolbox.get_tool(corrected_tool)(*corrected_args)
+                self._settle(corrections, lambda valid: self.correction_rules.record(key, valid))
+                return result
+            except Exception as rule_error:
+                self.correction_rules.record(key, False)
+                self.metrics.event("learned_correction_failed", tool=corrected_tool, error=str(rule_error))
+        # Attempt error correction using AI
+        try:
+            with self.metrics.span("error_correction"):
+                correction = self.error_corrector.correct_execution(tool_name, args, str(error))
+            corrected_tool = correction["tool"]
+            corrected_args = correction["args"]
+            self.metrics.event("llm_correction", tool=corrected_tool, args=corrected_args)
+            if not isinstance(corrected_args, list) or self.toolbox.check_plan([correction]):
+                raise ValueError(f"Correction doesn't fit {corrected_tool}'s signature")
+            result = self.toolbox.get_tool(corrected_tool)(*corrected_args)
+        except Exception as correction_error:
+            self.metrics.event("llm_correction_failed", tool=tool_name, error=str(correction_error))
+            return None
+        def learn(valid: bool):
+            if valid:
+                self.correction_rules.learn(tool_name, args, error, corrected_tool, corrected_args)
+        self._settle(corrections, learn)
+        return result
+
+    @staticmethod
+    def _settle(corrections: Optional[List[Callable[[bool], None]]], settle: Callable[[bool], None]):
+        if corrections is None:
+            settle(True)
+        else:
+            corrections.append(settle)
+
+def _runnable(step: Any, done: Dict[int, Any]) -> bool:
+    """Whether a streamed step is well-formed and every step it consumes has a result."""
+    return isinstance(step, dict) and "tool" in step and isinstance(step.get("args"), list) \
+        and step_dependencies([step])[0] <= done.keys()
 
 class MultiAgentSystem:
-    def __init__(self):
-        self.toolbox = MathToolbox()
-        self.planner = PlannerAgent()
-        self.error_corrector = ErrorCorrectionAgent()
-        self.executor = ExecutorAgent(self.toolbox, self.error_corrector)
+    def __init__(self, cache_file: Optional[str] = None, llm_cache_file: Optional[str] = "llm_responses.sqlite",
+                 rules_file: Optional[str] = "correction_rules.json", cache_backend: str = "json",
+                 metrics: Optional[NullMetrics] = None, stream_plans: bool = False, plan_batch_size: int = 1,
+                 plan_batch_wait: float = 0.02, llm_client: Optional[LLMClient] = None,
+                 planner_model: str = "gpt-3.5-turbo", corrector_model: str = "gpt-3.5-turbo"):
+        """
+        cache_backend="json" keeps the virtual tools in memory, persisted to cache_file
+        (default virtual_tools.json). "sqlite" shares them with every other process on
+        the host through cache_file (default virtual_tools.sqlite, seeded from
+        virtual_tools.json on first use); use it for worker pools.
+
+        Pass a metrics.Metrics to collect stage timings, tool and LLM metrics and
+        structured events; by default nothing is recorded.
+
+        With stream_plans, LLM plans are streamed and each step runs as soon as it
+        has arrived, instead of after the whole response. That helps slow models
+        with long plans; decoding the stream costs client CPU, which costs
+        throughput when responses are quick, so it is off by default.
+
+        plan_batch_size > 1 packs up to that many concurrent planner requests,
+        arriving within plan_batch_wait seconds of each other, into one prompt.
+
+        llm_client sets connection pooling, rate limits, retries and deadlines for
+        the LLM agents (default: an unlimited LLMClient with default retries).
+        """
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        # UNRELIABLE_* tools are voted on and circuit-broken before any LLM correction
+        self.toolbox = ReliableToolbox(MathToolbox(metrics=self.metrics))
+        # Shared by every LLM agent; None disables response caching
+        self.llm_cache = LLMResponseCache(llm_cache_file) if llm_cache_file else None
+        self.rule_planner = RuleBasedPlanner()
+        self.llm_client = llm_client if llm_client is not None else LLMClient(metrics=self.metrics)
+        self.planner = PlannerAgent(planner_model, self.llm_cache, self.metrics, stream_plans, self.llm_client)
+        self.batch_planner = MicroBatchPlanner(self.planner, plan_batch_size, plan_batch_wait, self.metrics) \
+            if plan_batch_size > 1 else None
+        self.error_corrector = ErrorCorrectionAgent(corrector_model, self.llm_cache, self.metrics, client=self.llm_client)
+        self.correction_rules = CorrectionRules(rules_file, self.metrics)
+        self.failure_cache = FailureCache()  # Problems that failed recently aren't re-planned until their backoff ends
+        self.executor = ExecutorAgent(self.toolbox, self.error_corrector, self.correction_rules, self.metrics)
+        self.scheduler = DAGScheduler(self.executor)
         self.validator = ValidatorAgent()
-        self.virtual_tool_cache = VirtualToolCache()
+        self._compiled: Dict[str, Any] = {}  # cache key -> (plan, compiled plan)
+        on_evict = lambda key: self._compiled.pop(key, None)
+        if cache_backend == "sqlite":
+            self.virtual_tool_cache = SharedToolCache(cache_file or "virtual_tools.sqlite", on_evict=on_evict,
+                                                      seed_file="virtual_tools.json" if cache_file is None else None)
+        elif cache_backend == "json":
+            # Opened from the snapshot's index: a cached answer doesn't wait for the whole file to be parsed
+            self.virtual_tool_cache = VirtualToolCache(cache_file or "virtual_tools.json", on_evict=on_evict, lazy_load=True)
+        else:
+            raise ValueError(f"Unknown cache backend '{cache_backend}'")
+        if self.metrics.enabled:
+            self.metrics.collectors.append(self._gauges)
 
     def solve(self, problem: str, expected_output) -> Dict[str, Any]:
-        # Step 1: Check for a virtual tool
-        if self.virtual_tool_cache.exists(problem):
-            print(f"Using cached virtual tool for: {problem}")
-            plan = self.virtual_tool_cache.get_virtual_tool(problem)
+        failure_key = self.failure_cache.key(problem, expected_output)
+        failed = self.failure_cache.get(failure_key)
+        if failed is not None:
+            return failed
+        # Exceptions (LLM outages, rate limits, timeouts) propagate unrecorded: they say nothing about the problem
+        with self.metrics.span("solve"):
+            result = self._solve(problem, expected_output, self._local_plan(problem))
+        self.failure_cache.record(failure_key, result)
+        return result
+
+    def _solve(self, problem: str, expected_output, local) -> Dict[str, Any]:
+        """Solves with the result of _local_plan (None: plan with the LLM)."""
+        done: Dict[int, Any] = {}
+        if local is not None:
+            plan, compiled, values, cache_key = local
         else:
-            plan = self.planner.plan(problem)
+            plan, done = self._plan_streamed(problem)
+            problems = self._plan_problems(plan)
+            if problems:
+                # Caught before any LLM correction (and, unless streamed, any execution); re-plan once, saying what was wrong
+                self.metrics.event("plan_rejected", problem=problem, problems=problems)
+                plan, done = self._plan_streamed(problem, "; ".join(problems))
+                problems = self._plan_problems(plan)
+            if problems:
+                return {"error": f"Invalid plan: {'; '.join(problems)}"}
+            compiled, values, cache_key = None, [], None
+
+        try:
+            order = validate_plan(plan)
+        except ValueError as e:
+            return {"error": f"Invalid plan: {e}"}
+
+        # POWER feeding MODULO runs as modular exponentiation; the plan is cached as planned
+        run = fuse_modular_powers(plan)
+        if run is not plan:
+            order = validate_plan(run)
+        # Wide plans with heavy or unreliable steps go to the parallel scheduler
+        parallel = self.scheduler.parallelizable(run)
+        result = None
+        with self.metrics.span("execute"):
+            if compiled is not None and not parallel:
+                try:
+                    result = compiled(values)
+                except CostLimitError as e:
+                    # Re-running would only hit the same limit (or timeout) again
+                    self.metrics.event("cost_limit", problem=problem, error=str(e))
+                    return {"error": "Execution failed"}
+                except Exception:
+                    result = None  # Re-run step by step so error correction gets a chance
+            corrections: List[Callable[[bool], None]] = []
+            if result is None:
+                if parallel and not done:
+                    result = self.scheduler.run(run, order, corrections=corrections)
+                else:
+                    result = self._execute_plan(run, order, done, corrections)
+        if result is None:
+            return {"error": "Execution failed"}
+        outcome = self._validate_and_cache(problem, plan, result, expected_output, cache_key)
+        for settle in corrections:  # Error corrections are only trusted if they led to the right answer
+            settle("result" in outcome)
+        return outcome
+
+    def _plan_streamed(self, problem: str, feedback: Optional[str] = None) \
+            -> Tuple[List[Dict[str, Any]], Dict[int, Any]]:
+        """
+        Plans with the LLM and returns (plan, results of the steps already run).
+        With stream_plans, each step runs as soon as it and the steps it consumes
+        have arrived, while the rest of the plan is still streaming; a step that
+        fails stops this, and is only retried (with error correction) once the
+        whole plan has passed its checks. Otherwise nothing runs here. Re-plans
+        (with feedback) skip the micro-batcher.
+        """
+        plan: List[Dict[str, Any]] = []
+        done: Dict[int, Any] = {}
+        failed = False
+        start = time.perf_counter()
+        with self.metrics.span("plan"):
+            steps = (self.batch_planner or self.planner).plan_stream(problem) if feedback is None \
+                else self.planner.plan_stream(problem, feedback)
+            if not self.planner.stream or (feedback is None and self.batch_planner is not None):
+                return list(steps), done  # The plan arrives whole; it is checked before anything runs
+            for step in steps:
+                plan.append(step)
+                progress = True
+                while progress and not failed:
+                    progress = False
+                    for i, pending in enumerate(plan):
+                        if i in done or not _runnable(pending, done) or self.toolbox.check_plan(plan, [i]):
+                            continue
+                        args = resolve_args(pending["args"], done)
+                        # Big-integer steps wait for the whole plan, which may turn them into modular ones
+                        if self.toolbox.estimate_bits(pending["tool"], args) > self.scheduler.process_threshold_bits:
+                            continue
+                        # No error correction yet: the rest of the plan may still be rejected
+                        result = self.executor.execute(pending["tool"], args, recover=False)
+                        if result is None:
+                            failed = True
+                            break
+                        if not done:
+                            self.metrics.observe("first_step_seconds", time.perf_counter() - start)
+                        done[i] = result
+                        progress = True
+        return plan, done
+
+    def _plan_problems(self, plan: List[Dict[str, Any]]) -> List[str]:
+        """Why an LLM plan can't run: a malformed DAG, or steps that don't fit their tools' signatures."""
+        try:
+            validate_plan(plan)
+        except ValueError as e:
+            return [str(e)]
+        return self.toolbox.check_plan(plan)
 
-        results = []
-        for step in plan:
-            result = self.executor.execute(step["tool"], step["args"])
-            if result is None: 
-                return {"error": "Execution failed"}
-            results.append(result)
+    def _local_plan(self, problem: str):
+        """Plans without the LLM; returns (plan, compiled plan or None, slot values, cache key or None) or None."""
+        # Step 1: Recognizable shapes are planned locally, ahead of possibly wrong cached plans
+        with self.metrics.span("rule_plan"):
+            plan = self.rule_planner.plan(problem)
+        if plan is not None:
+            return plan, None, [], None
+        # Step 2: Check for a virtual tool
+        with self.metrics.span("cache_lookup"):
+            entry = self.virtual_tool_cache.lookup(problem)
+        self.metrics.count("cache_lookups", result="miss" if entry is None else "hit")
+        if entry is None:
+            return None
+        key, cached_plan, values = entry
+        self.metrics.event("cache_hit", problem=problem, key=key)
+        plan = instantiate(cached_plan, values) if values else cached_plan
+        return plan, self._compiled_plan(key, cached_plan), values, key
 
-        # Validate computed result against expected result
-        if self.validator.validate(results[-1], expected_output):
+    def _validate_and_cache(self, problem: str, plan: List[Dict[str, Any]], result, expected_output,
+                            cache_key: Optional[str] = None) -> Dict[str, Any]:
+        with self.metrics.span("validate"):
+            # Validate computed result against expected result
+            valid = self.validator.validate(result, expected_output)
+            if cache_key is not None and self.virtual_tool_cache.record_validation(cache_key, valid):
+                self.metrics.event("cache_invalidated", key=cache_key)
+        if valid:
             # Cache successful tool sequence
-            if not self.virtual_tool_cache.exists(problem):
-                self.virtual_tool_cache.add_virtual_tool(problem, plan)
-            return {"result": results[-1]}
-        else:
-            return {"error": "Validation failed"}
+            with self.metrics.span("cache_insert"):
+                if not self.virtual_tool_cache.exists(problem):
+                    self.virtual_tool_cache.add_virtual_tool(problem, plan)
+            return {"result": result}
+        self.metrics.event("validation_failed", problem=problem, result=result, expected=expected_output)
+        return {"error": "Validation failed"}
+
+    def _execute_plan(self, plan: List[Dict[str, Any]], order: List[int], done: Optional[Dict[int, Any]] = None,
+                      corrections: Optional[List[Callable[[bool], None]]] = None):
+        """
+        Runs the steps in dependency order and returns the last step's result, or
+        None. Steps in done are skipped. See ExecutorAgent.recover for corrections.
+        """
+        results = dict(done or {})
+        for i in order:
+            if i in results:
+                continue
+            step = plan[i]
+            result = self.executor.execute(step["tool"], resolve_args(step["args"], results), corrections=corrections)
+            if result is None:
+                return None
+            results[i] = result
+        return results[len(plan) - 1]
+
+    def _gauges(self) -> Dict[str, float]:
+        """Cache and planner state, exported alongside the metrics."""
+        cache = self.virtual_tool_cache.stats()
+        gauges = {
+            "virtual_tool_cache_entries": cache["entries"],
+            "virtual_tool_cache_hit_ratio": cache["hit_ratio"],
+            "rule_planner_coverage": self.rule_planner.stats()["coverage"],
+        }
+        if self.llm_cache is not None:
+            llm = self.llm_cache.stats()
+            lookups = llm["hits"] + llm["misses"]
+            gauges["llm_cache_hit_ratio"] = llm["hits"] / lookups if lookups else 0.0
+        return gauges
+
+    def _compiled_plan(self, key: str, plan: List[Dict[str, Any]]):
+        """Compiles each cached plan once; plans that can't be compiled run step by step."""
+        compiled = self._compiled.get(key)
+        # Another process sharing the cache may have replaced the plan under the same key
+        if compiled is None or compiled[0] != plan:
+            try:
+                compiled = (plan, compile_plan(plan, self.toolbox))
+            except ValueError:
+                compiled = (plan, None)
+            self._compiled[key] = compiled
+        return compiled[1]
+
+    @cached_property
+    def batch_executor(self):
+        """Vectorized executor for solve_many; created (and NumPy imported) on first use."""
+        from batchexec import BatchExecutor
+        return BatchExecutor(self.toolbox, metrics=self.metrics)
+
+    async def asolve(self, problem: str, expected_output) -> Dict[str, Any]:
+        """Async version of solve; the blocking LLM calls run on a worker thread."""
+        import asyncio  # Imported on use; plain solve() callers never need it
+        return await asyncio.to_thread(self.solve, problem, expected_output)
+
+    async def asolve_many(self, problems: List[Tuple[str, Any]], max_concurrency: int = 8,
+                          latencies: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """
+        Solves (problem, expected_output) pairs with at most max_concurrency
+        requests in flight. Results are returned in input order; a problem whose
+        plan can't be obtained yields {"error": ...} instead of failing the batch.
+
+        Problems that can be planned locally are first executed together by the
+        vectorized BatchExecutor; only misses and failed executions (which may
+        need LLM error correction) go through the concurrent per-problem path.
+
+        If a latencies list is given, it is filled with the seconds from the call
+        until each problem's result was ready, in input order.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        done_at: List[float] = [0.0] * len(problems)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(problems)
+        local: Dict[int, Any] = {}  # Index -> _local_plan result, so the per-problem path doesn't look up twice
+
+        def _run_batch():
+            batch = []
+            for index, (problem, expected) in enumerate(problems):
+                results[index] = self.failure_cache.get(self.failure_cache.key(problem, expected))
+                if results[index] is None:
+                    local[index] = self._local_plan(problem)
+                    if local[index] is not None:
+                        batch.append(index)
+            with self.metrics.span("batch_execute"):
+                outcomes = self.batch_executor.execute_many([fuse_modular_powers(local[index][0]) for index in batch])
+            for index, outcome in zip(batch, outcomes):
+                if not isinstance(outcome, Exception):
+                    plan, cache_key = local[index][0], local[index][3]
+                    problem, expected = problems[index]
+                    results[index] = self._validate_and_cache(problem, plan, outcome, expected, cache_key)
+                    self.failure_cache.record(self.failure_cache.key(problem, expected), results[index])
+
+        # Cache loads, forked execution and validation block; keep them off the event loop
+        await loop.run_in_executor(None, _run_batch)
+        batch_done = time.perf_counter()
+        for index, result in enumerate(results):
+            if result is not None:
+                done_at[index] = batch_done
+
+        def _solve(index):
+            problem, expected = problems[index]
+            try:
+                with self.metrics.span("solve"):
+                    result = self._solve(problem, expected, local[index])
+                self.failure_cache.record(self.failure_cache.key(problem, expected), result)
+                return result
+            except Exception as e:
+                return {"error": str(e)}
+            finally:
+                done_at[index] = time.perf_counter()
+
+        remaining = [index for index, result in enumerate(results) if result is None]
+        with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+            solved = await asyncio.gather(*(loop.run_in_executor(pool, _solve, index) for index in remaining))
+        for index, result in zip(remaining, solved):
+            results[index] = result
+        if latencies is not None:
+            latencies[:] = [t - start for t in done_at]
+        return results
+
+    def solve_many(self, problems: List[Tuple[str, Any]], max_concurrency: int = 8,
+                   latencies: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """Blocking wrapper around asolve_many."""
+        import asyncio
+        return asyncio.run(self.asolve_many(problems, max_concurrency, latencies))
 
 if __name__ == "__main__":
     setup_api_key()  # Replace with your key
@@ -0,0 +1,193 @@
+import json
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class LatencyHistogram:
+    """
+    Constant-memory latency histogram. Buckets grow geometrically by `growth`
+    from `min_value` seconds, so percentiles are accurate to within that factor
+    no matter how many samples are recorded.
+    """
+    def __init__(self, min_value: float = 1e-6, growth: float = 1.05):
+        self.min_value = min_value
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        bucket = 0 if seconds <= self.min_value else int(math.log(seconds / self.min_value) / self._log_growth) + 1
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket holding the p-th percentile (0 < p <= 100)."""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * p / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.min_value * self.growth ** bucket, self.max)
+        return self.max
+
+    def summary(self, percentiles: List[float] = (50, 90, 99, 99.9)) -> Dict[str, float]:
+        out = {"count": self.count, "mean": self.total / self.count if self.count else 0.0, "max": self.max}
+        for p in percentiles:
+            out[f"p{p:g}"] = self.percentile(p)
+        return out
+
+
+class _Span:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics: "Metrics", stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe("stage_seconds", time.perf_counter() - self.start, stage=self.stage)
+        if exc_type is not None:
+            self.metrics.count("stage_errors", stage=self.stage)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class NullMetrics:
+    """Instrumentation that records nothing; the default, so disabled metrics cost one no-op call per site."""
+    enabled = False
+    _span = _NullSpan()
+
+    def span(self, stage: str):
+        return self._span
+
+    def count(self, name: str, value: float = 1, **labels):
+        pass
+
+    def observe(self, name: str, value: float, **labels):
+        pass
+
+    def event(self, name: str, **fields):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+class Metrics(NullMetrics):
+    """
+    Collects counters, latency histograms and structured events for the solve
+    pipeline. Metric names get labels as keyword arguments:
+
+        metrics.count("tool_calls", tool="SUM")
+        with metrics.span("plan"):  # Histogram stage_seconds{stage="plan"}
+            ...
+
+    Events (cache hits, failed tool calls, corrections, ...) are counted as
+    events_total{event=...} and passed as dicts to every listener, e.g.
+    print_event. Collectors are called at export time and return extra gauges,
+    such as cache sizes and hit ratios. Export with to_prometheus() or to_json().
+    """
+    enabled = True
+
+    def __init__(self, listeners: Optional[List[Callable[[Dict[str, Any]], None]]] = None, prefix: str = "mathbot"):
+        self.prefix = prefix
+        self.listeners = list(listeners or [])
+        self.collectors: List[Callable[[], Dict[str, float]]] = []
+        self.counters: Dict[Tuple[str, Tuple], float] = {}
+        self.histograms: Dict[Tuple[str, Tuple], LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def span(self, stage: str) -> _Span:
+        return _Span(self, stage)
+
+    def count(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = LatencyHistogram()
+            histogram.record(value)
+
+    def event(self, name: str, **fields):
+        self.count("events", event=name)
+        record = {"event": name, "time": time.time(), **fields}
+        for listener in self.listeners:
+            listener(record)
+
+    def _gauges(self) -> Dict[str, float]:
+        gauges: Dict[str, float] = {}
+        for collect in self.collectors:
+            gauges.update(collect())
+        return gauges
+
+    def to_json(self) -> Dict[str, Any]:
+        def _name(name, labels):
+            return name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else "")
+        with self._lock:
+            return {
+                "counters": {_name(name, labels): value for (name, labels), value in self.counters.items()},
+                "histograms": {_name(name, labels): h.summary() for (name, labels), h in self.histograms.items()},
+                "gauges": self._gauges(),
+            }
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format; histograms are exported as summaries."""
+        def _labels(labels, extra=()):
+            pairs = [f'{k}="{_escape(v)}"' for k, v in tuple(labels) + tuple(extra)]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {self.prefix}_{name}_total counter")
+                for (metric, labels), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(f"{self.prefix}_{name}_total{_labels(labels)} {value:g}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {self.prefix}_{name} summary")
+                for (metric, labels), h in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    for q in (0.5, 0.9, 0.99):
+                        lines.append(f"{self.prefix}_{name}{_labels(labels, [('quantile', q)])} {h.percentile(q * 100):g}")
+                    lines.append(f"{self.prefix}_{name}_sum{_labels(labels)} {h.total:g}")
+                    lines.append(f"{self.prefix}_{name}_count{_labels(labels)} {h.count}")
+            for name, value in sorted(self._gauges().items()):
+                lines.append(f"# TYPE {self.prefix}_{name} gauge")
+                lines.append(f"{self.prefix}_{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def print_event(record: Dict[str, Any]):
+    """Listener that prints each event as one JSON line."""
+    print(json.dumps(record, default=str))
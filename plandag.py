@@ -0,0 +1,242 @@
+import json
+import re
+from typing import List, Dict, Any, Callable, Optional, Sequence, Set
+from virtualtoolcache import SLOT_PATTERN
+
+# "$step2" refers to the result of plan[2]; "$0" style slots belong to VirtualToolCache templates
+STEP_REF_PATTERN = re.compile(r"^\$step(\d+)$")
+# Start of one problem's plan in a batched planner response
+KEYED_PLAN_PATTERN = re.compile(r'"(\d+)"\s*:\s*\[')
+
+
+def _refs(arg: Any) -> Set[int]:
+    if isinstance(arg, list):
+        return set().union(*(_refs(a) for a in arg)) if arg else set()
+    if isinstance(arg, str):
+        match = STEP_REF_PATTERN.match(arg)
+        if match:
+            return {int(match.group(1))}
+    return set()
+
+
+def step_dependencies(plan: List[Dict[str, Any]]) -> List[Set[int]]:
+    """Indices of the steps each step consumes results from."""
+    return [_refs(step.get("args", [])) for step in plan]
+
+
+def validate_plan(plan: List[Dict[str, Any]]) -> List[int]:
+    """
+    Checks that the plan is a well-formed DAG and returns an execution order.
+    Raises ValueError for malformed steps, dangling references and cycles.
+    """
+    if not isinstance(plan, list) or not plan:
+        raise ValueError("Plan must be a non-empty list of steps")
+    for i, step in enumerate(plan):
+        if not isinstance(step, dict) or "tool" not in step or not isinstance(step.get("args"), list):
+            raise ValueError(f"Step {i} must look like {{\"tool\": ..., \"args\": [...]}}")
+    deps = step_dependencies(plan)
+    for i, refs in enumerate(deps):
+        for ref in refs:
+            if ref >= len(plan):
+                raise ValueError(f"Step {i} references missing step {ref}")
+
+    # Kahn's algorithm, preferring plan order among ready steps
+    remaining = [len(refs) for refs in deps]
+    dependents: List[List[int]] = [[] for _ in plan]
+    for i, refs in enumerate(deps):
+        for ref in refs:
+            dependents[ref].append(i)
+    ready = [i for i, n in enumerate(remaining) if n == 0]
+    order = []
+    while ready:
+        i = ready.pop(0)
+        order.append(i)
+        for j in dependents[i]:
+            remaining[j] -= 1
+            if remaining[j] == 0:
+                ready.append(j)
+        ready.sort()
+    if len(order) != len(plan):
+        raise ValueError("Plan contains a cycle")
+    return order
+
+
+def resolve_args(arg: Any, results: Dict[int, Any]):
+    """Replaces "$stepN" references with the results of earlier steps."""
+    if isinstance(arg, list):
+        return [resolve_args(a, results) for a in arg]
+    if isinstance(arg, str):
+        match = STEP_REF_PATTERN.match(arg)
+        if match:
+            return results[int(match.group(1))]
+    return arg
+
+
+def fuse_modular_powers(plan: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Rewrites POWER steps whose only consumer is MODULO(<that power>, m) into
+    POWMOD(a, b, m), so the full power is never materialized. The MODULO step is
+    kept (reducing twice gives the same result), so step numbering doesn't
+    change. Returns the plan unchanged when there's nothing to fuse.
+    """
+    deps = step_dependencies(plan)
+    consumers: Dict[int, List[int]] = {}
+    for j, refs in enumerate(deps):
+        for ref in refs:
+            consumers.setdefault(ref, []).append(j)
+    fused = None
+    for i, step in enumerate(plan):
+        if step.get("tool") != "POWER" or len(step.get("args", [])) != 2 or len(consumers.get(i, [])) != 1:
+            continue
+        j = consumers[i][0]
+        modulo = plan[j]
+        args = modulo.get("args", [])
+        if modulo.get("tool") != "MODULO" or len(args) != 2 or args[0] != f"$step{i}" or i in _refs(args[1]):
+            continue
+        fused = fused or list(plan)
+        fused[i] = {"tool": "POWMOD", "args": list(step["args"]) + [args[1]]}
+    if fused is None:
+        return plan
+    try:
+        validate_plan(fused)  # m may be another step's result; it must not depend on the power
+    except ValueError:
+        return plan
+    return fused
+
+
+def _arg_source(arg: Any, constants: Dict[str, Any]) -> str:
+    """Python expression for an argument inside the generated plan function."""
+    if isinstance(arg, list):
+        return "[" + ", ".join(_arg_source(a, constants) for a in arg) + "]"
+    if isinstance(arg, str):
+        match = STEP_REF_PATTERN.match(arg)
+        if match:
+            return f"r{int(match.group(1))}"
+        match = SLOT_PATTERN.match(arg)
+        if match:
+            return f"values[{int(match.group(1))}]"
+    name = f"c{len(constants)}"
+    constants[name] = arg
+    return name
+
+
+def compile_plan(plan: List[Dict[str, Any]], toolbox) -> Callable[[Sequence[Any]], Any]:
+    """
+    Compiles a plan once into a callable taking the template slot values. Tool
+    lookups, argument resolution and ordering are done up front and the steps
+    are generated as straight-line Python, so repeated executions only pay for
+    the tool calls themselves. Tool errors propagate.
+    """
+    plan = fuse_modular_powers(plan)
+    order = validate_plan(plan)
+    namespace: Dict[str, Any] = {}
+    lines = ["def run(values=()):"]
+    for i in order:
+        namespace[f"t{i}"] = toolbox.get_tool(plan[i]["tool"])
+        args = ", ".join(_arg_source(a, namespace) for a in plan[i]["args"])
+        lines.append(f"    r{i} = t{i}({args})")
+    lines.append(f"    return r{len(plan) - 1}")
+    exec("\n".join(lines), namespace)
+    return namespace["run"]
+
+
+class PlanStreamParser:
+    """
+    Incremental parser for a plan streamed as a JSON array. feed() takes the
+    next chunk of text and returns the steps whose objects closed in it, so
+    they can run before the rest of the response arrives. Text before the
+    opening "[" (e.g. a ```json fence) is skipped. A response cut off mid-step
+    (max_tokens) still yields every step completed before the cut.
+    """
+    def __init__(self):
+        self.steps: List[Dict[str, Any]] = []
+        self.complete = False  # The closing "]" was seen
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buffer: List[str] = []
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        new: List[Dict[str, Any]] = []
+        for ch in chunk:
+            if self.complete:
+                break
+            if not self._started:
+                if ch == "[":
+                    self._started = True
+                    self._depth = 1
+                continue
+            if self._in_string:
+                self._buffer.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if self._depth == 1:
+                # Between steps only separators and the closing bracket may appear
+                if ch == "{":
+                    self._depth = 2
+                    self._buffer = [ch]
+                elif ch == "]":
+                    self._depth = 0
+                    self.complete = True
+                elif not (ch == "," or ch.isspace()):
+                    raise ValueError("Failed to parse plan")
+                continue
+            self._buffer.append(ch)
+            if ch == '"':
+                self._in_string = True
+            elif ch in "[{":
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 1:
+                    try:
+                        step = json.loads("".join(self._buffer))
+                    except json.JSONDecodeError:
+                        raise ValueError("Failed to parse plan")
+                    self.steps.append(step)
+                    new.append(step)
+        return new
+
+    def close(self) -> List[Dict[str, Any]]:
+        """All parsed steps; raises ValueError when a cut-off response held no complete step."""
+        if not self.steps and not self.complete:
+            raise ValueError("Failed to parse plan")
+        return self.steps
+
+
+def parse_keyed_plans(text: str, count: int) -> List[Optional[List[Dict[str, Any]]]]:
+    """
+    Splits a batched planner response, a JSON object {"0": plan, "1": plan, ...},
+    into one plan per problem. Entries that are missing or not a valid plan come
+    back as None. If the object itself is malformed (e.g. cut off), every plan
+    that is still a complete array is recovered.
+    """
+    try:
+        keyed = json.loads(text[text.index("{"):text.rindex("}") + 1])
+        if not isinstance(keyed, dict):
+            raise ValueError
+    except ValueError:  # Also covers JSONDecodeError and a missing brace
+        keyed = {}
+        for match in KEYED_PLAN_PATTERN.finditer(text):
+            parser = PlanStreamParser()
+            try:
+                parser.feed(text[match.end() - 1:])
+            except ValueError:
+                continue
+            if parser.complete:
+                keyed.setdefault(match.group(1), parser.steps)
+    plans: List[Optional[List[Dict[str, Any]]]] = []
+    for i in range(count):
+        plan = keyed.get(str(i))
+        try:
+            validate_plan(plan)
+        except ValueError:
+            plan = None
+        plans.append(plan)
+    return plans
@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+# Reliable tool to fall back to once an unreliable tool's circuit breaker trips
+RELIABLE_EQUIVALENTS = {
+    "UNRELIABLE_SUM": "SUM",
+    "UNRELIABLE_PRODUCT": "PRODUCT",
+}
+
+
+class CircuitBreaker:
+    """Rolling fault rate over the last `window` attempts; opens for `cooldown` seconds past `threshold`."""
+    def __init__(self, window: int = 50, threshold: float = 0.3, min_calls: int = 10, cooldown: float = 30.0):
+        self.window = window
+        self.threshold = threshold
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.outcomes: Deque[bool] = deque(maxlen=window)  # True = faulty attempt
+        self.opened_at: Optional[float] = None
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def is_open(self) -> bool:
+        if self.opened_at is None:
+            return False
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            # Give the tool another chance with a fresh window
+            self.opened_at = None
+            self.outcomes.clear()
+            return False
+        return True
+
+    def record(self, faulty: bool):
+        self.outcomes.append(faulty)
+        if len(self.outcomes) >= self.min_calls and self.error_rate >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class ReliableToolbox:
+    """
+    Wraps a MathToolbox so that UNRELIABLE_* tools are called redundantly and
+    answered by majority vote: a result is accepted once `quorum` attempts agree,
+    trying at most `max_attempts` times. Raised errors and outvoted (silently
+    wrong) results count as faults for the tool's circuit breaker; while it is
+    open, calls are rerouted to the reliable equivalent. If no majority is
+    reached the call raises, and only then does ErrorCorrectionAgent get involved.
+
+    Every other attribute is forwarded to the wrapped toolbox, so this can be
+    used wherever a MathToolbox is expected.
+    """
+    def __init__(self, toolbox, quorum: int = 2, max_attempts: int = 5, **breaker_options):
+        self.toolbox = toolbox
+        self.quorum = quorum
+        self.max_attempts = max_attempts
+        self.breakers = {name: CircuitBreaker(**breaker_options) for name in RELIABLE_EQUIVALENTS}
+        self.counters = {name: {"calls": 0, "attempts": 0, "faults": 0, "rerouted": 0, "no_majority": 0}
+                         for name in RELIABLE_EQUIVALENTS}
+        self._wrappers: Dict[str, Callable] = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.toolbox, name)
+
+    def get_tool(self, name: str) -> Callable:
+        if name not in RELIABLE_EQUIVALENTS:
+            return self.toolbox.get_tool(name)
+        if name not in self._wrappers:
+            self._wrappers[name] = lambda *args: self.call(name, list(args))
+        return self._wrappers[name]
+
+    def call(self, name: str, args: List[Any]):
+        breaker = self.breakers[name]
+        with self._lock:
+            self.counters[name]["calls"] += 1
+            rerouted = breaker.is_open()
+            if rerouted:
+                self.counters[name]["rerouted"] += 1
+        if rerouted:
+            return self.toolbox.get_tool(RELIABLE_EQUIVALENTS[name])(*args)
+
+        tool = self.toolbox.get_tool(name)
+        tallies: List[Tuple[Any, int]] = []  # (value, votes); values are compared with ==
+        attempts: List[Tuple[bool, Any]] = []  # (succeeded, value or error)
+        winner = None
+        for _ in range(self.max_attempts):
+            try:
+                value = tool(*args)
+            except Exception as e:
+                attempts.append((False, e))
+                continue
+            attempts.append((True, value))
+            for k, (seen, votes) in enumerate(tallies):
+                if seen == value:
+                    tallies[k] = (seen, votes + 1)
+                    break
+            else:
+                tallies.append((value, 1))
+            best = max(tallies, key=lambda tally: tally[1])
+            if best[1] >= self.quorum:
+                winner = best
+                break
+
+        with self._lock:
+            counters = self.counters[name]
+            counters["attempts"] += len(attempts)
+            for succeeded, value in attempts:
+                faulty = not succeeded or winner is None or value != winner[0]
+                counters["faults"] += faulty
+                breaker.record(faulty)
+            if winner is None:
+                counters["no_majority"] += 1
+        if winner is None:
+            errors = [str(value) for succeeded, value in attempts if not succeeded]
+            raise ValueError(f"No majority for {name} after {len(attempts)} attempts"
+                             + (f": {errors[-1]}" if errors else ""))
+        return winner[0]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-tool call counters, rolling error rate and circuit breaker state."""
+        with self._lock:
+            return {name: {**self.counters[name],
+                           "error_rate": self.breakers[name].error_rate,
+                           "breaker": "open" if self.breakers[name].is_open() else "closed"}
+                    for name in RELIABLE_EQUIVALENTS}
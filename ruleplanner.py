@@ -0,0 +1,70 @@
+import re
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+NUMBER = r"-?\d+(?:\.\d+)?"
+NUM = f"({NUMBER})"  # Captured operand
+NUMBER_PATTERN = re.compile(NUMBER)
+# Optional lead-in and trailing punctuation around every recognized shape
+PREFIX = r"\s*(?:(?:what\s+is|what's|find|compute|calculate)\s+)?(?:the\s+)?"
+SUFFIX = r"\s*[?.!]?\s*"
+
+
+def _number(literal: str):
+    return float(literal) if "." in literal else int(literal)
+
+
+def _binary(tool: str) -> Callable[[Tuple[str, ...]], List[Dict[str, Any]]]:
+    return lambda groups: [{"tool": tool, "args": [_number(groups[0]), _number(groups[1])]}]
+
+
+def _unary(tool: str) -> Callable[[Tuple[str, ...]], List[Dict[str, Any]]]:
+    return lambda groups: [{"tool": tool, "args": [_number(groups[0])]}]
+
+
+def _average(groups: Tuple[str, ...]) -> List[Dict[str, Any]]:
+    return [{"tool": "AVG", "args": [[_number(n) for n in NUMBER_PATTERN.findall(groups[0])]]}]
+
+
+# (rule name, problem shape, plan builder). Order matters: "remainder when X is
+# divided by Y" must be tried before "X divided by Y".
+RULES = [
+    ("sum", rf"(?:sum\s+of\s+{NUM}\s+and\s+{NUM}|{NUM}\s+plus\s+{NUM})", _binary("SUM")),
+    ("product", rf"(?:product\s+of\s+{NUM}\s+and\s+{NUM}|{NUM}\s+(?:times|multiplied\s+by)\s+{NUM})", _binary("PRODUCT")),
+    ("modulo", rf"(?:remainder\s+when\s+{NUM}\s+is\s+divided\s+by\s+{NUM}|{NUM}\s+mod(?:ulo)?\s+{NUM})", _binary("MODULO")),
+    ("quotient", rf"(?:{NUM}\s+divided\s+by\s+{NUM}|quotient\s+of\s+{NUM}\s+and\s+{NUM})", _binary("QUOTIENT")),
+    ("power", rf"{NUM}\s+(?:to\s+the\s+power\s+of|raised\s+to(?:\s+the\s+power\s+of)?)\s+{NUM}", _binary("POWER")),
+    ("sqrt", rf"square\s+root\s+of\s+{NUM}", _unary("SQRT")),
+    ("abs", rf"absolute\s+value\s+of\s+{NUM}", _unary("ABS")),
+    ("avg", rf"(?:average|mean)\s+of\s+({NUMBER}(?:\s*,\s*{NUMBER})*(?:\s*,?\s*and\s+{NUMBER})?)", _average),
+]
+
+
+class RuleBasedPlanner:
+    """
+    Deterministic planner for the common problem phrasings. Returns the same
+    [{"tool": ..., "args": [...]}] plans as PlannerAgent, or None when no rule
+    matches so the caller can fall back to the LLM.
+    """
+    def __init__(self):
+        self.rules = [(name, re.compile(PREFIX + shape + SUFFIX, re.IGNORECASE), build)
+                      for name, shape, build in RULES]
+        self.hits: Dict[str, int] = {name: 0 for name, _, _ in RULES}
+        self.misses = 0
+
+    def plan(self, problem: str) -> Optional[List[Dict[str, Any]]]:
+        for name, pattern, build in self.rules:
+            match = pattern.fullmatch(problem)
+            if match:
+                self.hits[name] += 1
+                return build(tuple(g for g in match.groups() if g is not None))
+        self.misses += 1
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-rule hit counts and the share of problems planned without the LLM."""
+        total = sum(self.hits.values()) + self.misses
+        return {
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "coverage": sum(self.hits.values()) / total if total else 0.0,
+        }
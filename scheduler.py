@@ -0,0 +1,132 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Optional, Tuple, Callable
+from plandag import step_dependencies, validate_plan, resolve_args
+
+
+class DAGScheduler:
+    """
+    Runs the steps of a plan as soon as their inputs are ready. Where a step runs
+    is decided from the toolbox's cost metadata:
+      - "inline":  cheap scalar ops run on the calling thread,
+      - "thread":  unreliable tools, which may block on LLM error correction,
+      - "process": big-integer work that MathToolbox computes in a killable child
+                   process (results over its subprocess_bits, when it has a
+                   max_seconds), started from a worker thread so it uses another core.
+    The first step that fails even after error correction cancels the steps that
+    haven't started yet, and run() returns None.
+    """
+    def __init__(self, executor, max_threads: int = 8):
+        self.executor = executor
+        self.toolbox = executor.toolbox
+        self.max_threads = max_threads
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def process_threshold_bits(self) -> int:
+        """Result size (estimate_bits) above which the toolbox forks for a call."""
+        return self.toolbox.subprocess_bits
+
+    def route(self, tool_name: str, args: List[Any]) -> str:
+        cost = self.toolbox.cost(tool_name)
+        if cost == "unreliable":
+            return "thread"
+        # Only calls the toolbox forks for leave the GIL; anything else would just queue on a thread
+        if cost == "bigint" and self.toolbox.max_seconds is not None \
+                and self.toolbox.estimate_bits(tool_name, args) > self.process_threshold_bits:
+            return "process"
+        return "inline"
+
+    def parallelizable(self, plan: List[Dict[str, Any]]) -> bool:
+        """True when at least two steps would run off the calling thread."""
+        if len(plan) < 2:
+            return False
+        # Arguments that reference other steps are unknown yet; route on the literal ones
+        offloaded = sum(self.route(step["tool"], step["args"]) != "inline" for step in plan)
+        return offloaded >= 2
+
+    def _thread_pool(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.max_threads)
+            return self._threads
+
+    def run(self, plan: List[Dict[str, Any]], order: Optional[List[int]] = None,
+            cancel_event: Optional[threading.Event] = None, corrections: Optional[List[Callable[[bool], None]]] = None):
+        """
+        Executes the plan and returns the last step's result, or None on failure or
+        cancellation. corrections is passed on to the executor's error recovery.
+        """
+        order = order if order is not None else validate_plan(plan)
+        waiting_on = [set(refs) for refs in step_dependencies(plan)]
+        dependents: List[List[int]] = [[] for _ in plan]
+        for i, refs in enumerate(waiting_on):
+            for ref in refs:
+                dependents[ref].append(i)
+
+        results: Dict[int, Any] = {}
+        # future -> (step index, tool name, args, whether a raised error still needs recovery)
+        pending: Dict[Future, Tuple[int, str, List[Any], bool]] = {}
+        ready = [i for i in order if not waiting_on[i]]
+
+        def finish(i: int, result) -> bool:
+            if result is None:
+                return False
+            results[i] = result
+            for j in dependents[i]:
+                waiting_on[j].discard(i)
+                if not waiting_on[j]:
+                    ready.append(j)
+            return True
+
+        def abort():
+            for future in pending:
+                future.cancel()
+            return None
+
+        while ready or pending:
+            if cancel_event is not None and cancel_event.is_set():
+                return abort()
+            while ready:
+                i = ready.pop(0)
+                tool_name = plan[i]["tool"]
+                args = resolve_args(plan[i]["args"], results)
+                where = self.route(tool_name, args)
+                if where == "thread":
+                    pending[self._thread_pool().submit(self.executor.execute, tool_name, args, True, corrections)] = (i, tool_name, args, False)
+                    continue
+                try:
+                    tool = self.toolbox.get_tool(tool_name)
+                    if where == "process":
+                        pending[self._thread_pool().submit(tool, *args)] = (i, tool_name, args, True)
+                        continue
+                    result = tool(*args)
+                except Exception as e:
+                    # Error correction may call the LLM; keep it off the scheduling loop
+                    pending[self._thread_pool().submit(self.executor.recover, tool_name, args, e, corrections)] = (i, tool_name, args, False)
+                    continue
+                if not finish(i, result):
+                    return abort()
+            if not pending:
+                break
+
+            # Poll periodically when the caller may cancel from another thread
+            done, _ = wait(list(pending), timeout=0.05 if cancel_event is not None else None,
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                i, tool_name, args, needs_recovery = pending.pop(future)
+                error = future.exception()
+                if error is not None and needs_recovery:
+                    pending[self._thread_pool().submit(self.executor.recover, tool_name, args, error, corrections)] = (i, tool_name, args, False)
+                    continue
+                if error is not None or not finish(i, future.result()):
+                    return abort()
+
+        return results.get(len(plan) - 1)
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._threads is not None:
+                self._threads.shutdown(wait=False, cancel_futures=True)
+            self._threads = None
@@ -0,0 +1,296 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Tuple, Optional, Callable
+from similarity import NGramIndex, normalize, same_wording
+from virtualtoolcache import VirtualToolCache, templatize, generalize, instantiate, confirms_template, _has_slots, _max_slot
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    plan TEXT NOT NULL,
+    template INTEGER NOT NULL,
+    normalized TEXT,
+    size INTEGER NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    last_used REAL NOT NULL,
+    validated INTEGER NOT NULL DEFAULT 1,
+    failed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entries_normalized ON entries(normalized);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used);
+CREATE INDEX IF NOT EXISTS entries_hits ON entries(hits, last_used);
+CREATE TABLE IF NOT EXISTS totals (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO totals VALUES ('entries', 0), ('bytes', 0);
+CREATE TRIGGER IF NOT EXISTS entries_added AFTER INSERT ON entries BEGIN
+    UPDATE totals SET value = value + 1 WHERE name = 'entries';
+    UPDATE totals SET value = value + new.size WHERE name = 'bytes';
+END;
+CREATE TRIGGER IF NOT EXISTS entries_removed AFTER DELETE ON entries BEGIN
+    UPDATE totals SET value = value - 1 WHERE name = 'entries';
+    UPDATE totals SET value = value - old.size WHERE name = 'bytes';
+END;
+-- Template -> the last exact problem whose plan generalized to it, waiting for a second instance
+CREATE TABLE IF NOT EXISTS candidates (template TEXT PRIMARY KEY, problem TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS candidates_problem ON candidates(problem);
+CREATE TRIGGER IF NOT EXISTS candidates_removed AFTER DELETE ON entries BEGIN
+    DELETE FROM candidates WHERE problem = old.key;
+END;
+"""
+
+
+class SharedToolCache:
+    """
+    VirtualToolCache backed by one SQLite database in WAL mode, for worker
+    processes on the same host. Nothing is loaded up front: lookups query the
+    database, so a plan one process inserts is visible to all the others on their
+    next lookup, and readers never wait for writers. Every thread uses its own
+    connection. Eviction budgets, validation counts and invalidation are shared;
+    hit counts are buffered and written back every stats_flush_interval seconds
+    so lookups stay read-only. Only the paraphrase index is per process, and it
+    catches up with other processes' templates by row id before each use.
+    """
+    def __init__(self, cache_file: str = "virtual_tools.sqlite", similarity_threshold: Optional[float] = 0.6,
+                 max_entries: Optional[int] = 100_000, max_bytes: Optional[int] = None, eviction: str = "lru",
+                 on_evict: Optional[Callable[[str], None]] = None, stats_flush_interval: float = 1.0,
+                 seed_file: Optional[str] = None):
+        if eviction not in ("lru", "lfu"):
+            raise ValueError(f"Unknown eviction policy '{eviction}'")
+        self.cache_file = cache_file
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        self.on_evict = on_evict
+        self.stats_flush_interval = stats_flush_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()  # Guards the hit buffer, the paraphrase index and the connection list
+        self._pending_hits: Dict[str, Tuple[int, float]] = {}  # key -> (hits, last used)
+        self._last_flush = time.monotonic()
+        self._template_index = NGramIndex()
+        self._indexed_up_to = 0  # Highest entries.id already added to the paraphrase index
+
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(SCHEMA)
+        if seed_file and self._total("entries") == 0:
+            # One-time import of an existing JSON cache
+            seed = VirtualToolCache(seed_file, max_entries=None, similarity_threshold=None)
+            for problem, plan in {**seed.templates, **seed.tools}.items():
+                self.add_virtual_tool(problem, plan)
+            seed.close()
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            # Autocommit; writes open their own transactions. The timeout covers waiting for other writers.
+            db = sqlite3.connect(self.cache_file, timeout=30, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            with self._lock:
+                self._connections.append(db)
+        return db
+
+    def _total(self, name: str) -> int:
+        return self._db().execute("SELECT value FROM totals WHERE name = ?", (name,)).fetchone()[0]
+
+    def _plan(self, key: str, template: bool) -> Optional[List[Dict[str, Any]]]:
+        row = self._db().execute("SELECT plan FROM entries WHERE key = ? AND template = ?", (key, int(template))).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def lookup(self, problem: str) -> Optional[Tuple[str, List[Dict[str, Any]], List[Any]]]:
+        """Returns (cache key, stored plan, slot values) without filling in the template."""
+        entry = self._find(problem)
+        now = time.time()
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                hits, _ = self._pending_hits.get(entry[0], (0, now))
+                self._pending_hits[entry[0]] = (hits + 1, now)
+            flush = time.monotonic() - self._last_flush >= self.stats_flush_interval
+        if flush:
+            self.flush_stats()
+        return entry
+
+    def _find(self, problem: str) -> Optional[Tuple[str, List[Dict[str, Any]], List[Any]]]:
+        plan = self._plan(problem, template=False)
+        if plan is not None:
+            return problem, plan, []
+        template, values = templatize(problem)
+        if values:
+            plan = self._plan(template, template=True)
+            if plan is not None:
+                return template, plan, values
+        if self.similarity_threshold is None:
+            return None
+        return self._similar(problem, template, values)
+
+    def _similar(self, problem: str, template: str, values: List[Any]) -> Optional[Tuple[str, List[Dict[str, Any]], List[Any]]]:
+        """Same matching rules as VirtualToolCache._similar."""
+        db = self._db()
+        row = db.execute("SELECT key, plan FROM entries WHERE normalized = ? LIMIT 1", (normalize(problem),)).fetchone()
+        if row is not None:
+            return row[0], json.loads(row[1]), []
+        if not values:
+            return None
+        with self._lock:
+            # Pick up templates other processes (or threads) added since the last paraphrase lookup
+            for row_id, key in db.execute("SELECT id, key FROM entries WHERE template = 1 AND id > ? ORDER BY id",
+                                          (self._indexed_up_to,)):
+                self._template_index.add(key, key)
+                self._indexed_up_to = row_id
+            candidates = self._template_index.query(template, self.similarity_threshold)
+        for _, candidate, key in candidates:
+            if not same_wording(candidate, template):
+                continue
+            plan = self._plan(key, template=True)
+            if plan is None:  # Evicted or invalidated since it was indexed
+                with self._lock:
+                    self._template_index.remove(key)
+                continue
+            if _max_slot(plan) < len(values):
+                return key, plan, values
+        return None
+
+    def get_virtual_tool(self, problem: str) -> List[Dict[str, Any]]:
+        entry = self.lookup(problem)
+        if entry is None:
+            return []
+        _, plan, values = entry
+        return instantiate(plan, values) if values else plan
+
+    def exists(self, problem: str) -> bool:
+        db = self._db()
+        if db.execute("SELECT 1 FROM entries WHERE key = ? AND template = 0", (problem,)).fetchone():
+            return True
+        template, values = templatize(problem)
+        return bool(values) and db.execute("SELECT 1 FROM entries WHERE key = ? AND template = 1",
+                                           (template,)).fetchone() is not None
+
+    def add_virtual_tool(self, problem: str, tool_sequence: List[Dict[str, Any]]):
+        """Same generalization rules as VirtualToolCache._insert, in one write transaction."""
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if _has_slots(tool_sequence):
+                self._insert_row(db, problem, tool_sequence, template=True)
+            else:
+                template, values = templatize(problem)
+                template_plan = generalize(tool_sequence, values)
+                stored = self._plan(template, template=True)
+                if template_plan is not None and stored is None:
+                    row = db.execute("SELECT problem FROM candidates WHERE template = ?", (template,)).fetchone()
+                    first_plan = self._plan(row[0], template=False) if row else None
+                    if first_plan is not None and confirms_template(row[0], first_plan, values, template_plan):
+                        self._insert_row(db, template, template_plan, template=True)
+                        db.execute("DELETE FROM entries WHERE key = ?", (row[0],))  # Covered by the template now
+                        stored = template_plan
+                    else:
+                        db.execute("INSERT OR REPLACE INTO candidates VALUES (?, ?)", (template, problem))
+                covered = stored is not None and (stored == template_plan or instantiate(stored, values) == tool_sequence)
+                if not covered:
+                    self._insert_row(db, problem, tool_sequence, template=False)
+            evicted = self._evict(db)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        for key in evicted:
+            if self.on_evict is not None:
+                self.on_evict(key)
+
+    @staticmethod
+    def _insert_row(db: sqlite3.Connection, key: str, plan: List[Dict[str, Any]], template: bool):
+        plan_json = json.dumps(plan)
+        # validated is set as well for databases created when its default was 0; learning an entry validated it once
+        db.execute("INSERT OR IGNORE INTO entries (key, plan, template, normalized, size, last_used, validated) "
+                   "VALUES (?, ?, ?, ?, ?, ?, 1)",
+                   (key, plan_json, int(template), None if template else normalize(key),
+                    len(key) + len(plan_json), time.time()))
+
+    def _evict(self, db: sqlite3.Connection) -> List[str]:
+        """Evicts the lowest-ranked tenth of the entries while over budget; returns the evicted keys."""
+        order = "hits, last_used, id" if self.eviction == "lfu" else "last_used, id"
+        evicted: List[str] = []
+        while True:
+            entries = self._total("entries")
+            over = (self.max_entries is not None and entries > self.max_entries) or \
+                   (self.max_bytes is not None and self._total("bytes") > self.max_bytes)
+            if not over:
+                break
+            keys = [row[0] for row in db.execute(f"SELECT key FROM entries ORDER BY {order} LIMIT ?",
+                                                 (max(1, entries // 10),))]
+            db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in keys])
+            evicted.extend(keys)
+        self.evictions += len(evicted)
+        return evicted
+
+    def flush_stats(self):
+        """Writes buffered hit counts and last-used times to the database."""
+        with self._lock:
+            pending, self._pending_hits = self._pending_hits, {}
+            self._last_flush = time.monotonic()
+        if pending:
+            self._db().executemany("UPDATE entries SET hits = hits + ?, last_used = MAX(last_used, ?) WHERE key = ?",
+                                   [(hits, last_used, key) for key, (hits, last_used) in pending.items()])
+
+    def invalidate(self, key: str) -> bool:
+        """Drops a cache key (as returned by lookup) for every process."""
+        removed = self._db().execute("DELETE FROM entries WHERE key = ?", (key,)).rowcount > 0
+        if removed:
+            self.invalidations += 1
+            if self.on_evict is not None:
+                self.on_evict(key)
+        return removed
+
+    def record_validation(self, key: str, valid: bool) -> bool:
+        """
+        Records whether a replay of the entry validated. Returns True when the
+        entry has now failed more often than it passed and was invalidated.
+        """
+        column = "validated" if valid else "failed"
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute(f"UPDATE entries SET {column} = {column} + 1 WHERE key = ?", (key,))
+            row = db.execute("SELECT validated, failed FROM entries WHERE key = ?", (key,)).fetchone()
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        if row is None or valid or row[1] <= row[0]:
+            return False
+        return self.invalidate(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache-wide metrics; entry counts and size are shared, the rest are this process's."""
+        counts = dict(self._db().execute("SELECT template, COUNT(*) FROM entries GROUP BY template").fetchall())
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._total("entries"),
+            "templates": counts.get(1, 0),
+            "exact": counts.get(0, 0),
+            "bytes": self._total("bytes"),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def close(self):
+        self.flush_stats()
+        with self._lock:
+            for db in self._connections:
+                db.close()
+            self._connections = []
+        self._local = threading.local()
@@ -0,0 +1,171 @@
+import difflib
+import random
+import re
+import zlib
+from collections import defaultdict
+from typing import List, Dict, Set, Tuple
+
+# Small enough that a * h + b fits in an int64, so signatures can be computed with NumPy
+MERSENNE_PRIME = 2 ** 31 - 1
+# Texts indexed at once with NumPy; bounds the (bands * rows) x n-grams work arrays
+BUILD_CHUNK = 4096
+WORD_PATTERN = re.compile(r"\{\d+\}|[a-z]+")
+# Words that don't change which tools a problem needs
+FILLER_WORDS = frozenset({"what", "whats", "s", "is", "find", "compute", "calculate", "work", "out",
+                          "the", "a", "an", "of", "and", "please", "tell", "me", "give", "value"})
+SLOT_TOKEN = re.compile(r" ?\{\d+\}")
+
+
+def normalize(text: str) -> str:
+    """Lowercases, collapses whitespace and drops trailing punctuation."""
+    return " ".join(text.lower().split()).rstrip("?.! ")
+
+
+def content_words(text: str) -> List[str]:
+    return [w for w in WORD_PATTERN.findall(text.lower()) if w not in FILLER_WORDS]
+
+
+def canonical(text: str) -> str:
+    """The words that matter, e.g. "sum of {0} and {1}" for "Find the sum of {0} and {1}."."""
+    return " ".join(content_words(text))
+
+
+def ngrams(text: str, n: int = 3) -> Set[str]:
+    padded = f" {text} "
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+def _index_text(words: str) -> str:
+    # Slots are shared by almost every template; leaving them in would put everything in the same buckets
+    return SLOT_TOKEN.sub("", words)
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def same_wording(a: str, b: str, min_ratio: float = 0.8) -> bool:
+    """
+    True when two problems differ only in filler words or small typos
+    ("sqaure" vs "square"). A different operation word ("plus" vs "minus") or a
+    reordered slot makes them different problems, however similar the n-grams are.
+    """
+    words_a, words_b = content_words(a), content_words(b)
+    if len(words_a) != len(words_b):
+        return False
+    for x, y in zip(words_a, words_b):
+        if x == y:
+            continue
+        if x.startswith("{") or y.startswith("{") or difflib.SequenceMatcher(None, x, y).ratio() < min_ratio:
+            return False
+    return True
+
+
+class NGramIndex:
+    """
+    Approximate nearest-neighbor index over character n-grams using MinHash
+    locality-sensitive hashing. Each text gets bands * rows MinHash values; texts
+    sharing all rows of any band land in the same bucket and become candidates,
+    which are then scored by exact n-gram Jaccard similarity. Lookups only touch a
+    handful of buckets, so their cost doesn't grow with the number of texts.
+    Texts are indexed by canonical() form, so texts that only differ in filler
+    words, case or punctuation are answered from a dict.
+
+    Adding a text only records it: the MinHash buckets of everything added since
+    are computed together on the next query (with NumPy when it is installed), so
+    loading a large cache doesn't pay for LSH until a paraphrase is looked up.
+    """
+    def __init__(self, n: int = 3, bands: int = 6, rows: int = 3, max_bucket: int = 64, seed: int = 0):
+        self.n = n
+        self.max_bucket = max_bucket  # Larger buckets only hold texts sharing common n-grams; they are skipped
+        self.bands = bands
+        self.rows = rows
+        rng = random.Random(seed)
+        self._coefficients = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(MERSENNE_PRIME))
+                              for _ in range(bands * rows)]
+        self.keys: Dict[str, str] = {}  # canonical text -> key
+        self.buckets: Dict[int, List[str]] = defaultdict(list)  # band hash -> canonical texts
+        self._pending: Dict[str, None] = {}  # Canonical texts added but not in buckets yet, in order
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _signatures(self, gram_sets: List[Set[str]]) -> List[List[int]]:
+        """MinHash signatures of several n-gram sets (each non-empty)."""
+        # crc32 rather than hash(), which is salted per process: buckets, and so matches, are reproducible
+        hashes = [[zlib.crc32(g.encode()) % MERSENNE_PRIME for g in grams] for grams in gram_sets]
+        if len(gram_sets) >= 64:
+            try:
+                import numpy as np  # Only worth importing for a batch
+            except ImportError:
+                np = None
+            if np is not None:
+                a = np.array([a for a, _ in self._coefficients], dtype=np.int64)[:, None]
+                b = np.array([b for _, b in self._coefficients], dtype=np.int64)[:, None]
+                flat = np.fromiter((h for text in hashes for h in text), dtype=np.int64)
+                starts = np.cumsum([0] + [len(text) for text in hashes[:-1]])
+                # (coefficients x n-grams) values, then the minimum over each text's n-grams
+                return np.minimum.reduceat((a * flat + b) % MERSENNE_PRIME, starts, axis=1).T.tolist()
+        return [[min((a * h + b) % MERSENNE_PRIME for h in text) for a, b in self._coefficients] for text in hashes]
+
+    def _band_hashes_many(self, gram_sets: List[Set[str]]) -> List[List[int]]:
+        rows = self.rows
+        return [[hash((band,) + tuple(signature[band * rows:(band + 1) * rows])) for band in range(self.bands)]
+                for signature in self._signatures(gram_sets)]
+
+    def _band_hashes(self, grams: Set[str]) -> List[int]:
+        return self._band_hashes_many([grams])[0] if grams else []
+
+    def _grams(self, words: str) -> Set[str]:
+        return ngrams(_index_text(words), self.n)
+
+    def _index_pending(self):
+        pending = list(self._pending)
+        self._pending = {}
+        for start in range(0, len(pending), BUILD_CHUNK):
+            chunk = [(words, self._grams(words)) for words in pending[start:start + BUILD_CHUNK]]
+            chunk = [(words, grams) for words, grams in chunk if grams]
+            for (words, _), band_hashes in zip(chunk, self._band_hashes_many([grams for _, grams in chunk])):
+                for band_hash in band_hashes:
+                    self.buckets[band_hash].append(words)
+
+    def add(self, text: str, key: str):
+        words = canonical(text)
+        if words in self.keys:
+            return
+        self.keys[words] = key
+        self._pending[words] = None
+
+    def remove(self, text: str):
+        words = canonical(text)
+        if self.keys.pop(words, None) is None:
+            return
+        if self._pending.pop(words, 0) is None:
+            return  # Never made it into the buckets
+        for band_hash in self._band_hashes(self._grams(words)):
+            bucket = self.buckets.get(band_hash)
+            if bucket is not None and words in bucket:
+                bucket.remove(words)
+                if not bucket:
+                    del self.buckets[band_hash]
+
+    def query(self, text: str, threshold: float = 0.6, limit: int = 5) -> List[Tuple[float, str, str]]:
+        """Returns up to `limit` (similarity, canonical text, key) at or above threshold, best first."""
+        words = canonical(text)
+        if words in self.keys:
+            return [(1.0, words, self.keys[words])]
+        if self._pending:
+            self._index_pending()
+        grams = self._grams(words)
+        candidates: Set[str] = set()
+        for band_hash in self._band_hashes(grams):
+            bucket = self.buckets.get(band_hash, ())
+            if len(bucket) <= self.max_bucket:
+                candidates.update(bucket)
+        scored = []
+        for candidate in candidates:
+            score = jaccard(grams, self._grams(candidate))
+            if score >= threshold:
+                scored.append((score, candidate, self.keys[candidate]))
+        scored.sort(reverse=True)
+        return scored[:limit]
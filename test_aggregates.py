@@ -0,0 +1,105 @@
+import unittest
+import math
+import os
+import tempfile
+from pathlib import Path
+import aggregates
+from aggregates import iter_chunks, summarize
+from toolbox import MathToolbox
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+VALUES = [3, 1, 4, 1, 5, 9, 2, 6, 5, 3, 5, 8, 9, 7, 9]
+MEAN = sum(VALUES) / len(VALUES)
+VARIANCE = sum((x - MEAN) ** 2 for x in VALUES) / len(VALUES)
+
+class TestAggregates(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def _check(self, source, chunk_size=4):
+        stats = summarize(source, chunk_size)
+        self.assertEqual((stats.count, stats.total, stats.min, stats.max), (len(VALUES), sum(VALUES), 1, 9))
+        self.assertAlmostEqual(stats.mean, MEAN, places=12)
+        self.assertAlmostEqual(stats.variance, VARIANCE, places=12)
+
+    def test_sources(self):
+        """Lists, iterators, text files and raw binary files give the same statistics at any chunking"""
+        self._check(VALUES)
+        self._check(tuple(VALUES), chunk_size=100)
+        self._check(x for x in VALUES)
+        path = Path(self.tmp_dir.name, "values.csv")
+        with open(path, "w") as f:
+            f.write("3,1,4\n1, 5, 9\n2 6 5 3\n5\n8,9,7,9")  # No trailing newline
+        saved, aggregates.CSV_BLOCK_SIZE = aggregates.CSV_BLOCK_SIZE, 5  # Blocks end mid-number
+        try:
+            self._check(path)
+        finally:
+            aggregates.CSV_BLOCK_SIZE = saved
+        path = Path(self.tmp_dir.name, "values.f64")
+        from array import array
+        with open(path, "wb") as f:
+            array("d", VALUES).tofile(f)
+        self._check(path)
+
+    @unittest.skipIf(np is None, "NumPy not installed")
+    def test_numpy_sources(self):
+        self._check(np.array(VALUES))
+        self._check(np.array(VALUES, dtype=np.float32), chunk_size=5)
+        path = Path(self.tmp_dir.name, "values.npy")
+        np.save(path, np.array(VALUES, dtype=np.int64))
+        self._check(path)
+        data = np.random.default_rng(0).normal(1e6, 3.0, 100_000)
+        stats = summarize(data, chunk_size=1000)
+        self.assertAlmostEqual(stats.variance, float(np.var(data)), delta=1e-9 * float(np.var(data)))
+        self.assertEqual(summarize(np.array([2 ** 62, 2 ** 62])).total, 2 ** 63)  # No int64 overflow
+
+    def test_file_names_from_plans(self):
+        """Strings are only read as files inside DATA_DIR, and only regular files are read at all"""
+        with open(os.path.join(self.tmp_dir.name, "values.csv"), "w") as f:
+            f.write(",".join(map(str, VALUES)))
+        toolbox = MathToolbox()
+        with self.assertRaises(ValueError):
+            toolbox.AVG("values.csv")  # No data directory configured
+        self.assertEqual(toolbox.check_plan([{"tool": "AVG", "args": ["values.csv"]}]),
+                         ["Step 0: AVG argument 1 must be a list of numbers, got 'values.csv'"])
+        saved, aggregates.DATA_DIR = aggregates.DATA_DIR, self.tmp_dir.name
+        try:
+            self._check("values.csv")
+            self.assertEqual(toolbox.check_plan([{"tool": "AVG", "args": ["values.csv"]}]), [])
+            for name in ("../values.csv", os.path.abspath(__file__), "missing.csv", "/dev/zero", "."):
+                with self.assertRaises(ValueError, msg=name):
+                    toolbox.AVG(name)
+                self.assertTrue(toolbox.check_plan([{"tool": "AVG", "args": [name]}]), name)
+        finally:
+            aggregates.DATA_DIR = saved
+        with self.assertRaises(ValueError):
+            toolbox.MAX(Path("/dev/zero"))
+
+    def test_precision(self):
+        values = [0.1] * 1_000_000
+        exact = math.fsum(values)
+        self.assertEqual(summarize(values, 1000).total, exact)
+        self.assertNotEqual(sum(values), exact)
+        # Chunk sums are compensated: a large early value doesn't swallow later small ones
+        self.assertEqual(summarize([1e16] + [1.0] * 10_000 + [-1e16], 1).total, 10_000)
+        self.assertEqual(summarize([10 ** 30, 1, -(10 ** 30)]).total, 1)
+
+    def test_tools(self):
+        toolbox = MathToolbox()
+        self.assertEqual(toolbox.AVG([10, 20]), 15)
+        self.assertEqual(toolbox.SUM([1, 2, 3]), 6)
+        self.assertEqual(toolbox.SUM(2, 3), 5)
+        self.assertEqual((toolbox.MIN(iter(VALUES)), toolbox.MAX(VALUES)), (1, 9))
+        self.assertAlmostEqual(toolbox.VARIANCE(VALUES), VARIANCE)
+        for tool in (toolbox.AVG, toolbox.MIN, toolbox.MAX, toolbox.VARIANCE):
+            with self.assertRaises(ValueError):
+                tool([])
+        self.assertEqual(list(iter_chunks(range(5), 2)), [range(0, 2), range(2, 4), range(4, 5)])
+
+if __name__ == '__main__':
+    unittest.main()
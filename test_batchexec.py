@@ -0,0 +1,74 @@
+import unittest
+from batchexec import BatchExecutor, np
+from metrics import Metrics
+from toolbox import MathToolbox
+
+@unittest.skipIf(np is None, "numpy not installed")
+class TestBatchExecutor(unittest.TestCase):
+    def setUp(self):
+        self.toolbox = MathToolbox()
+        self.executor = BatchExecutor(self.toolbox, min_vector_size=2)
+
+    def test_matches_scalar_tools(self):
+        """Vectorized results equal the scalar tools' results, types included"""
+        plans = [[{"tool": tool, "args": args}] for tool, args in [
+            ("SUM", [5, 3]), ("SUM", [10, 20]), ("SUM", [1.5, 2.25]), ("SUM", [1.5, 2.5]),
+            ("PRODUCT", [4, 6]), ("PRODUCT", [7, 8]),
+            ("QUOTIENT", [20, 4]), ("QUOTIENT", [7, 2]),
+            ("POWER", [2, 3]), ("POWER", [3, 2]), ("POWER", [2, -1]),
+            ("SQRT", [16]), ("SQRT", [81]),
+            ("ROUND", [2.5]), ("ROUND", [3.5]),
+            ("MODULO", [17, 5]), ("MODULO", [-7, 3]),
+            ("ABS", [-15]), ("ABS", [-25]),
+        ]]
+        outcomes = self.executor.execute_many(plans)
+        for plan, outcome in zip(plans, outcomes):
+            expected = self.toolbox.get_tool(plan[0]["tool"])(*plan[0]["args"])
+            self.assertEqual((outcome, type(outcome)), (expected, type(expected)), plan)
+        self.assertGreater(self.executor.vectorized, 0)
+
+    def test_per_element_errors(self):
+        """Division by zero and negative sqrt fail only their own plans"""
+        outcomes = self.executor.execute_many([
+            [{"tool": "QUOTIENT", "args": [10, 0]}],
+            [{"tool": "QUOTIENT", "args": [10, 5]}],
+            [{"tool": "SQRT", "args": [-16]}, {"tool": "SUM", "args": ["$step0", 1]}],
+            [{"tool": "SQRT", "args": [16]}, {"tool": "SUM", "args": ["$step0", 1]}],
+        ])
+        self.assertIsInstance(outcomes[0], ValueError)
+        self.assertEqual(outcomes[1], 2)
+        self.assertEqual(str(outcomes[2]), "Negative sqrt")
+        self.assertEqual(outcomes[3], 5)
+
+    def test_scalar_fallback(self):
+        """Big ints, overflowing results and list arguments take the scalar path"""
+        big = 999999999999
+        outcomes = self.executor.execute_many([
+            [{"tool": "PRODUCT", "args": [big, big]}],
+            [{"tool": "PRODUCT", "args": [3, 5]}],
+            [{"tool": "POWER", "args": [3, 100]}],
+            [{"tool": "POWER", "args": [3, 4]}],
+            [{"tool": "AVG", "args": [[10, 20]]}],
+            [{"tool": "SUM", "args": [2 ** 70, 1]}],
+        ])
+        self.assertEqual(outcomes, [big * big, 15, 3 ** 100, 81, 15, 2 ** 70 + 1])
+
+    def test_list_arguments(self):
+        """A group of single-step plans taking lists is summed per plan, not broadcast as a 2-D array"""
+        outcomes = self.executor.execute_many([[{"tool": "SUM", "args": [[i, i + 1, i + 2]]}] for i in range(5)]
+                                              + [[{"tool": "SQRT", "args": [[4, 9]]}], [{"tool": "SQRT", "args": [[1, 2]]}]])
+        self.assertEqual(outcomes[:5], [3 * i + 3 for i in range(5)])
+        self.assertIsInstance(outcomes[5], TypeError)
+        self.assertIsInstance(outcomes[6], TypeError)
+
+    def test_counts_tool_calls(self):
+        """Vectorized elements and scalar fallbacks each count as one call"""
+        metrics = Metrics()
+        executor = BatchExecutor(MathToolbox(metrics=metrics), min_vector_size=2, metrics=metrics)
+        executor.execute_many([[{"tool": "SUM", "args": [i, 1]}, {"tool": "PRODUCT", "args": ["$step0", 2 ** 70]}]
+                               for i in range(10)])
+        counters = metrics.to_json()["counters"]
+        self.assertEqual((counters["tool_calls{tool=SUM}"], counters["tool_calls{tool=PRODUCT}"]), (10, 10))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import threading
+import time
+from batchplanner import MicroBatchPlanner
+
+def plan_for(problem):
+    return [{"tool": "SUM", "args": [len(problem), 1]}]
+
+class RecordingPlanner:
+    """Stands in for PlannerAgent; plan_batch drops the problems listed in malformed"""
+    def __init__(self, malformed=(), fail=False):
+        self.malformed = set(malformed)
+        self.fail = fail
+        self.batches = []
+        self.single = []
+
+    def plan_batch(self, problems):
+        self.batches.append(list(problems))
+        if self.fail:
+            raise RuntimeError("rate limited")
+        return [None if p in self.malformed else plan_for(p) for p in problems]
+
+    def plan_stream(self, problem):
+        self.single.append(problem)
+        yield from plan_for(problem)
+
+class TestMicroBatchPlanner(unittest.TestCase):
+    def plan_concurrently(self, batcher, problems):
+        results = {}
+        def run(problem):
+            results[problem] = batcher.plan(problem)
+        threads = [threading.Thread(target=run, args=(p,)) for p in problems]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_batches_up_to_size_limit(self):
+        planner = RecordingPlanner()
+        batcher = MicroBatchPlanner(planner, max_batch=4, max_wait=1.0)
+        problems = [f"problem {'x' * i}" for i in range(8)]
+        start = time.perf_counter()
+        results = self.plan_concurrently(batcher, problems)
+        self.assertLess(time.perf_counter() - start, 0.5, "Full batches shouldn't wait for the window")
+        self.assertEqual(results, {p: plan_for(p) for p in problems})
+        self.assertEqual(sorted(len(b) for b in planner.batches), [4, 4])
+        self.assertEqual(planner.single, [])
+        self.assertEqual(batcher.stats()["mean_batch_size"], 4)
+
+    def test_malformed_entries_are_retried_alone(self):
+        planner = RecordingPlanner(malformed={"problem b"})
+        batcher = MicroBatchPlanner(planner, max_batch=3, max_wait=1.0)
+        results = self.plan_concurrently(batcher, ["problem a", "problem b", "problem c"])
+        self.assertEqual(results["problem b"], plan_for("problem b"))
+        self.assertEqual(planner.single, ["problem b"])
+        self.assertEqual(batcher.stats()["retried"], 1)
+
+    def test_failed_batch_and_lone_problem_fall_back(self):
+        planner = RecordingPlanner(fail=True)
+        batcher = MicroBatchPlanner(planner, max_batch=2, max_wait=1.0)
+        self.plan_concurrently(batcher, ["problem a", "problem b"])
+        self.assertEqual(sorted(planner.single), ["problem a", "problem b"])
+        # A problem nobody joins within the window is sent with the plain prompt
+        batcher.max_wait = 0.01
+        self.assertEqual(batcher.plan("problem c"), plan_for("problem c"))
+        self.assertEqual(len(planner.batches), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import json
+import os
+import tempfile
+from batchrun import run_batch
+from main2 import MultiAgentSystem
+
+class InterruptingSystem(MultiAgentSystem):
+    """Fails on the n-th chunk, like a worker killed mid-run"""
+    def __init__(self, *args, fail_on_call=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail_on_call = fail_on_call
+        self.calls = 0
+
+    def solve_many(self, problems, max_concurrency=8, latencies=None):
+        self.calls += 1
+        if self.calls == self.fail_on_call:
+            raise KeyboardInterrupt
+        return super().solve_many(problems, max_concurrency, latencies)
+
+class TestBatchRun(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.input_file = os.path.join(self.tmp_dir.name, "problems.jsonl")
+        self.output_file = os.path.join(self.tmp_dir.name, "results.jsonl")
+        with open(self.input_file, "w") as f:
+            for i in range(25):
+                f.write(json.dumps({"problem": f"What is the sum of {i} and 1?", "expected": i + 1}) + "\n")
+            f.write("not json\n")
+            f.write(json.dumps({"problem": "What is 10 divided by 0?", "expected_output": None}) + "\n")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def system(self, **kwargs):
+        return InterruptingSystem(os.path.join(self.tmp_dir.name, "virtual_tools.json"), None, None, **kwargs)
+
+    def read_output(self):
+        with open(self.output_file) as f:
+            return [json.loads(line) for line in f]
+
+    def test_results_in_input_order(self):
+        summary = run_batch(self.system(), self.input_file, self.output_file, chunk_size=10)
+        results = self.read_output()
+        self.assertEqual([r["line"] for r in results], list(range(27)))
+        self.assertEqual(results[3], {"line": 3, "problem": "What is the sum of 3 and 1?", "result": 4})
+        self.assertIn("Invalid input line", results[25]["error"])
+        self.assertIn("error", results[26])
+        self.assertEqual((summary["solved"], summary["failed"]), (25, 2))
+        self.assertEqual(summary["latency"]["count"], 26)
+
+    def test_resume_after_interruption(self):
+        """A rerun skips finished chunks and drops output written after the last checkpoint"""
+        with self.assertRaises(KeyboardInterrupt):
+            run_batch(self.system(fail_on_call=2), self.input_file, self.output_file, chunk_size=10)
+        with open(self.output_file, "a") as f:
+            f.write('{"line": 10, "problem": "What is the su')  # Torn write of the unfinished chunk
+
+        system = self.system()
+        summary = run_batch(system, self.input_file, self.output_file, chunk_size=10)
+        self.assertEqual(system.calls, 2)
+        self.assertEqual(summary["processed"], 17)
+        self.assertEqual([r["line"] for r in self.read_output()], list(range(27)))
+
+        summary = run_batch(self.system(), self.input_file, self.output_file, chunk_size=10, restart=True)
+        self.assertEqual(summary["processed"], 27)
+        self.assertEqual(len(self.read_output()), 27)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import time
+import unittest
+from corrections import CorrectionRules, FailureCache
+from metrics import Metrics
+
+class TestCorrectionRules(unittest.TestCase):
+    def setUp(self):
+        self.rules = CorrectionRules(None)
+
+    def test_constant_rule_needs_second_input(self):
+        """SQRT(-4) -> SQRT(4) is only trusted once the same rule is learned from other arguments"""
+        error = ValueError("Negative sqrt")
+        self.rules.learn("SQRT", [-4], error, "SQRT", [4])
+        self.assertIsNone(self.rules.lookup("SQRT", [-9], error))
+        self.rules.learn("SQRT", [-9], error, "SQRT", [3])
+        self.assertIsNone(self.rules.lookup("SQRT", [-9], error))
+
+        self.rules.learn("QUOTIENT", [5, 0], ValueError("Division by zero"), "QUOTIENT", [5, 1])
+        self.assertIsNone(self.rules.lookup("QUOTIENT", [8, 0], ValueError("Division by zero")))
+        self.rules.learn("QUOTIENT", [6, 0], ValueError("Division by zero"), "QUOTIENT", [6, 1])
+        self.assertEqual(self.rules.lookup("QUOTIENT", [8, 0], ValueError("Division by zero"))[1:], ("QUOTIENT", [8, 1]))
+
+    def test_failing_rule_is_dropped(self):
+        error = ValueError("Division by zero")
+        self.rules.learn("MODULO", [5, 0], error, "MODULO", [5, 0])
+        key, _, _ = self.rules.lookup("MODULO", [7, 0], error)
+        self.rules.record(key, False)
+        self.assertIsNone(self.rules.lookup("MODULO", [7, 0], error))
+        self.assertEqual(self.rules.stats()["rules"], 0)
+
+    def test_unreadable_rules_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            rules_file = os.path.join(tmp, "rules.json")
+            with open(rules_file, "w") as f:
+                f.write("{not json")
+            events = []
+            self.assertEqual(CorrectionRules(rules_file, Metrics(listeners=[events.append])).rules, {})
+        self.assertEqual([(e["event"], e["file"]) for e in events], [("correction_rules_unreadable", rules_file)])
+
+class TestFailureCache(unittest.TestCase):
+    def test_exponential_backoff(self):
+        cache = FailureCache(base_backoff=10, max_backoff=25)
+        key = cache.key("What is problem a?", 3)
+        for failures, backoff in [(1, 10), (2, 20), (3, 25)]:
+            cache.record(key, {"error": "Validation failed"})
+            count, retry_at, _ = cache.entries[key]
+            self.assertEqual(count, failures)
+            self.assertAlmostEqual(retry_at - time.monotonic(), backoff, delta=1)
+        self.assertEqual(cache.get(key), {"error": "Validation failed"})
+        cache.record(key, {"result": 3})
+        self.assertIsNone(cache.get(key))
+
+    def test_bounded(self):
+        """Past max_entries the least recently used problems go; long-expired ones are pruned"""
+        cache = FailureCache(base_backoff=10, max_backoff=10, max_entries=2)
+        for name in "abc":
+            cache.record(name, {"error": "Execution failed"})
+            if name == "b":
+                cache.get("a")
+        self.assertEqual(list(cache.entries), ["a", "c"])
+
+        cache = FailureCache(base_backoff=0.01, max_backoff=0.01)
+        cache.record("a", {"error": "Execution failed"})
+        time.sleep(0.05)
+        cache.record("a", {"error": "Execution failed"})
+        self.assertEqual(cache.entries["a"][0], 1, "Forgotten a max_backoff after its retry time")
+        cache.record("b", {"error": "Execution failed"})
+        time.sleep(0.05)
+        cache.record("c", {"error": "Execution failed"})
+        self.assertEqual(list(cache.entries), ["c"])
+
+if __name__ == '__main__':
+    unittest.main()
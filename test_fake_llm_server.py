@@ -0,0 +1,56 @@
+import unittest
+import json
+import os
+import tempfile
+import time
+import openai
+from fake_llm_server import FakeChatCompletionsServer, latency_distribution, load_profile
+
+class TestFakeLLMServer(unittest.TestCase):
+    def setUp(self):
+        self.saved_client_settings = (openai.base_url, openai.api_key, openai.max_retries)
+        openai.api_key = "fake"
+        openai.max_retries = 0
+
+    def tearDown(self):
+        openai.base_url, openai.api_key, openai.max_retries = self.saved_client_settings
+
+    def _ask(self, server):
+        openai.base_url = server.base_url
+        return openai.chat.completions.create(model="fake", messages=[{"role": "user", "content": "two words"}])
+
+    def test_latency_distributions(self):
+        self.assertEqual(latency_distribution({"distribution": "constant", "seconds": 0.5})(), 0.5)
+        replay = latency_distribution({"distribution": "samples", "samples": [0.1, 0.2]}, seed=0)
+        self.assertTrue({replay() for _ in range(50)} <= {0.1, 0.2})
+        lognormal = latency_distribution({"distribution": "lognormal", "median": 0.2, "sigma": 0.5}, seed=0)
+        samples = sorted(lognormal() for _ in range(1001))
+        self.assertAlmostEqual(samples[500], 0.2, delta=0.03)
+        with self.assertRaises(ValueError):
+            latency_distribution({"distribution": "uniform"})
+
+    def test_profile_latency_and_usage(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "profile.json")
+            with open(path, "w") as f:
+                json.dump({"latency": {"distribution": "constant", "seconds": 0.1}}, f)
+            with FakeChatCompletionsServer(lambda prompt: "[]", **load_profile(path)) as server:
+                start = time.perf_counter()
+                response = self._ask(server)
+                self.assertGreaterEqual(time.perf_counter() - start, 0.1)
+        self.assertEqual(response.choices[0].message.content, "[]")
+        self.assertEqual((response.usage.prompt_tokens, response.usage.completion_tokens), (2, 1))
+
+    def test_injected_failures(self):
+        with FakeChatCompletionsServer(lambda prompt: "[]", failure_rate=0.5, seed=0) as server:
+            failures = 0
+            for _ in range(40):
+                try:
+                    self._ask(server)
+                except openai.InternalServerError:
+                    failures += 1
+        self.assertEqual(failures, server.failure_count)
+        self.assertTrue(10 <= failures <= 30)
+
+if __name__ == '__main__':
+    unittest.main()
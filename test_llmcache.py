@@ -0,0 +1,95 @@
+import unittest
+import os
+import tempfile
+import threading
+import time
+from llmcache import LLMResponseCache
+
+class TestLLMResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.tmp_dir.name, "llm_responses.sqlite")
+        self.cache = LLMResponseCache(self.cache_file)
+        self.calls = 0
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    def compute(self, response="[]", delay=0.0):
+        def _compute():
+            self.calls += 1
+            time.sleep(delay)
+            return response
+        return _compute
+
+    def test_hit_and_persistence(self):
+        """Responses are served from the cache, also after reopening the file"""
+        self.cache.get_or_compute("gpt-4", "prompt", self.compute("a"))
+        self.assertEqual(self.cache.get_or_compute("gpt-4", "prompt", self.compute("b")), "a")
+        self.assertEqual(self.cache.get_or_compute("gpt-3.5-turbo", "prompt", self.compute("c")), "c")
+        reopened = LLMResponseCache(self.cache_file)
+        self.assertEqual(reopened.get_or_compute("gpt-4", "prompt", self.compute("d")), "a")
+        reopened.close()
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_single_flight(self):
+        """Concurrent identical requests share one call"""
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            self.cache.get_or_compute("gpt-4", "prompt", self.compute("a", delay=0.2)))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, ["a"] * 5)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.cache.stats()["coalesced"], 4)
+
+    def test_errors_are_not_cached(self):
+        def fail():
+            raise RuntimeError("rate limited")
+        with self.assertRaises(RuntimeError):
+            self.cache.get_or_compute("gpt-4", "prompt", fail)
+        self.assertEqual(self.cache.get_or_compute("gpt-4", "prompt", self.compute("a")), "a")
+
+    def test_ttl_and_lru_eviction(self):
+        cache = LLMResponseCache(":memory:", max_entries=2, ttl=0.05)
+        for prompt in ("p1", "p2"):
+            cache.get_or_compute("gpt-4", prompt, self.compute(prompt))
+        cache.get_or_compute("gpt-4", "p1", self.compute())  # p1 becomes most recently used
+        cache.get_or_compute("gpt-4", "p3", self.compute("p3"))
+        self.assertIsNone(cache.get(cache.make_key("gpt-4", "p2")))
+        self.assertEqual(cache.get(cache.make_key("gpt-4", "p1")), "p1")
+        time.sleep(0.1)
+        self.assertIsNone(cache.get(cache.make_key("gpt-4", "p1")))
+        cache.close()
+
+    def test_streamed_responses(self):
+        """Streams are passed through chunk by chunk, cached whole and shared with concurrent callers"""
+        def stream():
+            self.calls += 1
+            for chunk in ("[{", "}]"):
+                time.sleep(0.1)
+                yield chunk
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            list(self.cache.stream_or_compute("gpt-4", "prompt", stream)))) for _ in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(sorted(results), [["[{", "}]"]] + [["[{}]"]] * 2)
+        self.assertEqual(list(self.cache.stream_or_compute("gpt-4", "prompt", stream)), ["[{}]"])
+        self.assertEqual(self.cache.get_or_compute("gpt-4", "prompt", self.compute("b")), "[{}]")
+        self.assertEqual(self.calls, 1)
+
+    def test_abandoned_stream_is_not_cached(self):
+        responses = self.cache.stream_or_compute("gpt-4", "prompt", lambda: iter(["[{", "}]"]))
+        next(responses)
+        responses.close()
+        self.assertEqual(self.cache.get_or_compute("gpt-4", "prompt", self.compute("a")), "a")
+
+if __name__ == '__main__':
+    unittest.main()
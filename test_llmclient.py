@@ -0,0 +1,75 @@
+import unittest
+import time
+import openai
+from fake_llm_server import FakeChatCompletionsServer
+from llmclient import LLMClient, TokenBucket
+from main2 import LLMAgent, PlannerAgent
+
+class TestTokenBucket(unittest.TestCase):
+    def test_paces_after_burst(self):
+        bucket = TokenBucket(per_minute=600, burst=2)  # 10 per second
+        self.assertEqual(bucket.acquire(), 0.0)
+        self.assertEqual(bucket.acquire(), 0.0)
+        self.assertAlmostEqual(bucket.acquire(), 0.1, delta=0.02)
+        # Reservations queue up behind each other
+        self.assertAlmostEqual(bucket.acquire(), 0.2, delta=0.02)
+
+    def test_deadline(self):
+        bucket = TokenBucket(per_minute=60, burst=1)
+        bucket.acquire()
+        with self.assertRaises(TimeoutError):
+            bucket.acquire(deadline=time.monotonic() + 0.5)
+        self.assertAlmostEqual(bucket.acquire(), 1.0, delta=0.05)  # The failed call reserved nothing
+
+    def test_oversized_request_goes_into_debt(self):
+        bucket = TokenBucket(per_minute=6000, burst=100)
+        self.assertEqual(bucket.acquire(250), 0.0)
+        self.assertAlmostEqual(bucket.acquire(1), 1.51, delta=0.05)
+
+class TestLLMClient(unittest.TestCase):
+    def setUp(self):
+        self.saved_client_settings = (openai.base_url, openai.api_key)
+        openai.api_key = "fake"
+
+    def tearDown(self):
+        openai.base_url, openai.api_key = self.saved_client_settings
+
+    def _server(self, **kwargs):
+        server = FakeChatCompletionsServer(lambda prompt: "[]", seed=0, **kwargs).start()
+        self.addCleanup(server.stop)
+        openai.base_url = server.base_url
+        return server
+
+    def test_retries_rate_limits(self):
+        server = self._server(rate_limit_rate=0.5, retry_after=0.01)
+        client = LLMClient(max_retries=20, backoff_base=0.001, seed=0)
+        for _ in range(20):
+            self.assertEqual(client.create("fake", "hi").choices[0].message.content, "[]")
+        self.assertGreater(server.rate_limited_count, 0)
+        self.assertEqual(client.retries, server.rate_limited_count)
+
+    def test_gives_up_after_max_retries(self):
+        self._server(failure_rate=1.0)
+        client = LLMClient(max_retries=2, backoff_base=0.001)
+        with self.assertRaises(openai.InternalServerError):
+            client.create("fake", "hi")
+        self.assertEqual(client.retries, 2)
+
+    def test_deadline_bounds_slow_responses(self):
+        self._server(slow_rate=1.0, slow_latency=2.0)
+        client = LLMClient(timeout=0.1, backoff_base=0.01)
+        start = time.perf_counter()
+        with self.assertRaises(TimeoutError):
+            client.create("fake", "hi", deadline=0.5)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertGreater(client.retries, 0)  # Timed-out attempts are retried while the deadline allows
+
+    def test_agents_send_their_model(self):
+        server = self._server()
+        client = LLMClient()
+        LLMAgent("gpt-4o-mini", client=client).generate_response("hi")
+        list(PlannerAgent("gpt-4o", stream=True, client=client).stream_response("hi"))
+        self.assertEqual(server.model_counts, {"gpt-4o-mini": 1, "gpt-4o": 1})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import threading
+from metrics import Metrics, NULL_METRICS
+
+class TestMetrics(unittest.TestCase):
+    def test_counters_and_histograms(self):
+        metrics = Metrics()
+        metrics.count("tool_calls", tool="SUM")
+        metrics.count("tool_calls", 2, tool="SUM")
+        metrics.count("tool_calls", tool="SQRT")
+        for seconds in (0.01, 0.02, 0.03):
+            metrics.observe("llm_request_seconds", seconds, model="gpt")
+        report = metrics.to_json()
+        self.assertEqual(report["counters"], {"tool_calls{tool=SUM}": 3, "tool_calls{tool=SQRT}": 1})
+        latency = report["histograms"]["llm_request_seconds{model=gpt}"]
+        self.assertEqual(latency["count"], 3)
+        self.assertAlmostEqual(latency["max"], 0.03)
+
+    def test_spans_and_events(self):
+        events = []
+        metrics = Metrics(listeners=[events.append])
+        with metrics.span("plan"):
+            pass
+        with self.assertRaises(ValueError):
+            with metrics.span("execute"):
+                raise ValueError("boom")
+        metrics.event("cache_hit", key="k")
+        report = metrics.to_json()
+        self.assertEqual(report["histograms"]["stage_seconds{stage=plan}"]["count"], 1)
+        self.assertEqual(report["counters"]["stage_errors{stage=execute}"], 1)
+        self.assertEqual(report["counters"]["events{event=cache_hit}"], 1)
+        self.assertEqual((events[0]["event"], events[0]["key"]), ("cache_hit", "k"))
+
+    def test_prometheus_export(self):
+        metrics = Metrics()
+        metrics.count("tool_errors", tool='we"ird')
+        metrics.observe("stage_seconds", 0.5, stage="plan")
+        metrics.collectors.append(lambda: {"cache_hit_ratio": 0.25})
+        text = metrics.to_prometheus()
+        self.assertIn("# TYPE mathbot_tool_errors_total counter\n", text)
+        self.assertIn('mathbot_tool_errors_total{tool="we\\"ird"} 1\n', text)
+        self.assertIn('mathbot_stage_seconds{stage="plan",quantile="0.5"}', text)
+        self.assertIn('mathbot_stage_seconds_count{stage="plan"} 1\n', text)
+        self.assertIn("mathbot_cache_hit_ratio 0.25\n", text)
+
+    def test_thread_safety(self):
+        metrics = Metrics()
+        def work():
+            for _ in range(1000):
+                metrics.count("tool_calls", tool="SUM")
+                metrics.observe("stage_seconds", 0.001, stage="execute")
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        report = metrics.to_json()
+        self.assertEqual(report["counters"]["tool_calls{tool=SUM}"], 8000)
+        self.assertEqual(report["histograms"]["stage_seconds{stage=execute}"]["count"], 8000)
+
+    def test_disabled_records_nothing(self):
+        self.assertFalse(NULL_METRICS.enabled)
+        with NULL_METRICS.span("plan"):
+            NULL_METRICS.count("tool_calls", tool="SUM")
+            NULL_METRICS.event("cache_hit")
+        self.assertFalse(hasattr(NULL_METRICS, "counters"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,329 @@
+import unittest
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import openai
+from fake_llm_server import FakeChatCompletionsServer, canned_plan_responder
+from llmclient import LLMClient
+from main2 import MultiAgentSystem
+from metrics import Metrics
+
+class TestMultiAgentSystemOffline(unittest.TestCase):
+    """Runs MultiAgentSystem against the local fake chat-completions server instead of OpenAI"""
+
+    def setUp(self):
+        self.plans = {}
+        self.server = FakeChatCompletionsServer(canned_plan_responder(self.plans)).start()
+        self.saved_client_settings = (openai.base_url, openai.api_key)
+        openai.base_url = self.server.base_url
+        openai.api_key = "fake"
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.system = MultiAgentSystem(os.path.join(self.tmp_dir.name, "virtual_tools.json"),
+                                       os.path.join(self.tmp_dir.name, "llm_responses.sqlite"),
+                                       os.path.join(self.tmp_dir.name, "correction_rules.json"))
+
+    def tearDown(self):
+        self.system.virtual_tool_cache.close()
+        self.system.llm_cache.close()
+        self.server.stop()
+        openai.base_url, openai.api_key = self.saved_client_settings
+        self.tmp_dir.cleanup()
+
+    def test_solve_many_order_and_concurrency(self):
+        """Batch results come back in input order and planner calls overlap"""
+        cases = []
+        for name in "abcdefgh":
+            problem = f"What is problem {name}?"
+            self.plans[problem] = [{"tool": "SUM", "args": [len(cases), 1]}]
+            cases.append((problem, len(cases) + 1))
+        self.server.latency = 0.2
+
+        start = time.perf_counter()
+        results = self.system.solve_many(cases, max_concurrency=8)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(results, [{"result": expected} for _, expected in cases])
+        self.assertLess(elapsed, 0.2 * len(cases) / 2, "Planner calls should run concurrently")
+        self.assertTrue(all(self.system.virtual_tool_cache.exists(p) for p, _ in cases))
+
+    def test_solve_many_isolates_failures(self):
+        """A problem the planner can't handle doesn't fail the whole batch"""
+        self.plans["What is problem a?"] = [{"tool": "SUM", "args": [1, 1]}]
+        results = self.system.solve_many([("What is problem a?", 2), ("What is problem b?", 0)])
+        self.assertEqual(results[0], {"result": 2})
+        self.assertIn("error", results[1])
+
+    def test_llm_errors_are_not_remembered(self):
+        """An LLM outage raises every time and isn't backed off: the next call after recovery reaches the server"""
+        self.plans["What is problem a?"] = [{"tool": "SUM", "args": [1, 1]}]
+        system = MultiAgentSystem(os.path.join(self.tmp_dir.name, "outage.json"), None, None,
+                                  llm_client=LLMClient(max_retries=0))
+        self.server.failure_rate = 1.0
+        for _ in range(2):
+            with self.assertRaises(openai.InternalServerError):
+                system.solve("What is problem a?", 2)
+        self.server.failure_rate = 0.0
+        self.assertEqual(system.solve("What is problem a?", 2), {"result": 2})
+        self.assertEqual(self.server.request_count, 3)
+        system.virtual_tool_cache.close()
+
+    def test_unvalidated_repeats_are_not_replanned(self):
+        """Failures are remembered while backing off, and re-planning after that hits the response cache"""
+        self.plans["What is problem a?"] = [{"tool": "SUM", "args": [1, 1]}]
+        for _ in range(3):
+            self.assertEqual(self.system.solve("What is problem a?", None), {"error": "Validation failed"})
+        self.assertEqual(self.system.failure_cache.stats()["hits"], 2)
+        self.assertEqual(self.system.llm_cache.stats()["hits"], 0)
+
+        self.system.failure_cache.base_backoff = 0
+        self.system.failure_cache.entries.clear()
+        for _ in range(2):
+            self.assertEqual(self.system.solve("What is problem a?", None), {"error": "Validation failed"})
+        self.assertEqual(self.server.request_count, 1)
+        self.assertEqual(self.system.llm_cache.stats()["hits"], 2)
+
+    def test_learned_correction_skips_llm(self):
+        """A correction that only reuses the failed call's arguments is applied without the LLM next time"""
+        self.server.responder = lambda prompt: '[{"tool": "SUM", "args": [%s, 0]}]' % prompt.split("arguments [")[1].split(",")[0]
+        self.assertEqual(self.system.executor.execute("QUOTIENT", [7, 0]), 7)
+        self.assertEqual(self.system.executor.execute("QUOTIENT", [9, 0]), 9)
+        self.assertEqual(self.server.request_count, 1)
+        self.assertEqual(self.system.correction_rules.stats()["successes"], 1)
+
+    def test_correction_needs_a_valid_answer(self):
+        """LLM corrections are only learned, and learned rules only credited, when the answer validates"""
+        self.server.responder = lambda prompt: '[{"tool": "SUM", "args": [%s, 0]}]' % prompt.split("arguments [")[1].split(",")[0] \
+            if "failed with error" in prompt else '[{"tool": "QUOTIENT", "args": [7, 0]}]'
+        self.assertEqual(self.system.solve("What is problem a?", 0), {"error": "Validation failed"})
+        self.assertEqual(self.system.correction_rules.stats()["rules"], 0)
+        self.assertEqual(self.system.solve("What is problem b?", 7), {"result": 7})
+        self.assertEqual(self.system.correction_rules.stats()["rules"], 1)
+        # A learned rule that leads to a wrong answer more often than to a right one is dropped
+        self.server.responder = lambda prompt: '[{"tool": "QUOTIENT", "args": [5, 0]}]'
+        self.assertEqual(self.system.solve("What is problem c?", 0), {"error": "Validation failed"})
+        self.assertEqual(self.system.correction_rules.stats(), {"rules": 0, "trusted": 0, "hits": 0, "successes": 0, "failures": 0})
+
+    def test_rule_planner_skips_llm(self):
+        """Recognized shapes are planned locally and override wrong cached plans"""
+        self.system.virtual_tool_cache.add_virtual_tool("What is the square root of 9?", [{"tool": "PRODUCT", "args": [3, 3]}])
+        self.assertEqual(self.system.solve("What is the square root of 9?", 3), {"result": 3})
+        self.assertEqual(self.system.solve("What is 7 to the power of 2?", 49), {"result": 49})
+        self.assertEqual(self.server.request_count, 0)
+
+    def test_multi_step_plan(self):
+        """Steps can consume earlier results, and the cached plan is reused compiled"""
+        problem = "What is the average of the squares of 3 and 4?"
+        self.plans[problem] = [
+            {"tool": "POWER", "args": [3, 2]},
+            {"tool": "POWER", "args": [4, 2]},
+            {"tool": "AVG", "args": [["$step0", "$step1"]]},
+        ]
+        self.assertEqual(self.system.solve(problem, 12.5), {"result": 12.5})
+        self.assertEqual(self.system.solve(problem, 12.5), {"result": 12.5})
+        self.assertEqual(self.server.request_count, 1)
+        self.assertIn(problem, self.system._compiled)
+
+    def test_cost_limits(self):
+        """Huge powers reduced modulo m are computed modularly; ones that aren't fail fast without LLM correction"""
+        problem = "What are the last three digits of 999999999999 to the power of 10000000?"
+        self.plans[problem] = [{"tool": "POWER", "args": [999999999999, 10000000]},
+                               {"tool": "MODULO", "args": ["$step0", 1000]}]
+        expected = pow(999999999999, 10 ** 7, 1000)
+        self.assertEqual(self.system.solve(problem, expected), {"result": expected})
+        problem = "What is 999999999999 to the power of 10000000?"
+        self.plans[problem] = [{"tool": "POWER", "args": [999999999999, 10000000]}]
+        start = time.perf_counter()
+        self.assertEqual(self.system.solve(problem, None), {"error": "Execution failed"})
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual(self.server.request_count, 1)  # The second is planned by rule, and never corrected
+
+    def test_cost_limit_in_compiled_plan_is_not_retried(self):
+        """A cached plan over the cost budget fails once, without a step-by-step re-run"""
+        self.system.virtual_tool_cache.add_virtual_tool("Raise 7 to the power 5.", [{"tool": "POWER", "args": [7, 5]}])
+        self.system.virtual_tool_cache.add_virtual_tool("Raise 2 to the power 3.", [{"tool": "POWER", "args": [2, 3]}])
+        toolbox = self.system.toolbox.toolbox
+        calls = []
+        bounded = toolbox._bounded
+        toolbox._bounded = lambda *args: calls.append(args[0]) or bounded(*args)
+        self.assertEqual(self.system.solve("Raise 7 to the power 5.", 16807), {"result": 16807})
+        self.assertEqual(self.system.solve("Raise 999999999999 to the power 10000000.", None), {"error": "Execution failed"})
+        self.assertEqual(calls, ["POWER", "POWER"])
+        self.assertEqual(self.server.request_count, 0)
+
+    def test_invalid_plan_is_replanned_once(self):
+        """Plans that don't fit the tools' signatures are rejected before running, with one re-plan and no correction"""
+        self.server.responder = lambda prompt: '[{"tool": "SQRT", "args": [9]}]' if "rejected" in prompt \
+            else '[{"tool": "PRODUCT", "args": [3, 1]}, {"tool": "SQRT", "args": [[4, 9]]}]'
+        self.assertEqual(self.system.solve("What is problem a?", 3), {"result": 3})
+        self.assertEqual(self.server.request_count, 2)
+        self.server.responder = lambda prompt: '[{"tool": "CUBE", "args": [2]}]'
+        result = self.system.solve("What is problem b?", 8)
+        self.assertEqual(result, {"error": "Invalid plan: Step 0: unknown tool 'CUBE'"})
+        self.assertEqual(self.server.request_count, 4)
+
+    def test_plan_is_checked_before_running(self):
+        """A plan with a bad step is re-planned before any earlier step runs or gets an LLM correction"""
+        bad_plan = '[{"tool": "QUOTIENT", "args": [1, 0]}, {"tool": "SQRT", "args": [[4, 9]]}]'
+        streamed = MultiAgentSystem(os.path.join(self.tmp_dir.name, "streamed.json"), None, None, stream_plans=True)
+        for system in (self.system, streamed):
+            prompts = []
+            self.server.responder = lambda prompt: prompts.append(prompt) or \
+                ('[{"tool": "SQRT", "args": [9]}]' if "rejected" in prompt else bad_plan)
+            self.assertEqual(system.solve("What is problem a?", 3), {"result": 3})
+            self.assertEqual(len(prompts), 2)
+            self.assertIn("rejected", prompts[1])
+        streamed.virtual_tool_cache.close()
+
+    def test_streamed_step_is_corrected_after_the_plan_checks_out(self):
+        """A streamed step that fails is only sent to error correction once the whole plan has arrived"""
+        prompts = []
+        self.server.responder = lambda prompt: prompts.append(prompt) or \
+            ('[{"tool": "QUOTIENT", "args": [1, 1]}]' if "failed with error" in prompt
+             else '[{"tool": "QUOTIENT", "args": [1, 0]}, {"tool": "SUM", "args": ["$step0", 2]}]')
+        system = MultiAgentSystem(os.path.join(self.tmp_dir.name, "streamed.json"), None, None, stream_plans=True)
+        self.assertEqual(system.solve("What is problem a?", 3), {"result": 3})
+        self.assertEqual(len(prompts), 2)
+        self.assertIn("failed with error", prompts[1])
+        system.virtual_tool_cache.close()
+
+    def test_cached_answer_skips_openai(self):
+        """A fresh process answering from the cache never imports the OpenAI SDK"""
+        self.plans["What is problem a?"] = [{"tool": "PRODUCT", "args": [6, 7]}]
+        self.assertEqual(self.system.solve("What is problem a?", 42), {"result": 42})
+        self.system.virtual_tool_cache.compact()
+        code = ("import sys; from main2 import MultiAgentSystem; "
+                "system = MultiAgentSystem(*sys.argv[1:]); "
+                "print(system.solve('What is problem a?', 42), 'openai' in sys.modules)")
+        files = [os.path.join(self.tmp_dir.name, name) for name in ("virtual_tools.json", "llm_responses.sqlite", "rules.json")]
+        output = subprocess.run([sys.executable, "-c", code, *files], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), "{'result': 42} False")
+
+    def test_solve_many_batches_local_plans(self):
+        """Locally planned problems are executed in one batch; failures get the full path"""
+        cases = [(f"What is the sum of {i} and {i}?", 2 * i) for i in range(20)]
+        cases.append(("What is 10 divided by 0?", None))
+        results = self.system.solve_many(cases)
+        self.assertEqual(results[:20], [{"result": 2 * i} for i in range(20)])
+        self.assertIn("error", results[20])
+        batch = self.system.batch_executor
+        self.assertGreaterEqual(batch.vectorized + batch.scalar, 20)
+
+    def test_solve_many_plans_locally_once_off_the_loop(self):
+        """Each problem is looked up once, on a worker thread, even if it then takes the per-problem path"""
+        metrics = Metrics()
+        system = MultiAgentSystem(os.path.join(self.tmp_dir.name, "metered.json"), None, None, metrics=metrics)
+        for a, b in ((3, 4), (7, 8)):
+            system.virtual_tool_cache.add_virtual_tool(f"What is problem {a} and {b}?", [{"tool": "PRODUCT", "args": [a, b]}])
+        self.plans["What is problem b?"] = [{"tool": "SUM", "args": [1, 1]}]
+        threads = []
+        local_plan = system._local_plan
+        system._local_plan = lambda problem: threads.append(threading.current_thread()) or local_plan(problem)
+        cases = [("What is problem 5 and 6?", 30), ("What is problem b?", 2), ("What is 10 divided by 0?", None)]
+        results = system.solve_many(cases)
+        self.assertEqual(results[:2], [{"result": 30}, {"result": 2}])
+        self.assertIn("error", results[2])
+        counters = metrics.to_json()["counters"]
+        self.assertEqual((counters["cache_lookups{result=hit}"], counters["cache_lookups{result=miss}"]), (1, 1))
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(threading.main_thread(), threads)
+        system.virtual_tool_cache.close()
+
+    def test_solve_many_list_template(self):
+        """A cached plan summing a list is batched without failing the rest of the batch"""
+        for i in (1, 4):
+            self.system.virtual_tool_cache.add_virtual_tool(f"Add up the numbers {i}, {i + 1} and {i + 2}.",
+                                                            [{"tool": "SUM", "args": [[i, i + 1, i + 2]]}])
+        cases = [(f"Add up the numbers {i}, {i + 1} and {i + 2}.", 3 * i + 3) for i in range(80)]
+        self.assertEqual(self.system.solve_many(cases), [{"result": expected} for _, expected in cases])
+
+    def test_shared_sqlite_backend(self):
+        """Workers using the sqlite backend see each other's plans without restarting"""
+        cache_file = os.path.join(self.tmp_dir.name, "virtual_tools.sqlite")
+        workers = [MultiAgentSystem(cache_file, None, None, cache_backend="sqlite") for _ in range(2)]
+        self.plans["What is problem 7 and 8?"] = [{"tool": "PRODUCT", "args": [7, 8]}]
+        self.plans["What is problem 2 and 5?"] = [{"tool": "PRODUCT", "args": [2, 5]}]
+        self.assertEqual(workers[0].solve("What is problem 7 and 8?", 56), {"result": 56})
+        self.assertEqual(workers[0].solve("What is problem 2 and 5?", 10), {"result": 10})  # Confirms the template
+        self.assertEqual(workers[1].solve("What is problem 3 and 4?", 12), {"result": 12})
+        self.assertEqual(self.server.request_count, 2)
+        for worker in workers:
+            worker.virtual_tool_cache.close()
+
+    def test_metrics(self):
+        """Stages, tool calls, LLM usage and events are recorded when metrics are enabled"""
+        events = []
+        metrics = Metrics(listeners=[events.append])
+        system = MultiAgentSystem(os.path.join(self.tmp_dir.name, "metered.json"), None, None, metrics=metrics)
+        # Plans "problem a" and corrects any failed call to SUM(4, 0)
+        self.server.responder = lambda prompt: '[{"tool": "SUM", "args": [%s]}]' % ("1, 1" if "Your Turn" in prompt else "4, 0")
+        self.assertEqual(system.solve("What is problem a?", 2), {"result": 2})
+        self.assertEqual(system.solve("What is problem a?", 2), {"result": 2})
+        self.assertEqual(system.executor.execute("QUOTIENT", [4, 0]), 4)
+
+        report = metrics.to_json()
+        # Calls that ran: the planned SUM, the cached replay, the failing QUOTIENT and its corrected SUM
+        self.assertEqual(report["counters"]["tool_calls{tool=SUM}"], 3)
+        self.assertEqual(report["counters"]["tool_calls{tool=QUOTIENT}"], 1)
+        self.assertEqual(report["counters"]["tool_errors{tool=QUOTIENT}"], 1)
+        self.assertEqual(report["counters"]["cache_lookups{result=hit}"], 1)
+        self.assertEqual(report["histograms"]["stage_seconds{stage=plan}"]["count"], 1)
+        self.assertEqual(report["histograms"]["llm_request_seconds{model=gpt-3.5-turbo}"]["count"], 2)
+        self.assertGreater(report["histograms"]["llm_prompt_tokens{model=gpt-3.5-turbo}"]["max"], 0)
+        self.assertEqual(report["gauges"]["virtual_tool_cache_hit_ratio"], 0.5)
+        self.assertEqual([e["event"] for e in events], ["cache_hit", "tool_failed", "llm_correction"])
+        self.assertIn('mathbot_tool_calls_total{tool="SUM"} 3', metrics.to_prometheus())
+        system.virtual_tool_cache.close()
+
+    def test_streamed_plan_runs_steps_early(self):
+        """Steps run while the rest of the plan is still streaming"""
+        problem = "What is the average of the squares of 3 and 4?"
+        self.plans[problem] = [
+            {"tool": "POWER", "args": [3, 2]},
+            {"tool": "POWER", "args": [4, 2]},
+            {"tool": "AVG", "args": [["$step0", "$step1"]]},
+        ]
+        self.server.chunk_size, self.server.chunk_latency = 16, 0.02
+        system = MultiAgentSystem(os.path.join(self.tmp_dir.name, "streamed.json"),
+                                  os.path.join(self.tmp_dir.name, "streamed.sqlite"), None, stream_plans=True)
+        calls = []
+        execute = system.executor.execute
+        system.executor.execute = lambda tool, args, **kw: calls.append((tool, time.perf_counter())) or execute(tool, args, **kw)
+
+        self.assertEqual(system.solve(problem, 12.5), {"result": 12.5})
+        finished = time.perf_counter()
+        self.assertEqual([tool for tool, _ in calls], ["POWER", "POWER", "AVG"])
+        self.assertGreater(finished - calls[0][1], 0.05, "First step should run before the response is complete")
+        self.assertEqual(system.solve(problem, 12.5), {"result": 12.5})
+        self.assertEqual(self.server.request_count, 1)
+        system.virtual_tool_cache.close()
+        system.llm_cache.close()
+
+    def test_truncated_plan_keeps_complete_steps(self):
+        """A response cut off mid-step is planned from the steps before the cut"""
+        self.server.responder = lambda prompt: '[{"tool": "PRODUCT", "args": [6, 7]}, {"tool": "SU'
+        self.assertEqual(self.system.solve("What is problem a?", 42), {"result": 42})
+        self.server.responder = lambda prompt: '[{"tool": "SU'
+        self.assertIn("error", self.system.solve_many([("What is problem b?", 1)])[0])
+
+    def test_micro_batched_planning(self):
+        """Concurrent misses share planner requests; problems missing from the batched answer are retried"""
+        system = MultiAgentSystem(os.path.join(self.tmp_dir.name, "batched.json"), None, None,
+                                  plan_batch_size=8, plan_batch_wait=0.5)
+        cases = []
+        for name in "abcdefgh":
+            problem = f"What is problem {name}?"
+            self.plans[problem] = [{"tool": "SUM", "args": [len(cases), 1]}]
+            cases.append((problem, len(cases) + 1))
+        respond = self.server.responder
+        # The batched answer leaves out problem b
+        self.server.responder = lambda prompt: respond(prompt).replace('"1": [', '"x": [')
+        self.assertEqual(system.solve_many(cases, max_concurrency=8), [{"result": expected} for _, expected in cases])
+        self.assertEqual(self.server.request_count, 2)
+        self.assertEqual(system.batch_planner.stats()["retried"], 1)
+        system.virtual_tool_cache.close()
+
+if __name__ == '__main__':
+    unittest.main()
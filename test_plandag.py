@@ -0,0 +1,96 @@
+import unittest
+import json
+from plandag import validate_plan, compile_plan, step_dependencies, PlanStreamParser, parse_keyed_plans, \
+    fuse_modular_powers
+from toolbox import MathToolbox
+
+AVG_OF_SQUARES = [
+    {"tool": "POWER", "args": [3, 2]},
+    {"tool": "POWER", "args": [4, 2]},
+    {"tool": "AVG", "args": [["$step0", "$step1"]]},
+]
+
+class TestPlanDAG(unittest.TestCase):
+    def test_dependencies_and_order(self):
+        self.assertEqual(step_dependencies(AVG_OF_SQUARES), [set(), set(), {0, 1}])
+        self.assertEqual(validate_plan(AVG_OF_SQUARES), [0, 1, 2])
+        # References may point forward as long as there is no cycle
+        plan = [{"tool": "SQRT", "args": ["$step1"]}, {"tool": "SUM", "args": [7, 9]}, {"tool": "ABS", "args": ["$step0"]}]
+        self.assertEqual(validate_plan(plan), [1, 0, 2])
+
+    def test_invalid_plans(self):
+        invalid = [
+            [],
+            [{"tool": "SUM"}],
+            [{"tool": "SUM", "args": ["$step3", 1]}],
+            [{"tool": "SUM", "args": ["$step1", 1]}, {"tool": "SUM", "args": ["$step0", 1]}],
+        ]
+        for plan in invalid:
+            with self.assertRaises(ValueError, msg=str(plan)):
+                validate_plan(plan)
+
+    def test_compiled_plan(self):
+        """Compiled plans resolve step references and template slots"""
+        self.assertEqual(compile_plan(AVG_OF_SQUARES, MathToolbox())(), 12.5)
+        template = [{"tool": "POWER", "args": ["$0", 2]}, {"tool": "SUM", "args": ["$step0", "$1"]}]
+        run = compile_plan(template, MathToolbox())
+        self.assertEqual(run([3, 1]), 10)
+        self.assertEqual(run([5, 0]), 25)
+
+    def test_fuse_modular_powers(self):
+        plan = [{"tool": "POWER", "args": ["$0", "$1"]}, {"tool": "MODULO", "args": ["$step0", 1000]}]
+        fused = fuse_modular_powers(plan)
+        self.assertEqual(fused[0], {"tool": "POWMOD", "args": ["$0", "$1", 1000]})
+        self.assertEqual(fused[1], plan[1])
+        self.assertEqual(compile_plan(plan, MathToolbox())([999999999999, 10 ** 7]), pow(999999999999, 10 ** 7, 1000))
+        # The power is needed elsewhere, or is the divisor, so it must be computed in full
+        for unfused in ([plan[0], plan[1], {"tool": "SUM", "args": ["$step0", "$step1"]}],
+                        [plan[0], {"tool": "MODULO", "args": [7, "$step0"]}]):
+            self.assertIs(fuse_modular_powers(unfused), unfused)
+
+    def test_compile_rejects_unknown_tool(self):
+        with self.assertRaises(ValueError):
+            compile_plan([{"tool": "FACTORIAL", "args": [5]}], MathToolbox())
+
+    def test_stream_parser(self):
+        """Steps are handed out as soon as their objects close, whatever the chunking"""
+        text = "```json\n" + json.dumps(AVG_OF_SQUARES) + "\n```"
+        parser = PlanStreamParser()
+        seen = []
+        for i, ch in enumerate(text):
+            seen.extend((step, i) for step in parser.feed(ch))
+        self.assertEqual([step for step, _ in seen], AVG_OF_SQUARES)
+        self.assertEqual(seen[0][1], text.index("}"))
+        self.assertTrue(parser.complete)
+        self.assertEqual(parser.close(), AVG_OF_SQUARES)
+
+    def test_stream_parser_strings_and_truncation(self):
+        parser = PlanStreamParser()
+        step = {"tool": "SUM", "args": [1, 2], "note": 'a } or "]" here'}
+        self.assertEqual(parser.feed(json.dumps([step])[:-1] + ', {"tool": "PROD'), [step])
+        # A response cut off by max_tokens keeps its complete steps
+        self.assertFalse(parser.complete)
+        self.assertEqual(parser.close(), [step])
+        empty = PlanStreamParser()
+        empty.feed("[]")
+        self.assertEqual(empty.close(), [])
+
+    def test_stream_parser_rejects_non_plans(self):
+        for text in ('[{"tool": "SU', "Sorry, I can't help", "[1, 2]"):
+            with self.assertRaises(ValueError, msg=text):
+                parser = PlanStreamParser()
+                parser.feed(text)
+                parser.close()
+
+    def test_keyed_plans(self):
+        """Batched responses are split per problem; bad entries come back as None"""
+        sqrt = [{"tool": "SQRT", "args": [9]}]
+        response = json.dumps({"0": sqrt, "1": AVG_OF_SQUARES, "2": [{"tool": "SUM"}], "4": sqrt})
+        self.assertEqual(parse_keyed_plans(response, 4), [sqrt, AVG_OF_SQUARES, None, None])
+        # Cut off in the middle of the third plan
+        truncated = json.dumps({"0": sqrt, "1": AVG_OF_SQUARES, "2": sqrt})[:-12]
+        self.assertEqual(parse_keyed_plans(truncated, 3), [sqrt, AVG_OF_SQUARES, None])
+        self.assertEqual(parse_keyed_plans("Sorry", 2), [None, None])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from unittest import mock
+from metrics import Metrics
+from toolbox import MathToolbox
+from reliability import ReliableToolbox
+
+class TestReliableToolbox(unittest.TestCase):
+    def setUp(self):
+        self.toolbox = ReliableToolbox(MathToolbox(), min_calls=4, threshold=0.5, cooldown=60)
+
+    def test_majority_outvotes_wrong_results(self):
+        """A silently wrong result and a raised error are outvoted and counted as faults"""
+        outcomes = iter([9, ValueError("Intentional error"), 8, 8])
+        def flaky(a, b):
+            outcome = next(outcomes)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+        self.toolbox.toolbox.tools["UNRELIABLE_SUM"] = flaky
+        self.assertEqual(self.toolbox.get_tool("UNRELIABLE_SUM")(5, 3), 8)
+        stats = self.toolbox.stats()["UNRELIABLE_SUM"]
+        self.assertEqual((stats["attempts"], stats["faults"]), (4, 2))
+
+    def test_votes_count_as_tool_calls(self):
+        """Every voting attempt is a tool call, and so is a call the open breaker reroutes"""
+        metrics = Metrics()
+        toolbox = ReliableToolbox(MathToolbox(metrics=metrics), min_calls=1, threshold=0.5, cooldown=60)
+        toolbox.toolbox.tools["UNRELIABLE_SUM"] = mock.Mock(side_effect=[9, ValueError("Intentional error"), 8, 8])
+        self.assertEqual(toolbox.get_tool("UNRELIABLE_SUM")(5, 3), 8)
+        self.assertEqual(toolbox.get_tool("UNRELIABLE_SUM")(5, 3), 8)  # Breaker open: runs SUM
+        counters = metrics.to_json()["counters"]
+        self.assertEqual((counters["tool_calls{tool=UNRELIABLE_SUM}"], counters["tool_calls{tool=SUM}"]), (4, 1))
+
+    def test_no_majority_raises(self):
+        """Without a quorum the call fails so error correction can take over"""
+        self.toolbox.toolbox.tools["UNRELIABLE_PRODUCT"] = mock.Mock(side_effect=ValueError("Intentional error"))
+        with self.assertRaises(ValueError):
+            self.toolbox.get_tool("UNRELIABLE_PRODUCT")(4, 6)
+        self.assertEqual(self.toolbox.stats()["UNRELIABLE_PRODUCT"]["no_majority"], 1)
+
+    def test_breaker_reroutes_to_reliable_tool(self):
+        """Once the fault rate trips the breaker, calls go straight to SUM"""
+        broken = mock.Mock(side_effect=ValueError("Intentional error"))
+        self.toolbox.toolbox.tools["UNRELIABLE_SUM"] = broken
+        with self.assertRaises(ValueError):
+            self.toolbox.get_tool("UNRELIABLE_SUM")(5, 3)
+        calls = broken.call_count
+        self.assertEqual(self.toolbox.get_tool("UNRELIABLE_SUM")(5, 3), 8)
+        self.assertEqual(broken.call_count, calls)
+        stats = self.toolbox.stats()["UNRELIABLE_SUM"]
+        self.assertEqual((stats["breaker"], stats["rerouted"]), ("open", 1))
+
+    def test_other_tools_untouched(self):
+        self.assertIs(self.toolbox.get_tool("SUM"), self.toolbox.toolbox.get_tool("SUM"))
+        self.assertIn("POWER", self.toolbox.tool_costs())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+from ruleplanner import RuleBasedPlanner
+
+class TestRuleBasedPlanner(unittest.TestCase):
+    def setUp(self):
+        self.planner = RuleBasedPlanner()
+
+    def test_known_shapes(self):
+        """Every phrasing used in the test suites is planned without the LLM"""
+        cases = [
+            ("What is the sum of 5 and 3?", [{"tool": "SUM", "args": [5, 3]}]),
+            ("What is the product of 4 and 6?", [{"tool": "PRODUCT", "args": [4, 6]}]),
+            ("What is 20 divided by 4?", [{"tool": "QUOTIENT", "args": [20, 4]}]),
+            ("What is 2 to the power of 3?", [{"tool": "POWER", "args": [2, 3]}]),
+            ("What is the square root of 9?", [{"tool": "SQRT", "args": [9]}]),
+            ("What is the remainder when 17 is divided by 5?", [{"tool": "MODULO", "args": [17, 5]}]),
+            ("What is the absolute value of -15?", [{"tool": "ABS", "args": [-15]}]),
+            ("What is the average of 10 and 20?", [{"tool": "AVG", "args": [[10, 20]]}]),
+            ("Find the sum of 10 and 20.", [{"tool": "SUM", "args": [10, 20]}]),
+            ("what's 1.5 plus 2", [{"tool": "SUM", "args": [1.5, 2]}]),
+        ]
+        for problem, expected in cases:
+            self.assertEqual(self.planner.plan(problem), expected, problem)
+
+    def test_fallback_and_stats(self):
+        """Partially matching problems are left to the LLM and counted as misses"""
+        self.assertIsNone(self.planner.plan("What is the sum of 5 and 3 times 2?"))
+        self.planner.plan("What is the sum of 5 and 3?")
+        stats = self.planner.stats()
+        self.assertEqual(stats["hits"]["sum"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["coverage"], 0.5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import threading
+import time
+from scheduler import DAGScheduler
+from toolbox import MathToolbox
+
+class FakeExecutor:
+    """Executor stand-in whose error correction always fails, after an optional delay"""
+    def __init__(self, recover_delay=0.0, **toolbox_options):
+        self.toolbox = MathToolbox(**toolbox_options)
+        self.recover_delay = recover_delay
+        self.recovered = []
+
+    def execute(self, tool_name, args, recover=True, corrections=None):
+        try:
+            return self.toolbox.get_tool(tool_name)(*args)
+        except Exception as e:
+            return self.recover(tool_name, args, e)
+
+    def recover(self, tool_name, args, error, corrections=None):
+        time.sleep(self.recover_delay)
+        self.recovered.append((tool_name, str(error)))
+        return None
+
+class TestDAGScheduler(unittest.TestCase):
+    def test_routing(self):
+        scheduler = DAGScheduler(FakeExecutor(subprocess_bits=1000))
+        self.assertEqual(scheduler.route("SUM", [1, 2]), "inline")
+        self.assertEqual(scheduler.route("POWER", [2, 10]), "inline")
+        self.assertEqual(scheduler.route("POWER", [7, 10000]), "process")
+        self.assertEqual(scheduler.route("UNRELIABLE_SUM", [1, 2]), "thread")
+        # Without a time budget the toolbox never forks, so nothing is routed to a process
+        unbounded = DAGScheduler(FakeExecutor(subprocess_bits=1000, max_seconds=None))
+        self.assertEqual(unbounded.route("POWER", [7, 10000]), "inline")
+
+    def test_wide_plan(self):
+        """Independent big-integer steps run on worker threads and feed a later step"""
+        scheduler = DAGScheduler(FakeExecutor(subprocess_bits=1000))
+        plan = [
+            {"tool": "POWER", "args": [3, 5000]},
+            {"tool": "POWER", "args": [5, 5000]},
+            {"tool": "SUM", "args": ["$step0", "$step1"]},
+            {"tool": "MODULO", "args": ["$step2", 1000]},
+        ]
+        self.assertTrue(scheduler.parallelizable(plan))
+        try:
+            self.assertEqual(scheduler.run(plan), (3 ** 5000 + 5 ** 5000) % 1000)
+        finally:
+            scheduler.shutdown()
+
+    def test_error_propagation(self):
+        """A step that can't be corrected fails the plan and its dependents never run"""
+        executor = FakeExecutor()
+        scheduler = DAGScheduler(executor)
+        plan = [
+            {"tool": "QUOTIENT", "args": [1, 0]},
+            {"tool": "SUM", "args": ["$step0", 1]},
+        ]
+        self.assertIsNone(scheduler.run(plan))
+        self.assertEqual(executor.recovered, [("QUOTIENT", "Division by zero")])
+        scheduler.shutdown()
+
+    def test_cancellation(self):
+        scheduler = DAGScheduler(FakeExecutor(recover_delay=0.5))
+        cancel = threading.Event()
+        threading.Timer(0.05, cancel.set).start()
+        start = time.perf_counter()
+        self.assertIsNone(scheduler.run([{"tool": "SQRT", "args": [-1]}], cancel_event=cancel))
+        self.assertLess(time.perf_counter() - start, 0.4)
+        scheduler.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import json
+import os
+import tempfile
+from multiprocessing import get_context
+from sharedcache import SharedToolCache
+from virtualtoolcache import templatize, generalize, instantiate
+
+
+def learn(cache, problem, plan):
+    """Adds the problem and, if its plan generalizes, a second instance with every number changed to confirm it."""
+    template, values = templatize(problem)
+    cache.add_virtual_tool(problem, plan)
+    template_plan = generalize(plan, values)
+    if template_plan is not None:
+        other = [v + 100 for v in values]
+        cache.add_virtual_tool(template.format(*other), instantiate(template_plan, other))
+
+
+def _add_in_child(cache_file, problem, plan):
+    cache = SharedToolCache(cache_file)
+    learn(cache, problem, plan)
+    cache.close()
+
+
+class TestSharedToolCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.tmp_dir.name, "virtual_tools.sqlite")
+        self.cache = SharedToolCache(self.cache_file)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    def test_template_and_paraphrase_hits(self):
+        """Same lookup rules as VirtualToolCache"""
+        learn(self.cache, "What is the sum of 5 and 3?", [{"tool": "SUM", "args": [5, 3]}])
+        learn(self.cache, "What is the square root of 9?", [{"tool": "PRODUCT", "args": [3, 3]}])
+        self.assertEqual(self.cache.get_virtual_tool("What is the sum of 10 and 20?"), [{"tool": "SUM", "args": [10, 20]}])
+        self.assertEqual(self.cache.get_virtual_tool("Find the sum of 10 and 20."), [{"tool": "SUM", "args": [10, 20]}])
+        self.assertTrue(self.cache.exists("What is the square root of 9?"))
+        self.assertFalse(self.cache.exists("What is the square root of 16?"))
+        self.assertEqual(self.cache.stats()["templates"], 1)
+        # Like VirtualToolCache, a template needs a second instance whose numbers all differ
+        plan = lambda a, b: [{"tool": "POWER", "args": [a, 2]}, {"tool": "ROUND", "args": ["$step0"]}]
+        self.cache.add_virtual_tool("What is the square of 5 rounded to 2 places?", plan(5, 2))
+        self.cache.add_virtual_tool("What is the square of 7 rounded to 3 places?", plan(7, 3))
+        self.assertFalse(self.cache.exists("What is the square of 9 rounded to 4 places?"))
+        self.cache.add_virtual_tool("What is the product of 4 and 6?", [{"tool": "PRODUCT", "args": [4, 6]}])
+        self.assertFalse(self.cache.exists("What is the product of 1 and 2?"))
+        self.cache.add_virtual_tool("What is the product of 5 and 7?", [{"tool": "PRODUCT", "args": [5, 7]}])
+        self.assertTrue(self.cache.exists("What is the product of 1 and 2?"))
+        self.assertEqual(self.cache.stats()["templates"], 2)
+
+    def test_inserts_from_other_process_are_visible(self):
+        """A plan learned by another process is found without reopening the cache"""
+        self.assertFalse(self.cache.exists("What is the product of 2 and 7?"))
+        process = get_context("spawn").Process(target=_add_in_child, args=(
+            self.cache_file, "What is the product of 4 and 6?", [{"tool": "PRODUCT", "args": [4, 6]}]))
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+        self.assertEqual(self.cache.get_virtual_tool("Compute the product of 2 and 7"), [{"tool": "PRODUCT", "args": [2, 7]}])
+
+    def test_eviction_invalidation_and_hits(self):
+        cache = SharedToolCache(os.path.join(self.tmp_dir.name, "bounded.sqlite"), max_entries=2, stats_flush_interval=0)
+        other = SharedToolCache(cache.cache_file, max_entries=2)
+        learn(cache, "What is the sum of 5 and 3?", [{"tool": "SUM", "args": [5, 3]}])
+        learn(cache, "What is the product of 4 and 6?", [{"tool": "PRODUCT", "args": [4, 6]}])
+        cache.lookup("What is the sum of 1 and 2?")
+        learn(other, "What is 2 to the power of 3?", [{"tool": "POWER", "args": [2, 3]}])
+        self.assertFalse(cache.exists("What is the product of 1 and 2?"), "Evicted for every process")
+        self.assertTrue(cache.exists("What is the sum of 1 and 2?"))
+
+        key = "What is the sum of {0} and {1}?"
+        self.assertFalse(other.record_validation(key, True))
+        self.assertFalse(cache.record_validation(key, False))
+        self.assertFalse(cache.record_validation(key, False), "Learning the entry counts as a validation")
+        self.assertTrue(cache.record_validation(key, False))
+        self.assertFalse(other.exists("What is the sum of 1 and 2?"))
+        self.assertEqual(cache.stats()["entries"], 1)
+        cache.close()
+        other.close()
+
+    def test_seed_from_json(self):
+        seed_file = os.path.join(self.tmp_dir.name, "virtual_tools.json")
+        with open(seed_file, "w") as f:
+            json.dump({"What is the sum of {0} and {1}?": [{"tool": "SUM", "args": ["$0", "$1"]}]}, f)
+        cache = SharedToolCache(os.path.join(self.tmp_dir.name, "seeded.sqlite"), seed_file=seed_file)
+        self.assertTrue(cache.exists("What is the sum of 1 and 2?"))
+        cache.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+import time
+from toolbox import MathToolbox, CostLimitError
+
+class TestCostLimits(unittest.TestCase):
+    def test_estimate(self):
+        self.assertEqual(MathToolbox.estimate_bits("POWER", [999999999999, 10 ** 7]), 40 * 10 ** 7)
+        self.assertEqual(MathToolbox.estimate_bits("POWER", [1, 10 ** 12]), 0)
+        self.assertGreaterEqual(MathToolbox.estimate_bits("POWER", [3, 1000]), (3 ** 1000).bit_length())
+        self.assertEqual(MathToolbox.estimate_bits("PRODUCT", [2 ** 100, 2 ** 50]), 152)
+
+    def test_over_size_limit_is_rejected_before_running(self):
+        toolbox = MathToolbox()
+        start = time.perf_counter()
+        with self.assertRaises(CostLimitError):
+            toolbox.POWER(999999999999, 10 ** 7)
+        with self.assertRaises(CostLimitError):
+            toolbox.PRODUCT(2 ** 6_000_000, 2 ** 6_000_000)
+        self.assertLess(time.perf_counter() - start, 0.1)
+        self.assertEqual(toolbox.POWER(1, 10 ** 12), 1)
+        self.assertEqual(toolbox.POWER(2, -2), 0.25)
+
+    def test_large_calls_run_in_killable_process(self):
+        toolbox = MathToolbox(subprocess_bits=10_000, max_seconds=5)
+        self.assertEqual(toolbox.POWER(3, 20_000), 3 ** 20_000)
+        slow = MathToolbox(subprocess_bits=10_000, max_seconds=0.2)
+        start = time.perf_counter()
+        with self.assertRaises(CostLimitError):
+            slow.POWER(7, 5_000_000)
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+    def test_powmod(self):
+        toolbox = MathToolbox()
+        self.assertEqual(toolbox.POWMOD(999999999999, 10 ** 7, 1000), pow(999999999999, 10 ** 7, 1000))
+        self.assertEqual(toolbox.POWMOD(2, -1, 3), 0.5)  # Negative exponents fall back to POWER then MODULO
+        with self.assertRaises(ValueError):
+            toolbox.POWMOD(2, 10 ** 9, 0)
+
+if __name__ == '__main__':
+    unittest.main()
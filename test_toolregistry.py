@@ -0,0 +1,86 @@
+import unittest
+import subprocess
+import sys
+from toolregistry import ToolRegistry, Number, Numbers
+from toolbox import MathToolbox
+
+class TestToolRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = ToolRegistry()
+        self.calls = 0
+
+        @self.registry.tool(memoize=8)
+        def SQUARE(a: Number) -> Number:
+            self.calls += 1
+            return a * a
+
+        @self.registry.tool(cost="linear")
+        def TOTAL(numbers: Numbers, start: Number = 0) -> Number:
+            return sum(numbers, start)
+
+    def test_specs(self):
+        spec = self.registry.get("TOTAL")
+        self.assertEqual((spec.kinds, spec.required, spec.returns, spec.cost), (["numbers", "number"], 1, "number", "linear"))
+        self.assertEqual(self.registry.names(), ["SQUARE", "TOTAL"])
+        with self.assertRaises(ValueError):
+            self.registry.tool(pure=False, memoize=8)
+
+    def test_check_plan(self):
+        check = self.registry.check_plan
+        self.assertEqual(check([{"tool": "SQUARE", "args": [3]}, {"tool": "TOTAL", "args": [["$step0", "$0", 1.5]]}]), [])
+        # Strings only name files inside aggregates.DATA_DIR, which isn't configured here
+        self.assertEqual(check([{"tool": "TOTAL", "args": ["values.csv", 1]}]),
+                         ["Step 0: TOTAL argument 1 must be a list of numbers, got 'values.csv'"])
+        self.assertEqual(check([
+            {"tool": "CUBE", "args": [2]},
+            {"tool": "SQUARE", "args": [2, 3]},
+            {"tool": "TOTAL", "args": []},
+            {"tool": "SQUARE", "args": [[4, 9]]},
+            {"tool": "TOTAL", "args": [[1, [2]]]},
+            {"tool": "SQUARE", "args": ["nine"]},
+            {"tool": "SQUARE", "args": ["$step0"]},  # Unknown results aren't held against later steps
+        ]), [
+            "Step 0: unknown tool 'CUBE'",
+            "Step 1: SQUARE takes 1 arguments, got 2",
+            "Step 2: TOTAL takes 1 to 2 arguments, got 0",
+            "Step 3: SQUARE argument 1 must be a number, got [4, 9]",
+            "Step 4: TOTAL argument 1 must be a list of numbers, got [1, [2]]",
+            "Step 5: SQUARE argument 1 must be a number, got 'nine'",
+        ])
+        self.assertEqual(check([{"tool": "SQUARE", "args": [1]}, {"tool": "SQUARE", "args": [True]}], steps=[0]), [])
+
+    def test_memoization(self):
+        square = self.registry.get("SQUARE").bind()
+        self.assertEqual([square(3), square(3), square(3.0)], [9, 9, 9.0])
+        self.assertIs(type(square(3.0)), float)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(square.cache_info().hits, 2)
+        total = self.registry.get("TOTAL").bind()
+        self.assertEqual(total([1, 2]), 3)  # Not memoized, and unhashable anyway
+
+    def test_lazy_modules(self):
+        """Tool modules registered by name are only imported when one of their tools is looked up"""
+        code = ("import sys, toolbox; loaded = 'aggregates' in sys.modules; box = toolbox.MathToolbox(); "
+                "assert 'AVG' in box.registry.names() and 'AVG' in list(box.tools); box.check_plan([{'tool': 'SQRT', 'args': [4]}]); "
+                "assert 'aggregates' not in sys.modules; assert box.get_tool('AVG')([1, 2]) == 1.5; "
+                "print(loaded, 'aggregates' in sys.modules)")
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.split(), ["False", "True"])
+
+    def test_toolbox_tools(self):
+        toolbox = MathToolbox()
+        self.assertEqual(toolbox.cost("POWER"), "bigint")
+        self.assertEqual(toolbox.cost("AVG"), "linear")
+        self.assertFalse(toolbox.registry.get("UNRELIABLE_SUM").pure)
+        self.assertEqual(toolbox.get_tool("POWMOD")(3, 200, 7), pow(3, 200, 7))
+        # tools maps every registered name to its callable; assigning one overrides it
+        self.assertEqual(sorted(toolbox.tools), toolbox.registry.names())
+        self.assertEqual(toolbox.tools["SUM"](2, 3), 5)
+        self.assertNotIn("NOPE", toolbox.tools)
+        toolbox.tools["SUM"] = lambda a, b: 0
+        self.assertEqual(toolbox.get_tool("SUM")(2, 3), 0)
+        self.assertEqual(toolbox.check_plan([{"tool": "SUM", "args": [[1, 2, 3]]}, {"tool": "SUM", "args": ["$step0", 4]}]), [])
+        self.assertEqual(len(toolbox.check_plan([{"tool": "AVG", "args": [1, 2]}, {"tool": "SQRT", "args": [[1]]}])), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,279 @@
+import unittest
+import json
+import os
+import tempfile
+from similarity import NGramIndex, canonical
+from virtualtoolcache import VirtualToolCache, templatize, generalize, instantiate
+
+
+def learn(cache, problem, plan):
+    """Adds the problem and, if its plan generalizes, a second instance with every number changed to confirm it."""
+    template, values = templatize(problem)
+    cache.add_virtual_tool(problem, plan)
+    template_plan = generalize(plan, values)
+    if template_plan is not None:
+        other = [v + 100 for v in values]
+        cache.add_virtual_tool(template.format(*other), instantiate(template_plan, other))
+
+
+class TestVirtualToolCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.tmp_dir.name, "virtual_tools.json")
+        self.cache = VirtualToolCache(self.cache_file)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    def test_templatize(self):
+        """Numeric literals are pulled out into slots"""
+        self.assertEqual(templatize("What is the sum of 5 and -3.5?"), ("What is the sum of {0} and {1}?", [5, -3.5]))
+        self.assertEqual(templatize("What is the sum of {0} and {1}?"), ("What is the sum of {0} and {1}?", []))
+
+    def test_template_hit(self):
+        """A plan learned for one set of numbers is reused for another"""
+        learn(self.cache, "What is the sum of 5 and 3?", [{"tool": "SUM", "args": [5, 3]}])
+        self.assertTrue(self.cache.exists("What is the sum of 10 and 20?"))
+        self.assertEqual(self.cache.get_virtual_tool("What is the sum of 10 and 20?"),
+                         [{"tool": "SUM", "args": [10, 20]}])
+
+    def test_template_needs_a_second_instance(self):
+        """One problem can't tell a constant from a problem number equal to it; a second one with other numbers can"""
+        plan = lambda a, b: [{"tool": "POWER", "args": [a, 2]}, {"tool": "ROUND", "args": ["$step0"]}]
+        self.cache.add_virtual_tool("What is the square of 5 rounded to 2 places?", plan(5, 2))
+        self.assertFalse(self.cache.exists("What is the square of 7 rounded to 3 places?"))
+        self.assertEqual(self.cache.get_virtual_tool("What is the square of 5 rounded to 2 places?"), plan(5, 2))
+        self.cache.add_virtual_tool("What is the square of 7 rounded to 3 places?", plan(7, 3))
+        self.assertEqual(self.cache.templates, {})
+        self.assertEqual(len(self.cache.tools), 2)
+
+        self.cache.add_virtual_tool("What is the sum of 5 and 3?", [{"tool": "SUM", "args": [5, 3]}])
+        self.cache.add_virtual_tool("What is the sum of 5 and 4?", [{"tool": "SUM", "args": [5, 4]}])
+        self.assertFalse(self.cache.exists("What is the sum of 1 and 2?"), "Only the second number changed")
+        self.cache.add_virtual_tool("What is the sum of 10 and 20?", [{"tool": "SUM", "args": [10, 20]}])
+        self.assertEqual(self.cache.get_virtual_tool("What is the sum of 1 and 2?"), [{"tool": "SUM", "args": [1, 2]}])
+        self.assertNotIn("What is the sum of 5 and 4?", self.cache.tools, "Covered by the template")
+
+    def test_unparameterizable_plan_stays_exact(self):
+        """Plans with constants that don't come from the problem are not generalized"""
+        learn(self.cache, "What is the square root of 9?", [{"tool": "PRODUCT", "args": [3, 3]}])
+        self.assertTrue(self.cache.exists("What is the square root of 9?"))
+        self.assertFalse(self.cache.exists("What is the square root of 16?"))
+
+    def test_constant_equal_to_problem_number_stays_exact(self):
+        """A constant that happens to equal a number in the problem is not turned into its slot"""
+        learn(self.cache, "What is 3 cubed?", [{"tool": "POWER", "args": [3, 3]}])
+        self.assertEqual(self.cache.get_virtual_tool("What is 3 cubed?"), [{"tool": "POWER", "args": [3, 3]}])
+        self.assertFalse(self.cache.exists("What is 4 cubed?"))
+
+    def test_paraphrase_lookup(self):
+        """Paraphrases and typos reuse a cached template; different operations and slot counts don't"""
+        learn(self.cache, "What is the sum of 5 and 3?", [{"tool": "SUM", "args": [5, 3]}])
+        learn(self.cache, "What is the square root of 16?", [{"tool": "SQRT", "args": [16]}])
+        self.assertEqual(self.cache.get_virtual_tool("Find the sum of 10 and 20."), [{"tool": "SUM", "args": [10, 20]}])
+        self.assertEqual(self.cache.get_virtual_tool("  calculate the SUM of 10 and 20 "), [{"tool": "SUM", "args": [10, 20]}])
+        self.assertEqual(self.cache.get_virtual_tool("What is the square roots of 25?"), [{"tool": "SQRT", "args": [25]}])
+        self.assertIsNone(self.cache.lookup("What is the sum of 1 and 2 and 3?"))
+        self.assertIsNone(self.cache.lookup("What is the cube root of 27?"))
+        self.assertFalse(self.cache.exists("Find the sum of 10 and 20."), "exists() stays exact")
+
+        learn(self.cache, "What is the product of 4 and 6?", [{"tool": "PRODUCT", "args": [4, 6]}])
+        self.assertEqual(self.cache.get_virtual_tool("Compute the product of 2 and 7"), [{"tool": "PRODUCT", "args": [2, 7]}])
+
+        exact = VirtualToolCache(os.path.join(self.tmp_dir.name, "other.json"), similarity_threshold=None)
+        learn(exact, "What is the sum of 5 and 3?", [{"tool": "SUM", "args": [5, 3]}])
+        self.assertIsNone(exact.lookup("Find the sum of 10 and 20."))
+        exact.close()
+
+    def test_similarity_index_builds_on_first_query(self):
+        """Templates are only hashed into LSH buckets when a fuzzy lookup needs them, all at once"""
+        index = NGramIndex()
+        words = [a + b for a in ("blorf", "grunt", "zib", "wemble", "quax") for b in ("ing", "er", "ly", "ish", "ed")]
+        texts = [f"What is the {a} {b} of {{0}} and {{1}}?" for a in words for b in words if a != b][:200]
+        for i, text in enumerate(texts):
+            index.add(text, str(i))
+        index.remove(texts[1])
+        self.assertEqual(len(index.buckets), 0)
+        self.assertEqual(index.query(texts[5].replace("What is", "Calculate"))[0][2], "5")
+        self.assertEqual(index.query(texts[8].replace("of", "for"))[0][2], "8")
+        self.assertFalse(any(index.query(texts[1], threshold=1.0)))
+        # Signatures computed for the whole batch match one text at a time
+        grams = [index._grams(canonical(text)) for text in texts]
+        self.assertEqual(index._signatures(grams), [index._signatures([g])[0] for g in grams])
+
+    def test_legacy_file_migration(self):
+        """Per-string entries from older cache files are folded into templates once two of them agree"""
+        with open(self.cache_file, "w") as f:
+            json.dump({
+                "What is 2 to the power of 2?": [{"tool": "POWER", "args": [2, 2]}],
+                "What is 2 to the power of 3?": [{"tool": "POWER", "args": [2, 3]}],
+                "What is 3 to the power of 4?": [{"tool": "POWER", "args": [3, 4]}],
+            }, f)
+        cache = VirtualToolCache(self.cache_file)
+        self.assertEqual(cache.tools, {})
+        self.assertEqual(cache.get_virtual_tool("What is 5 to the power of 2?"),
+                         [{"tool": "POWER", "args": [5, 2]}])
+
+    def test_log_replay(self):
+        """Inserts are appended to the log and replayed on startup, skipping torn records"""
+        learn(self.cache, "What is the sum of 5 and 3?", [{"tool": "SUM", "args": [5, 3]}])
+        self.assertFalse(os.path.exists(self.cache_file), "Inserts should not rewrite the snapshot")
+        with open(self.cache_file + ".log", "a") as f:
+            f.write('{"problem": "What is the product of')  # Simulated crash mid-write
+        cache = VirtualToolCache(self.cache_file)
+        self.assertTrue(cache.exists("What is the sum of 1 and 2?"))
+        cache.close()
+
+    def test_compaction(self):
+        """Compaction folds records from every writer into the snapshot and truncates the log"""
+        other = VirtualToolCache(self.cache_file)
+        learn(self.cache, "What is the sum of 5 and 3?", [{"tool": "SUM", "args": [5, 3]}])
+        learn(other, "What is the product of 4 and 6?", [{"tool": "PRODUCT", "args": [4, 6]}])
+        self.cache.compact()
+        other.close()
+        self.assertEqual(os.path.getsize(self.cache_file + ".log"), 0)
+        with open(self.cache_file) as f:
+            snapshot = json.load(f)
+        self.assertIn("What is the sum of {0} and {1}?", snapshot)
+        self.assertIn("What is the product of {0} and {1}?", snapshot)
+
+    def test_compaction_keeps_other_writers_snapshot(self):
+        """Entries another process already compacted survive this process's compaction"""
+        other = VirtualToolCache(self.cache_file)
+        learn(self.cache, "problem alpha", [{"tool": "ABS", "args": [-1]}])
+        learn(other, "problem beta", [{"tool": "ABS", "args": [-2]}])
+        learn(other, "problem delta", [{"tool": "ABS", "args": [-4]}])
+        other.compact()
+        other.invalidate("problem delta")
+        other.close()
+        learn(self.cache, "problem gamma", [{"tool": "ABS", "args": [-3]}])
+        self.cache.compact()
+        reloaded = VirtualToolCache(self.cache_file)
+        for name in ("alpha", "beta", "gamma"):
+            self.assertTrue(reloaded.exists(f"problem {name}"), name)
+        self.assertFalse(reloaded.exists("problem delta"), "Invalidated after the other compaction")
+        reloaded.close()
+
+    def test_lru_eviction(self):
+        """Past max_entries the least recently used entries go, in memory and at compaction on disk"""
+        evicted = []
+        cache = VirtualToolCache(os.path.join(self.tmp_dir.name, "bounded.json"), max_entries=3, on_evict=evicted.append)
+        learn(cache, "What is the sum of 5 and 3?", [{"tool": "SUM", "args": [5, 3]}])
+        learn(cache, "What is the product of 4 and 6?", [{"tool": "PRODUCT", "args": [4, 6]}])
+        learn(cache, "What is 2 to the power of 3?", [{"tool": "POWER", "args": [2, 3]}])
+        cache.lookup("What is the sum of 1 and 2?")
+        learn(cache, "What is the square root of 16?", [{"tool": "SQRT", "args": [16]}])
+        self.assertEqual(evicted, ["What is the product of {0} and {1}?"])
+        self.assertTrue(cache.exists("What is the sum of 1 and 2?"))
+        self.assertEqual(cache.entry_stats["What is the sum of {0} and {1}?"].hits, 1)
+        stats = cache.stats()
+        self.assertEqual((stats["entries"], stats["evictions"], stats["hits"]), (3, 1, 1))
+
+        cache.compact()
+        cache.close()
+        reloaded = VirtualToolCache(os.path.join(self.tmp_dir.name, "bounded.json"), max_entries=3)
+        self.assertFalse(reloaded.exists("What is the product of 4 and 6?"))
+        reloaded.close()
+
+    def test_lfu_and_byte_budget(self):
+        cache = VirtualToolCache(os.path.join(self.tmp_dir.name, "bounded.json"), max_entries=None,
+                                 max_bytes=150, eviction="lfu")
+        learn(cache, "What is the sum of 5 and 3?", [{"tool": "SUM", "args": [5, 3]}])
+        learn(cache, "What is the product of 4 and 6?", [{"tool": "PRODUCT", "args": [4, 6]}])
+        for _ in range(2):
+            cache.lookup("What is the sum of 1 and 2?")
+        cache.lookup("What is the product of 1 and 2?")
+        learn(cache, "What is 2 to the power of 3?", [{"tool": "POWER", "args": [2, 3]}])
+        self.assertLessEqual(cache.stats()["bytes"], 150)
+        self.assertTrue(cache.exists("What is the sum of 1 and 2?"))
+        self.assertFalse(cache.exists("What is 2 to the power of 4?"), "Least frequently used, despite being newest")
+        cache.close()
+
+    def test_invalidation(self):
+        """Entries that fail validation more often than they pass are dropped, also for other processes"""
+        learn(self.cache, "What is the square root of 9?", [{"tool": "PRODUCT", "args": [3, 3]}])
+        learn(self.cache, "What is the sum of 5 and 3?", [{"tool": "SUM", "args": [5, 3]}])
+        key = "What is the sum of {0} and {1}?"
+        self.assertFalse(self.cache.record_validation(key, True))
+        self.assertFalse(self.cache.record_validation(key, False))
+        self.assertFalse(self.cache.record_validation("What is the square root of 9?", False),
+                         "Learning the entry counts as a validation")
+        self.assertTrue(self.cache.record_validation("What is the square root of 9?", False))
+        self.assertIsNone(self.cache.lookup("What is the square root of 9?"))
+        self.assertTrue(self.cache.exists("What is the sum of 1 and 2?"))
+        self.assertEqual(self.cache.stats()["invalidations"], 1)
+
+        self.assertTrue(self.cache.invalidate(key))
+        reloaded = VirtualToolCache(self.cache_file)
+        self.assertFalse(reloaded.exists("What is the sum of 1 and 2?"))
+        learn(reloaded, "What is the sum of 5 and 3?", [{"tool": "SUM", "args": [5, 3]}])
+        reloaded.close()
+        reloaded = VirtualToolCache(self.cache_file)
+        self.assertTrue(reloaded.exists("What is the sum of 1 and 2?"), "Re-learned after invalidation")
+        reloaded.close()
+
+    def test_lazy_load(self):
+        """With an index beside the snapshot, hits are read one entry at a time until a miss or insert loads everything"""
+        learn(self.cache, "What is the sum of 5 and 3?", [{"tool": "SUM", "args": [5, 3]}])
+        learn(self.cache, "What is the square root of 9?", [{"tool": "PRODUCT", "args": [3, 3]}])
+        for i in range(20):
+            learn(self.cache, f"Shape {chr(97 + i)} of {i}", [{"tool": "ABS", "args": [i]}])
+        self.cache.compact()
+        learn(self.cache, "What is the product of 4 and 6?", [{"tool": "PRODUCT", "args": [4, 6]}])  # Log only
+        with open(self.cache_file) as f:
+            self.assertEqual(len(json.load(f)), 22)
+
+        cache = VirtualToolCache(self.cache_file, lazy_load=True)
+        self.assertEqual(cache.get_virtual_tool("What is the sum of 10 and 20?"), [{"tool": "SUM", "args": [10, 20]}])
+        self.assertEqual(cache.get_virtual_tool("What is the square root of 9?"), [{"tool": "PRODUCT", "args": [3, 3]}])
+        self.assertEqual(cache.get_virtual_tool("Shape t of 7"), [{"tool": "ABS", "args": [7]}])
+        self.assertTrue(cache.exists("Shape c of 1"))
+        self.assertFalse(cache.exists("Shape z of 1"))
+        self.assertEqual(cache.get_virtual_tool("What is the product of 1 and 2?"), [{"tool": "PRODUCT", "args": [1, 2]}])
+        self.assertEqual(cache.stats()["entries"], 4)
+        self.assertEqual(cache.get_virtual_tool("Find the sum of 1 and 2."), [{"tool": "SUM", "args": [1, 2]}])  # Paraphrase
+        self.assertEqual(cache.stats()["entries"], 23)
+        self.assertEqual(cache.entry_stats["What is the sum of {0} and {1}?"].hits, 2)
+        cache.close()
+
+        # Another process's compaction replaces the snapshot the index points into
+        cache = VirtualToolCache(self.cache_file, lazy_load=True)
+        learn(self.cache, "What is the total of 4 and 6?", [{"tool": "SUM", "args": [4, 6]}])
+        self.cache.compact()
+        os.utime(self.cache_file, ns=(0, 0))
+        self.assertEqual(cache.get_virtual_tool("Shape b of 2"), [{"tool": "ABS", "args": [2]}])
+        self.assertTrue(cache.exists("What is the total of 1 and 2?"))
+        cache.close()
+
+        # Without an index the cache is loaded in full and indexed in the background, without rewriting the snapshot
+        with open(self.cache_file + ".idx", "rb") as f:
+            index = f.read()
+        os.remove(self.cache_file + ".idx")
+        snapshot_stat = os.stat(self.cache_file)
+        cache = VirtualToolCache(self.cache_file, lazy_load=True)
+        self.assertEqual(cache.stats()["entries"], 24)
+        cache.close()
+        self.assertEqual(os.stat(self.cache_file).st_mtime_ns, snapshot_stat.st_mtime_ns)
+        with open(self.cache_file + ".idx", "rb") as f:
+            self.assertEqual(f.read().split(b"\n")[1:], index.split(b"\n")[1:])  # The header's mtime was changed above
+        cache = VirtualToolCache(self.cache_file, lazy_load=True)
+        self.assertEqual(cache.stats()["entries"], 0)
+        self.assertTrue(cache.exists("Shape b of 2"))
+        cache.close()
+
+        # A legacy snapshot can't be indexed in place; it is loaded in full and left as it is
+        legacy_file = os.path.join(self.tmp_dir.name, "legacy.json")
+        with open(legacy_file, "w") as f:
+            json.dump({"What is the sum of {0} and {1}?": [{"tool": "SUM", "args": ["$0", "$1"]}]}, f, indent=4)
+        with open(legacy_file, "rb") as f:
+            legacy = f.read()
+        cache = VirtualToolCache(legacy_file, lazy_load=True)
+        self.assertTrue(cache.exists("What is the sum of 1 and 2?"))
+        cache.close()
+        with open(legacy_file, "rb") as f:
+            self.assertEqual(f.read(), legacy)
+        self.assertFalse(os.path.exists(legacy_file + ".idx"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,57 +1,217 @@
 import random
+import functools
 import math
-from typing import Callable, Dict
+import operator
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+from metrics import NULL_METRICS, NullMetrics
+from toolregistry import TOOLS, ToolRegistry, Number, Numbers, tool
+
+
+class CostLimitError(ValueError):
+    """A tool call over the toolbox's result size or time budget. Retrying or correcting it won't help."""
+
+
+def _call_in_child(conn, fn, args):
+    try:
+        conn.send((True, fn(*args)))
+    except Exception as e:
+        conn.send((False, e))
+
+
+def run_with_timeout(fn: Callable, args: List[Any], timeout: float):
+    """
+    Runs fn(*args) in a child process and returns its result; the child is killed
+    and CostLimitError raised after `timeout` seconds. Children are forked where
+    possible: they inherit the operands, only compute and send the result back,
+    so they never need a lock another thread held at fork time. Elsewhere fn and
+    args must be picklable.
+    """
+    import multiprocessing  # Only heavy calls need it; keeps importing the toolbox cheap
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    child = context.Process(target=_call_in_child, args=(sender, fn, args), daemon=True)
+    child.start()
+    sender.close()
+    try:
+        if not receiver.poll(timeout):
+            raise CostLimitError(f"Took longer than the {timeout:g} s budget")
+        ok, value = receiver.recv()
+    except EOFError:  # Killed (e.g. out of memory) before answering
+        raise CostLimitError("Worker process died")
+    finally:
+        child.kill()
+        child.join()
+        receiver.close()
+    if not ok:
+        raise value
+    return value
+
+
+# Implemented in aggregates.py, imported (with NumPy) the first time a plan uses one
+TOOLS.lazy("aggregates", "AVG", "MIN", "MAX", "VARIANCE")
+
+
+class ToolTable(MutableMapping):
+    """
+    MathToolbox.tools: name -> callable for every tool in the registry, bound on
+    first access (so listing names doesn't import lazily registered modules).
+    Assigning a name overrides that tool for the toolbox.
+    """
+
+    def __init__(self, toolbox: "MathToolbox"):
+        self._toolbox = toolbox
+
+    def __getitem__(self, name: str) -> Callable:
+        if name not in self._toolbox._bound and self._toolbox.registry.get(name) is None:
+            raise KeyError(name)
+        return self._toolbox.get_tool(name)
+
+    def __setitem__(self, name: str, fn: Callable):
+        self._toolbox._bound[name] = self._toolbox._counted(name, fn)
+
+    def __delitem__(self, name: str):
+        del self._toolbox._bound[name]  # Registry tools are bound again on next use
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(sorted(set(self._toolbox.registry.names()) | self._toolbox._bound.keys()))
+
+    def __len__(self) -> int:
+        return len(set(self._toolbox.registry.names()) | self._toolbox._bound.keys())
+
 
 class MathToolbox:
-    def __init__(self):
-        self.tools: Dict[str, Callable] = {
-            "SUM": self.SUM,
-            "PRODUCT": self.PRODUCT,
-            "QUOTIENT": self.QUOTIENT,
-            "POWER": self.POWER,
-            "SQRT": self.SQRT,
-            "AVG": self.AVG,
-            "ROUND": self.ROUND,
-            "MODULO": self.MODULO,
-            "ABS": self.ABS,
-            "UNRELIABLE_SUM": self.UNRELIABLE_SUM,
-            "UNRELIABLE_PRODUCT": self.UNRELIABLE_PRODUCT,
-        }
+    def __init__(self, max_result_bits: Optional[int] = 10_000_000, subprocess_bits: int = 1_000_000,
+                 max_seconds: Optional[float] = 2.0, registry: ToolRegistry = TOOLS,
+                 metrics: Optional[NullMetrics] = None):
+        """
+        Big-integer tools (POWER, PRODUCT) are costed from their operands' bit
+        lengths before running: results estimated over max_result_bits are
+        rejected at once with CostLimitError, and results over subprocess_bits
+        are computed in a child process that is killed after max_seconds. At the
+        defaults that is a ~1.2 MB result, about two seconds of CPU.
+
+        Tools come from `registry` (see toolregistry.py) and are bound on first use.
+        With `metrics` enabled, every call a bound tool makes is counted as
+        tool_calls, whoever makes it (plans, compiled plans, corrections, votes).
+        """
+        self.max_result_bits = max_result_bits
+        self.subprocess_bits = subprocess_bits
+        self.max_seconds = max_seconds
+        self.registry = registry
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self._bound: Dict[str, Callable] = {}
+        self.tools = ToolTable(self)
 
     def get_tool(self, name: str) -> Callable:
-        if name in self.tools:
-            return self.tools[name]
-        raise ValueError(f"Tool '{name}' not found.")
+        fn = self._bound.get(name)
+        if fn is None:
+            spec = self.registry.get(name)
+            if spec is None:
+                raise ValueError(f"Tool '{name}' not found.")
+            fn = self._bound[name] = self._counted(name, spec.bind(self))
+        return fn
+
+    def _counted(self, name: str, fn: Callable) -> Callable:
+        if not self.metrics.enabled:
+            return fn
+        count = self.metrics.count
+
+        @functools.wraps(fn)
+        def counted(*args):
+            count("tool_calls", tool=name)
+            return fn(*args)
+        return counted
+
+    def __getattr__(self, name):
+        # Tools from lazily imported modules, e.g. toolbox.AVG
+        if name.isupper() and "registry" in self.__dict__ and self.registry.get(name) is not None:
+            return self.get_tool(name)
+        raise AttributeError(name)
+
+    def cost(self, name: str) -> str:
+        """
+        Relative cost class of a tool, used to decide where a plan step runs:
+        "scalar" ops are cheap, "bigint" ops grow with operand size, "linear" ops
+        with the length of their input, and "unreliable" ops may need (slow) error
+        correction.
+        """
+        spec = self.registry.get(name)
+        return spec.cost if spec is not None else "scalar"
+
+    def tool_costs(self) -> Dict[str, str]:
+        """Cost class (see cost) of every tool whose module has been imported."""
+        return {name: spec.cost for name, spec in self.registry.specs.items()}
+
+    def check_plan(self, plan: List[Dict[str, Any]], steps=None) -> List[str]:
+        """Signature problems in the plan; see ToolRegistry.check_plan."""
+        return self.registry.check_plan(plan, steps)
 
-    # Static methods for tools
     @staticmethod
-    def SUM(a, b): return a + b
+    def estimate_bits(name: str, args: List[Any]) -> int:
+        """Rough bit length of a bigint tool's result, 0 when it isn't an integer op."""
+        if len(args) != 2 or not all(isinstance(a, int) for a in args):
+            return 0
+        a, b = args
+        if name == "POWER":
+            # An upper bound; 0, 1 and -1 stay small however large the exponent
+            return abs(a).bit_length() * b if b > 0 and abs(a) > 1 else 0
+        if name == "PRODUCT":
+            return abs(a).bit_length() + abs(b).bit_length()
+        return 0
+
+    def _bounded(self, name: str, op: Callable, a, b):
+        bits = self.estimate_bits(name, [a, b])
+        if self.max_result_bits is not None and bits > self.max_result_bits:
+            raise CostLimitError(f"{name} result would be about {bits:,} bits, over the {self.max_result_bits:,} bit limit")
+        if bits > self.subprocess_bits and self.max_seconds is not None:
+            return run_with_timeout(op, [a, b], self.max_seconds)
+        return op(a, b)
+
+    # The tools. SUM of a single argument takes a list, NumPy array, iterator or
+    # file path, like the aggregates in aggregates.py.
     @staticmethod
-    def PRODUCT(a, b): return a * b
+    @tool()
+    def SUM(a: Union[Number, Numbers], b: Number = None) -> Number:
+        if b is None:
+            from aggregates import total
+            return total(a)
+        return a + b
+    @tool(cost="bigint")
+    def PRODUCT(self, a: Number, b: Number) -> Number: return self._bounded("PRODUCT", operator.mul, a, b)
     @staticmethod
-    def QUOTIENT(a, b):
+    @tool()
+    def QUOTIENT(a: Number, b: Number) -> Number:
         if b == 0: raise ValueError("Division by zero")
         return a / b
+    @tool(cost="bigint", memoize=16)  # Few, since a result can be up to max_result_bits
+    def POWER(self, a: Number, b: Number) -> Number: return self._bounded("POWER", operator.pow, a, b)
+    @tool(memoize=256)
+    def POWMOD(self, a: Number, b: Number, m: Number) -> Number:
+        """(a ** b) % m; modular exponentiation keeps the intermediate result below m."""
+        if m == 0: raise ValueError("Division by zero")
+        if all(isinstance(x, int) for x in (a, b, m)) and b >= 0:
+            return pow(a, b, m)
+        return self.MODULO(self.POWER(a, b), m)
     @staticmethod
-    def POWER(a, b): return a ** b
-    @staticmethod
-    def SQRT(a):
+    @tool()
+    def SQRT(a: Number) -> Number:
         if a < 0: raise ValueError("Negative sqrt")
         return math.sqrt(a)
     @staticmethod
-    def AVG(numbers):
-        if not numbers: raise ValueError("Empty list")
-        return sum(numbers) / len(numbers)
-    @staticmethod
-    def ROUND(a): return round(a)
+    @tool()
+    def ROUND(a: Number) -> Number: return round(a)
     @staticmethod
-    def MODULO(a, b):
+    @tool()
+    def MODULO(a: Number, b: Number) -> Number:
         if b == 0: raise ValueError("Division by zero")
         return a % b
     @staticmethod
-    def ABS(a): return abs(a)
+    @tool()
+    def ABS(a: Number) -> Number: return abs(a)
     @staticmethod
-    def UNRELIABLE_SUM(a, b):
+    @tool(pure=False, cost="unreliable")
+    def UNRELIABLE_SUM(a: Number, b: Number) -> Number:
         if random.random() < 0.4:  # 40% error rate
             if random.random() < 0.5:
                 raise ValueError("Intentional error")
@@ -59,10 +219,11 @@ class MathToolbox:
                 return a + b + random.randint(-10, 10)
         return a + b
     @staticmethod
-    def UNRELIABLE_PRODUCT(a, b):
+    @tool(pure=False, cost="unreliable")
+    def UNRELIABLE_PRODUCT(a: Number, b: Number) -> Number:
         if random.random() < 0.3:  # 30% error rate
             if random.random() < 0.5:
                 raise ValueError("Intentional error")
             else:
                 return a * b + random.randint(-10, 10)
-        return a * b
\ No newline at end of file
+        return a * b
@@ -0,0 +1,162 @@
+import functools
+import importlib
+import inspect
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Union
+from plandag import STEP_REF_PATTERN
+from virtualtoolcache import SLOT_PATTERN
+
+# Argument and result types tools are annotated with; anything else isn't checked
+Number = Union[int, float]
+Numbers = Union[Sequence[Number], Iterable[Number], str]  # A list, array, iterator or data file (see aggregates.py)
+_KINDS = {Number: "number", Numbers: "numbers"}
+_KIND_NAMES = {"number": "number", "numbers": "list of numbers"}
+
+
+class ToolSpec:
+    """
+    What a plan can be checked against without calling the tool: its parameter
+    kinds ("number", "numbers" or "any") and how many are required, the kind it
+    returns, whether it is pure (same arguments, same result, no side effects),
+    its cost class and how many results to memoize (0 = none).
+    """
+    __slots__ = ("name", "fn", "method", "kinds", "required", "returns", "pure", "cost", "memoize")
+
+    def __init__(self, name: str, fn: Callable, pure: bool, cost: str, memoize: int):
+        params = list(inspect.signature(fn).parameters.values())
+        self.method = bool(params) and params[0].name == "self"  # Bound to the toolbox instance at lookup
+        if self.method:
+            params = params[1:]
+        self.name = name
+        self.fn = fn
+        self.kinds = [_KINDS.get(p.annotation, "any") for p in params]
+        self.required = sum(p.default is inspect.Parameter.empty for p in params)
+        self.returns = _KINDS.get(inspect.signature(fn).return_annotation, "any")
+        self.pure = pure
+        self.cost = cost
+        self.memoize = memoize
+
+    def bind(self, owner: Any = None) -> Callable:
+        fn = getattr(owner, self.fn.__name__) if self.method else self.fn
+        return _memoized(fn, self.memoize) if self.memoize else fn
+
+
+def _memoized(fn: Callable, size: int) -> Callable:
+    # typed=True so that 2 and 2.0 (equal, same hash) don't share a result
+    cached = functools.lru_cache(maxsize=size, typed=True)(fn)
+
+    @functools.wraps(fn)
+    def call(*args):
+        try:
+            return cached(*args)
+        except TypeError:
+            try:
+                hash(args)
+            except TypeError:  # Lists and arrays aren't hashable; compute them every time
+                return fn(*args)
+            raise
+    call.cache_info = cached.cache_info
+    return call
+
+
+class ToolRegistry:
+    """
+    Tools declared with the @tool decorator. A module can also be registered
+    lazily by the names of the tools it defines: it is only imported, running its
+    decorators, the first time one of those tools is looked up.
+    """
+    def __init__(self):
+        self.specs: Dict[str, ToolSpec] = {}
+        self._lazy: Dict[str, str] = {}  # Tool name -> module that registers it
+
+    def tool(self, name: Optional[str] = None, pure: bool = True, cost: str = "scalar", memoize: int = 0):
+        """
+        Registers the decorated function (or toolbox method) as a tool. Parameter
+        and return kinds come from its Number / Numbers annotations. memoize > 0
+        keeps that many results per tool; only pure tools may use it.
+        """
+        if memoize and not pure:
+            raise ValueError("Only pure tools can be memoized")
+
+        def register(fn: Callable) -> Callable:
+            spec = ToolSpec(name or fn.__name__, fn, pure, cost, memoize)
+            self.specs[spec.name] = spec
+            return fn
+        return register
+
+    def lazy(self, module: str, *names: str):
+        for name in names:
+            self._lazy[name] = module
+
+    def get(self, name: str) -> Optional[ToolSpec]:
+        spec = self.specs.get(name)
+        if spec is None and name in self._lazy:
+            importlib.import_module(self._lazy[name])
+            spec = self.specs.get(name)
+        return spec
+
+    def names(self) -> List[str]:
+        """Every tool, including those whose modules haven't been imported yet."""
+        return sorted(self.specs.keys() | self._lazy.keys())
+
+    def check_plan(self, plan: List[Dict[str, Any]], steps: Optional[Iterable[int]] = None) -> List[str]:
+        """
+        Checks every step (or only `steps`) of a well-formed plan (see
+        plandag.validate_plan) against the tools' signatures: the tool exists, gets
+        a valid number of arguments, and each argument (or the step it refers to)
+        is of the kind the tool takes. Returns the problems found, empty if none.
+        """
+        problems = []
+        for i in range(len(plan)) if steps is None else steps:
+            tool, args = plan[i]["tool"], plan[i]["args"]
+            spec = self.get(tool) if isinstance(tool, str) else None
+            if spec is None:
+                problems.append(f"Step {i}: unknown tool {tool!r}")
+                continue
+            if not spec.required <= len(args) <= len(spec.kinds):
+                expected = spec.required if spec.required == len(spec.kinds) else f"{spec.required} to {len(spec.kinds)}"
+                problems.append(f"Step {i}: {tool} takes {expected} arguments, got {len(args)}")
+                continue
+            for position, (arg, kind) in enumerate(zip(args, spec.kinds)):
+                if kind != "any" and not self._accepts(kind, arg, plan):
+                    problems.append(f"Step {i}: {tool} argument {position + 1} must be a {_KIND_NAMES[kind]}, got {arg!r}")
+        return problems
+
+    def _kind(self, arg: Any, plan: List[Dict[str, Any]]) -> Optional[str]:
+        """The kind of a plan argument, "any" when it can't be told before running, None if it is neither."""
+        if isinstance(arg, bool) or arg is None:
+            return None
+        if isinstance(arg, (int, float)) or (isinstance(arg, str) and SLOT_PATTERN.match(arg)):
+            return "number"
+        if isinstance(arg, str):
+            match = STEP_REF_PATTERN.match(arg)
+            if match is None:
+                return "path" if _is_data_file(arg) else None
+            tool = plan[int(match.group(1))]["tool"]
+            spec = self.get(tool) if isinstance(tool, str) else None
+            return spec.returns if spec is not None else "any"
+        if isinstance(arg, list):
+            return "numbers" if all(self._kind(a, plan) in ("number", "any") for a in arg) else None
+        return None
+
+    def _accepts(self, kind: str, arg: Any, plan: List[Dict[str, Any]]) -> bool:
+        actual = self._kind(arg, plan)
+        if kind == "numbers":
+            return actual in ("numbers", "path", "any")
+        return actual in (kind, "any")
+
+
+def _is_data_file(name: str) -> bool:
+    """Whether a string in a plan names a file the aggregates may read; other strings are never opened."""
+    import aggregates  # Only plans naming files need it (and NumPy)
+    if aggregates.DATA_DIR is None:
+        return False
+    try:
+        aggregates.data_file(name)
+    except ValueError:
+        return False
+    return True
+
+
+# The registry MathToolbox's tools (and lazily imported tool modules) register with
+TOOLS = ToolRegistry()
+tool = TOOLS.tool
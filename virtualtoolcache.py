@@ -1,29 +1,743 @@
+import heapq
 import json
-from typing import List, Dict, Any, Tuple
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import List, Dict, Any, Tuple, Optional, Callable, Set
+from similarity import NGramIndex, normalize, same_wording
+
+# Numeric literals in a problem statement. Braces are excluded on both sides so
+# the "{0}" slots of an already-templated problem are never re-extracted.
+NUMBER_PATTERN = re.compile(r"(?<![\w.{])-?\d+(?:\.\d+)?(?![\w}])")
+SLOT_PATTERN = re.compile(r"^\$(\d+)$")
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _parse_number(literal: str):
+    return float(literal) if "." in literal else int(literal)
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def templatize(problem: str) -> Tuple[str, List[Any]]:
+    """Replaces numeric literals with {0}, {1}, ... and returns the template and the values."""
+    values: List[Any] = []
+
+    def _slot(match):
+        values.append(_parse_number(match.group(0)))
+        return "{" + str(len(values) - 1) + "}"
+
+    return NUMBER_PATTERN.sub(_slot, problem), values
+
+
+def _generalize_arg(arg: Any, values: List[Any]):
+    if isinstance(arg, list):
+        return [_generalize_arg(a, values) for a in arg]
+    if _is_number(arg):
+        if arg not in values:
+            # A constant that does not come from the problem text: the plan
+            # cannot be trusted for other inputs (e.g. PRODUCT(3, 3) for "sqrt of 9").
+            raise ValueError(f"Constant {arg} not found in problem")
+        return f"${values.index(arg)}"
+    return arg
+
+
+def generalize(plan: List[Dict[str, Any]], values: List[Any]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Rewrites plan arguments as "$i" references into the problem's numeric slots.
+    Returns None when the plan can't be safely parameterized, in which case it
+    should only be cached for the exact problem string.
+    """
+    if not values or len(set(values)) != len(values):
+        return None
+    try:
+        template_plan = [{**step, "args": _generalize_arg(step.get("args", []), values)} for step in plan]
+    except (ValueError, TypeError, AttributeError):
+        return None
+    # Each value appears once in the problem, so a slot used twice is (partly) a
+    # constant: POWER(3, 3) for "3 cubed" must not become POWER($0, $0)
+    if any(count > 1 for count in Counter(_slots(template_plan)).values()):
+        return None
+    return template_plan
+
+
+def confirms_template(first_problem: str, first_plan: List[Dict[str, Any]], values: List[Any],
+                      template_plan: List[Dict[str, Any]]) -> bool:
+    """
+    Whether an earlier problem with the same template, whose numbers all differ
+    from `values`, generalizes to the same template plan. One instance can't tell
+    a constant from a problem number that happens to equal it: for "the square of
+    5 rounded to 2 places", POWER(5, 2) would become POWER($0, $1).
+    """
+    _, first_values = templatize(first_problem)
+    return len(first_values) == len(values) and all(a != b for a, b in zip(first_values, values)) \
+        and generalize(first_plan, first_values) == template_plan
+
+
+def _slots(plan: List[Dict[str, Any]]) -> List[str]:
+    found = []
+
+    def _collect(arg):
+        if isinstance(arg, list):
+            for a in arg:
+                _collect(a)
+        elif isinstance(arg, str) and SLOT_PATTERN.match(arg):
+            found.append(arg)
+    for step in plan:
+        _collect(step.get("args", []))
+    return found
+
+
+def _instantiate_arg(arg: Any, values: List[Any]):
+    if isinstance(arg, list):
+        return [_instantiate_arg(a, values) for a in arg]
+    if isinstance(arg, str):
+        match = SLOT_PATTERN.match(arg)
+        if match and int(match.group(1)) < len(values):
+            return values[int(match.group(1))]
+    return arg
+
+
+def instantiate(template_plan: List[Dict[str, Any]], values: List[Any]) -> List[Dict[str, Any]]:
+    """Fills "$i" references in a templated plan with the problem's values."""
+    return [{**step, "args": _instantiate_arg(step["args"], values)} for step in template_plan]
+
+
+def _max_slot(plan: List[Dict[str, Any]]) -> int:
+    def _check(arg):
+        if isinstance(arg, list):
+            return max((_check(a) for a in arg), default=-1)
+        match = isinstance(arg, str) and SLOT_PATTERN.match(arg)
+        return int(match.group(1)) if match else -1
+    return max((_check(step.get("args", [])) for step in plan), default=-1)
+
+
+def _covered_by(problem: str, plan: List[Dict[str, Any]], key: str) -> bool:
+    """Whether loading (problem, plan) would recreate the cache entry `key`."""
+    if problem == key:
+        return True
+    template, values = templatize(problem)
+    return template == key and generalize(plan, values) is not None
+
+
+def _drop_covered(tools: Dict[str, List[Dict[str, Any]]], key: str):
+    """Applies an invalidation record for `key` to snapshot entries read from disk."""
+    for stale in [p for p, plan in tools.items() if _covered_by(p, plan, key)]:
+        del tools[stale]
+
+
+def _has_slots(plan: List[Dict[str, Any]]) -> bool:
+    def _check(arg):
+        if isinstance(arg, list):
+            return any(_check(a) for a in arg)
+        return isinstance(arg, str) and bool(SLOT_PATTERN.match(arg))
+    return any(_check(step.get("args", [])) for step in plan)
+
+
+class EntryStats:
+    __slots__ = ("hits", "last_used", "size", "seq", "validated", "failed")
+
+    def __init__(self, size: int, seq: int):
+        self.hits = 0
+        self.last_used = time.time()
+        self.size = size  # Serialized size of the key and plan in bytes
+        self.seq = seq  # Insertion order, breaks ties between entries loaded at the same time
+        self.validated = 1  # Learning the entry validated it once
+        self.failed = 0
+
+
+class SnapshotIndex:
+    """
+    Where each entry's plan sits in a snapshot, written beside it (cache_file +
+    ".idx") with every snapshot: a header line with the snapshot's size and
+    mtime, then one "<JSON key>\t<offset>\t<length>" line per entry, sorted by
+    key. get() bisects the lines and parses only the plan it needs, so a large
+    cache can answer its first lookups without parsing the whole snapshot. No file
+    handle is kept open, so other processes can still replace both files.
+    """
+    def __init__(self, snapshot_file: str, data: bytes):
+        self.snapshot_file = snapshot_file
+        self._data = data
+        self._start = data.index(b"\n") + 1
+        header = json.loads(data[:self._start])
+        self._stamp = (header["size"], header["mtime_ns"])
+        self.entries = header["entries"]
+
+    @staticmethod
+    def _stamp_of(path: str) -> Tuple[int, int]:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+
+    @classmethod
+    def write(cls, index_file: str, snapshot_file: str, positions: List[Tuple[str, int, int]],
+              stamp: Optional[Tuple[int, int]] = None):
+        """Indexes (key, offset, length) positions of a just-written snapshot (or the one stamped `stamp`)."""
+        size, mtime_ns = stamp or cls._stamp_of(snapshot_file)
+        lines = sorted(b"%s\t%d\t%d\n" % (json.dumps(key).encode(), offset, length) for key, offset, length in positions)
+        tmp_file = f"{index_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(json.dumps({"size": size, "mtime_ns": mtime_ns, "entries": len(lines)}).encode() + b"\n")
+            f.writelines(lines)
+        os.replace(tmp_file, index_file)
+
+    @classmethod
+    def build(cls, index_file: str, snapshot_file: str) -> bool:
+        """
+        Indexes an existing snapshot without rewriting it. Returns False if it
+        isn't in save_cache's one-entry-per-line layout (e.g. a legacy file) or
+        was replaced while it was read.
+        """
+        stamp = cls._stamp_of(snapshot_file)
+        with open(snapshot_file, "rb") as f:
+            lines = f.read().split(b"\n")
+        if lines[0] != b"{" or lines[-2:] != [b"}", b""]:
+            return False
+        decoder = json.JSONDecoder()
+        positions, offset = [], len(lines[0]) + 1
+        for line in lines[1:-2]:
+            try:
+                key, end = decoder.raw_decode(line.decode("ascii"), 4)  # json.dumps escapes everything else
+            except (UnicodeDecodeError, ValueError):
+                return False
+            if not line.startswith(b"    ") or line[end:end + 2] != b": ":
+                return False
+            length = len(line) - end - 2 - line.endswith(b",")
+            positions.append((key, offset + end + 2, length))
+            offset += len(line) + 1
+        if cls._stamp_of(snapshot_file) != stamp:
+            return False
+        cls.write(index_file, snapshot_file, positions, stamp)
+        return True
+
+    @classmethod
+    def open(cls, index_file: str, snapshot_file: str) -> Optional["SnapshotIndex"]:
+        """The index, or None if it is missing or doesn't match the snapshot."""
+        try:
+            with open(index_file, "rb") as f:
+                index = cls(snapshot_file, f.read())
+            return index if index._stamp == cls._stamp_of(snapshot_file) else None
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _locate(self, key: str) -> Optional[Tuple[int, int]]:
+        target = json.dumps(key).encode()
+        data, lo, hi = self._data, self._start, len(self._data)
+        # lo and hi always sit at line starts; each step drops at least the middle line
+        while lo < hi:
+            mid = (lo + hi) // 2
+            line_start = data.rfind(b"\n", lo, mid) + 1 or lo
+            line_end = data.index(b"\n", mid)
+            line_key, offset, length = data[line_start:line_end].split(b"\t")
+            if line_key == target:
+                return int(offset), int(length)
+            if line_key < target:
+                lo = line_end + 1
+            else:
+                hi = line_start
+        return None
+
+    def _check_current(self):
+        if self._stamp_of(self.snapshot_file) != self._stamp:
+            raise ValueError("The snapshot was replaced after its index was read")
+
+    def __contains__(self, key: str) -> bool:
+        self._check_current()
+        return self._locate(key) is not None
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """The key's plan, or None. Raises ValueError once the snapshot has been replaced."""
+        self._check_current()
+        position = self._locate(key)
+        if position is None:
+            return None
+        offset, length = position
+        prefix = json.dumps(key).encode() + b": "
+        with open(self.snapshot_file, "rb") as f:
+            f.seek(offset - len(prefix))
+            data = f.read(len(prefix) + length)
+        if not data.startswith(prefix):
+            raise ValueError("The snapshot doesn't match its index")
+        return json.loads(data[len(prefix):])
+
 
 class VirtualToolCache:
-    def __init__(self, cache_file: str = "virtual_tools.json"):
+    """
+    Plans are persisted as a JSON snapshot (cache_file) plus an append-only log
+    (cache_file + ".log") with one JSON record per insert. Inserts only append to
+    the log; once the log grows past the snapshot size it is folded back into the
+    snapshot by a background compaction. A lock file serializes writers so several
+    worker processes can share the same cache files.
+
+    Problems that miss both exact and template lookup are matched against the
+    cached templates by n-gram similarity (see similarity.py), so paraphrases like
+    "Find the sum of 10 and 20." and "what is the sum of 10 and 20" share a plan.
+    similarity_threshold=None turns that off.
+
+    Memory is bounded by max_entries and max_bytes (None for no limit). Past
+    either budget the least recently used ("lru") or least frequently used
+    ("lfu") tenth of the entries is evicted, from memory and, at the next
+    compaction, from disk. An entry whose replays fail validation more often than
+    they pass is invalidated; the invalidation is logged so other processes and
+    restarts drop it too. on_evict(key) is called for evicted and invalidated entries.
+
+    With lazy_load, opening the cache only reads the snapshot's SnapshotIndex
+    and the log: exact and template hits are read from the snapshot one entry at
+    a time. The first miss (paraphrase matching needs every template), insert or
+    invalidation loads everything, as does a missing, stale or replaced index;
+    until then stats() and entry_stats only cover the entries looked up.
+    """
+    def __init__(self, cache_file: str = "virtual_tools.json", compact_min_records: int = 1000, fsync: bool = False,
+                 similarity_threshold: Optional[float] = 0.6, max_entries: Optional[int] = 100_000,
+                 max_bytes: Optional[int] = None, eviction: str = "lru",
+                 on_evict: Optional[Callable[[str], None]] = None, lazy_load: bool = False):
+        if eviction not in ("lru", "lfu"):
+            raise ValueError(f"Unknown eviction policy '{eviction}'")
         self.cache_file = cache_file
-        self.tools: Dict[str, List[Dict[str, Any]]] = self.load_cache()
-    
-    def load_cache(self) -> Dict[str, List[Dict[str, Any]]]:
+        self.log_file = cache_file + ".log"
+        self.lock_file = cache_file + ".lock"
+        self.index_file = cache_file + ".idx"
+        self.compact_min_records = compact_min_records
+        self.fsync = fsync  # fsync each record for durability across power loss, not just process crashes
+        self.tools: Dict[str, List[Dict[str, Any]]] = {}  # exact problem -> plan
+        self.templates: Dict[str, List[Dict[str, Any]]] = {}  # templated problem -> plan with "$i" args
+        self.similarity_threshold = similarity_threshold
+        self._template_index = NGramIndex()
+        # Exact entries hold constants only valid for their own problem, so they only match modulo case and spacing
+        self._normalized_tools: Dict[str, str] = {}
+        # Template -> the last exact problem whose plan generalized to it, waiting for a second instance
+        self._candidates: Dict[str, str] = {}
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        self.on_evict = on_evict
+        self.entry_stats: Dict[str, EntryStats] = {}  # cache key -> usage
+        self._bytes = 0
+        self._seq = 0
+        self._evicted: Set[str] = set()  # Keys evicted since the last compaction, which must not re-add them
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.RLock()
+        self._log_handle = None
+        self._lock_handle = None
+        self._log_records = 0
+        self._compaction: Optional[threading.Thread] = None
+        self._index: Optional[SnapshotIndex] = None  # Set while entries are read from the snapshot on demand
+        self._indexing: Optional[threading.Thread] = None
+        if not lazy_load or not self._open_index():
+            self._load()
+            if lazy_load and os.path.exists(self.cache_file):
+                # A snapshot without a current index: index it for the next start. Only the
+                # index is written, so opening the cache never rewrites the snapshot itself.
+                self._indexing = threading.Thread(target=self._build_index, daemon=True)
+                self._indexing.start()
+
+    def _build_index(self):
+        # No locks: if another process replaces the snapshot meanwhile, the stamp check
+        # in build() (or else in SnapshotIndex.open) discards this index
+        try:
+            SnapshotIndex.build(self.index_file, self.cache_file)
+        except OSError:
+            pass
+
+    def _load(self):
+        for problem, plan in self.load_cache().items():
+            if not self.exists(problem):  # Entries already read through the index stay as they are
+                self._insert(problem, plan)
+        # Legacy entries may precede the entry their template was learned from (entries
+        # already looked up keep their key, which callers may still hold)
+        for problem, plan in list(self.tools.items()):
+            if not self.entry_stats[problem].hits:
+                self._remove(problem)
+                self._insert(problem, plan)
+
+    def _open_index(self) -> bool:
+        """Opens the cache from the snapshot's index plus the log; False if it has to be loaded in full."""
+        with self._lock, self._file_lock(exclusive=False):
+            index = SnapshotIndex.open(self.index_file, self.cache_file)
+            records = self._read_log() if index is not None else []
+        if index is None or any(plan is None for _, plan in records):
+            return False  # Invalidations may remove snapshot entries, which the index can't tell
+        self._index = index
+        for problem, plan in records:
+            if not self.exists(problem):  # As in load_cache, the snapshot's entry wins
+                self._insert(problem, plan)
+        self._log_records = len(records)
+        return True
+
+    def _load_all(self):
+        """Leaves lazy mode: loads every entry, keeping the ones already read through the index."""
+        with self._lock:
+            if self._index is not None:
+                self._index = None  # Lookups racing the load wait for it in _similar, which takes the lock
+                self._load()
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        # Callers hold self._lock, so threads never share the handle while it is locked
+        if self._lock_handle is None:
+            self._lock_handle = open(self.lock_file, "a+")
+        if fcntl is not None:
+            fcntl.flock(self._lock_handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_handle, fcntl.LOCK_UN)
+            return
+        # msvcrt has no shared locks, so readers take the first byte exclusively too
+        fd = self._lock_handle.fileno()
+        self._lock_handle.seek(0)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                break
+            except OSError:  # LK_LOCK gives up after about 10 s; keep waiting like flock does
+                continue
+        try:
+            yield
+        finally:
+            self._lock_handle.seek(0)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+    def _read_snapshot(self) -> Dict[str, List[Dict[str, Any]]]:
         try:
             with open(self.cache_file, "r") as f:
                 return json.load(f)
         except (FileNotFoundError, json.JSONDecodeError):
             return {}
-    
+
+    def _read_log(self) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        records = []
+        try:
+            with open(self.log_file, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        records.append((record["problem"], record["plan"]))  # A null plan invalidates
+                    except (json.JSONDecodeError, KeyError, TypeError):
+                        continue  # Torn write from a crashed process
+        except FileNotFoundError:
+            pass
+        return records
+
+    def load_cache(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Reads the snapshot and replays the log on top of it."""
+        with self._lock, self._file_lock(exclusive=False):
+            tools = self._read_snapshot()
+            records = self._read_log()
+        for problem, plan in records:
+            if plan is None:
+                _drop_covered(tools, problem)
+            else:
+                tools.setdefault(problem, plan)
+        self._log_records = len(records)
+        return tools
+
     def save_cache(self):
-        with open(self.cache_file, "w") as f:
-            json.dump(self.tools, f, indent=4)
-    
-    def get_virtual_tool(self, problem: str) -> List[Dict[str, Any]]:
-        return self.tools.get(problem, [])
-    
-    def add_virtual_tool(self, problem: str, tool_sequence: List[Dict[str, Any]]):
+        """
+        Writes a full snapshot atomically, so readers never see a truncated file,
+        one entry per line, then its SnapshotIndex.
+        """
+        self._load_all()
+        tmp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+        positions = []
+        with open(tmp_file, "wb") as f:
+            f.write(b"{")
+            for i, (key, plan) in enumerate({**self.templates, **self.tools}.items()):
+                f.write(b"%s\n    %s: " % (b"," if i else b"", json.dumps(key).encode()))
+                line = json.dumps(plan).encode()
+                positions.append((key, f.tell(), len(line)))
+                f.write(line)
+            f.write(b"\n}\n")
+        os.replace(tmp_file, self.cache_file)
+        SnapshotIndex.write(self.index_file, self.cache_file, positions)
+
+    def _append(self, problem: str, tool_sequence: Optional[List[Dict[str, Any]]]):
+        line = json.dumps({"problem": problem, "plan": tool_sequence}) + "\n"
+        with self._file_lock(exclusive=True):
+            if self._log_handle is None:
+                self._log_handle = open(self.log_file, "a")
+            self._log_handle.write(line)
+            self._log_handle.flush()
+            if self.fsync:
+                os.fsync(self._log_handle.fileno())
+        self._log_records += 1
+
+    def compact(self):
+        """
+        Folds the log (including records from other processes) into the snapshot
+        and truncates it. The snapshot is re-read first: another process may have
+        compacted entries this one never saw into it since it was loaded.
+        """
+        self._load_all()  # Before the exclusive lock, which reading would downgrade
+        with self._lock, self._file_lock(exclusive=True):
+            snapshot = self._read_snapshot()
+            records = self._read_log()
+            for problem, plan in records:
+                if plan is None:
+                    _drop_covered(snapshot, problem)
+            for problem, plan in snapshot.items():
+                if not self.exists(problem) and problem not in self._evicted \
+                        and templatize(problem)[0] not in self._evicted:
+                    self._insert(problem, plan)
+            for problem, plan in records:
+                if plan is None:
+                    self._remove(problem)  # Invalidated, possibly by another process
+                elif not self.exists(problem) and problem not in self._evicted \
+                        and templatize(problem)[0] not in self._evicted:
+                    self._insert(problem, plan)
+            self._evicted.clear()  # The snapshot no longer holds them
+            self.save_cache()
+            if self._log_handle is not None:
+                self._log_handle.close()
+                self._log_handle = None
+            open(self.log_file, "w").close()
+            self._log_records = 0
+
+    def _maybe_compact(self):
+        # Compacting once the log outgrows the snapshot keeps inserts amortized O(1)
+        threshold = max(self.compact_min_records, len(self.tools) + len(self.templates))
+        if self._log_records < threshold or (self._compaction and self._compaction.is_alive()):
+            return
+        self._compaction = threading.Thread(target=self.compact, daemon=True)
+        self._compaction.start()
+
+    def close(self):
+        """Waits for a running compaction (or indexing) and releases the log handle."""
+        for thread in (self._compaction, self._indexing):
+            if thread is not None:
+                thread.join()
+        with self._lock:
+            for handle in (self._log_handle, self._lock_handle):
+                if handle is not None:
+                    handle.close()
+            self._log_handle = None
+            self._lock_handle = None
+
+    def _insert(self, problem: str, tool_sequence: List[Dict[str, Any]]):
+        # Entries loaded from disk may already be templates
+        if _has_slots(tool_sequence):
+            self._insert_template(problem, tool_sequence)
+            return
+        template, values = templatize(problem)
+        template_plan = generalize(tool_sequence, values)
+        if template_plan is not None:
+            if template not in self.templates:
+                first = self._candidates.get(template)
+                if first in self.tools and confirms_template(first, self.tools[first], values, template_plan):
+                    self._remove(first)  # Covered by the template from now on
+                else:
+                    template_plan = None  # Cached exactly until another instance confirms it
+                    self._candidates[template] = problem
+            if template_plan is not None and self._insert_template(template, template_plan) == template_plan:
+                return
+        if template in self.templates and instantiate(self.templates[template], values) == tool_sequence:
+            return  # Already covered by the template, e.g. "2 to the power of 2"
         if problem not in self.tools:
             self.tools[problem] = tool_sequence
-            self.save_cache()
-    
+            self._normalized_tools.setdefault(normalize(problem), problem)
+            self._track(problem, tool_sequence)
+
+    def _insert_template(self, template: str, template_plan: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if template not in self.templates:
+            self.templates[template] = template_plan
+            if self.similarity_threshold is not None:
+                self._template_index.add(template, template)
+            self._track(template, template_plan)
+            return template_plan
+        return self.templates[template]
+
+    def _track(self, key: str, plan: List[Dict[str, Any]]):
+        size = len(key) + len(json.dumps(plan))
+        self._seq += 1
+        self.entry_stats[key] = EntryStats(size, self._seq)
+        self._bytes += size
+        self._evict()
+
+    def _over_budget(self) -> bool:
+        return (self.max_entries is not None and len(self.entry_stats) > self.max_entries) or \
+               (self.max_bytes is not None and self._bytes > self.max_bytes)
+
+    def _evict(self):
+        """Evicts in batches of a tenth of the cache, so the selection cost is amortized over many inserts."""
+        while self._over_budget():
+            if self.eviction == "lfu":
+                rank = lambda key: (self.entry_stats[key].hits, self.entry_stats[key].last_used, self.entry_stats[key].seq)
+            else:
+                rank = lambda key: (self.entry_stats[key].last_used, self.entry_stats[key].seq)
+            for key in heapq.nsmallest(max(1, len(self.entry_stats) // 10), self.entry_stats, key=rank):
+                self._remove(key)
+                self._evicted.add(key)
+                self.evictions += 1
+                if self.on_evict is not None:
+                    self.on_evict(key)
+
+    def _remove(self, key: str) -> bool:
+        """Drops an entry from memory; returns False if it wasn't cached."""
+        if key in self.tools:
+            del self.tools[key]
+            normalized = normalize(key)
+            if self._normalized_tools.get(normalized) == key:
+                del self._normalized_tools[normalized]
+            template, _ = templatize(key)
+            if self._candidates.get(template) == key:
+                del self._candidates[template]
+        elif key in self.templates:
+            del self.templates[key]
+            self._template_index.remove(key)
+        else:
+            return False
+        self._bytes -= self.entry_stats.pop(key).size
+        return True
+
+    def _touch(self, key: str):
+        stats = self.entry_stats.get(key)
+        if stats is not None:
+            stats.hits += 1
+            stats.last_used = time.time()
+
+    def invalidate(self, key: str) -> bool:
+        """Drops a cache key (as returned by lookup) for good, e.g. because its plan turned out to be wrong."""
+        self._load_all()  # Otherwise the snapshot's copy could be read back through the index
+        with self._lock:
+            if not self._remove(key):
+                return False
+            self.invalidations += 1
+            self._append(key, None)
+        if self.on_evict is not None:
+            self.on_evict(key)
+        self._maybe_compact()
+        return True
+
+    def record_validation(self, key: str, valid: bool) -> bool:
+        """
+        Records whether a replay of the entry validated. Returns True when the
+        entry has now failed more often than it passed and was invalidated.
+        """
+        with self._lock:
+            stats = self.entry_stats.get(key)
+            if stats is None:
+                return False
+            if valid:
+                stats.validated += 1
+                return False
+            stats.failed += 1
+            if stats.failed <= stats.validated:
+                return False
+        return self.invalidate(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache-wide metrics."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entry_stats),
+            "templates": len(self.templates),
+            "exact": len(self.tools),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def lookup(self, problem: str) -> Optional[Tuple[str, List[Dict[str, Any]], List[Any]]]:
+        """Returns (cache key, stored plan, slot values) without filling in the template."""
+        entry = self._find(problem)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._touch(entry[0])
+        return entry
+
+    def _find(self, problem: str) -> Optional[Tuple[str, List[Dict[str, Any]], List[Any]]]:
+        plan = self.tools.get(problem)  # get(), not "in": an eviction may run in between
+        if plan is not None:
+            return problem, plan, []
+        template, values = templatize(problem)
+        plan = self.templates.get(template) if values else None
+        if plan is not None:
+            return template, plan, values
+        if self._index is not None:
+            return self._find_indexed(problem, template, values)
+        if self.similarity_threshold is None:
+            return None
+        return self._similar(problem, template, values)
+
+    def _find_indexed(self, problem: str, template: str, values: List[Any]):
+        """Lazy mode: reads the problem's entry from the snapshot; anything else loads the whole cache first."""
+        with self._lock:
+            index = self._index
+            if index is not None:
+                try:
+                    plan = index.get(problem)
+                    if plan is not None:
+                        self.tools[problem] = plan
+                        self._normalized_tools.setdefault(normalize(problem), problem)
+                        self._track(problem, plan)
+                        return problem, plan, []
+                    plan = index.get(template) if values else None
+                    if plan is not None:
+                        return template, self._insert_template(template, plan), values
+                except ValueError:  # Replaced by another process's compaction
+                    pass
+                self._load_all()
+            return self._find(problem)
+
+    def _similar(self, problem: str, template: str, values: List[Any]) -> Optional[Tuple[str, List[Dict[str, Any]], List[Any]]]:
+        """Nearest cached entry for a paraphrased problem, re-verified before it is trusted."""
+        with self._lock:
+            key = self._normalized_tools.get(normalize(problem))
+            if key is not None:
+                return key, self.tools[key], []
+            if not values:
+                return None
+            for _, candidate, key in self._template_index.query(template, self.similarity_threshold):
+                # Same operation words and slot order, and the plan only uses slots this problem has
+                if same_wording(candidate, template) and _max_slot(self.templates[key]) < len(values):
+                    return key, self.templates[key], values
+        return None
+
+    def get_virtual_tool(self, problem: str) -> List[Dict[str, Any]]:
+        entry = self.lookup(problem)
+        if entry is None:
+            return []
+        _, plan, values = entry
+        return instantiate(plan, values) if values else plan
+
+    def add_virtual_tool(self, problem: str, tool_sequence: List[Dict[str, Any]]):
+        self._load_all()
+        with self._lock:
+            if self.exists(problem):
+                return
+            self._insert(problem, tool_sequence)
+            self._append(problem, tool_sequence)
+        self._maybe_compact()
+
     def exists(self, problem: str) -> bool:
-        return problem in self.tools
+        if problem in self.tools:
+            return True
+        template, values = templatize(problem)
+        if values and template in self.templates:
+            return True
+        index = self._index
+        if index is None:
+            return False
+        try:
+            return problem in index or (bool(values) and template in index)
+        except ValueError:
+            self._load_all()
+            return self.exists(problem)